@@ -0,0 +1,61 @@
+# Compares JSONCall.from_url against its previous json round trip, and
+# UrlRouter building typed calls.
+# Run with: python -m benchmarks.bench_from_url
+import json
+import timeit
+from urllib.parse import urlparse, parse_qs
+
+from jsonrpc import jsonrpc
+from jsonrpc.dispatcher import Dispatcher
+from jsonrpc.urls import UrlRouter
+
+NUMBER = 50000
+
+URLS = {
+    'query': 'http://localhost/api?method=subtract&id=7&jsonrpc=2.0',
+    'path': 'http://localhost/subtract?id=7',
+}
+
+
+def previous_from_url(url):
+    # JSONCall.from_url before building calls directly
+    url_parts = urlparse(url)
+    d = {
+        k:v[-1] for k,v in parse_qs(url_parts.query).items()
+    }
+    if 'method' not in d:
+        d['method'] = url_parts.path
+    return jsonrpc.JSONCall.from_request(json.dumps(d, ensure_ascii=False))
+
+
+def subtract(minuend: int, subtrahend: int = 0):
+    return minuend - subtrahend
+
+
+def router():
+    dispatcher = Dispatcher()
+    dispatcher.register(subtract)
+    return UrlRouter(dispatcher).add('/subtract').add('/users/{user_id}/subtract', 'subtract')
+
+
+def cases():
+    found = {}
+    for name, url in URLS.items():
+        found[f'{name}/previous'] = lambda url=url: previous_from_url(url)
+        found[f'{name}/from_url'] = lambda url=url: jsonrpc.JSONCall.from_url(url)
+    routes = router()
+    typed = 'http://localhost/subtract?minuend=42&subtrahend=23&id=7'
+    found['router/exact'] = lambda: routes.call_from_url(typed).kwargs
+    found['router/pattern'] = lambda: routes.call_from_url('http://localhost/users/5/subtract?minuend=42&id=7').kwargs
+    return found
+
+
+def main(number=NUMBER):
+    print(f"{'case':<20} {'ns per call':>12}")
+    for name, func in cases().items():
+        per_call = min(timeit.repeat(func, number=number, repeat=3)) / number
+        print(f"{name:<20} {per_call * 1e9:>12.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+# Micro-benchmarks of the parse, validate and serialize hot paths.
+#
+#   python -m benchmarks.bench_hotpaths --save baseline.json
+#   python -m benchmarks.bench_hotpaths --compare baseline.json
+#
+# Each case reports the best of several timeit repeats as time per operation.
+# With --compare, cases slower than the baseline by more than --threshold are
+# flagged and the exit status is 1.
+import argparse
+import json
+import platform
+import sys
+import timeit
+
+from jsonrpc import jsonrpc
+from jsonrpc import codec
+
+PAYLOAD_SIZES = {'small': 4, 'large': 1000}
+BATCH_SIZES = [1, 10, 100]
+
+
+def _params(shape, size):
+    if shape == 'list':
+        return [i * 1.5 for i in range(size)]
+    return {f"p{i}": f"value {i}" for i in range(size)}
+
+
+def _request(shape, size, _id=1):
+    return jsonrpc.JSONCall('method', params=_params(shape, size), _id=_id).request()
+
+
+def _answered(result=None, code=None):
+    call = jsonrpc.JSONCall('method', params=[1, 2], _id=1)
+    if code is None:
+        call.set_result(result)
+    else:
+        call.set_error(code, message=None if code < -32000 else "Custom error")
+    return call
+
+
+def cases():
+    # name: function taking no arguments
+    found = {}
+    for size_name, size in PAYLOAD_SIZES.items():
+        for shape in ['list', 'dict']:
+            request = _request(shape, size)
+            found[f'from_request/{shape}/{size_name}'] = (
+                lambda request=request: jsonrpc.JSONCall.from_request(request)
+            )
+            call = jsonrpc.JSONCall.from_request(request)
+            params = call._raw_params
+            found[f'clean_params/{shape}/{size_name}'] = (
+                lambda call=call, params=params: call._clean_params(params)
+            )
+        result = _params('dict', size)
+        call = _answered(result)
+        found[f'response/success/{size_name}'] = call.response
+        response = call.response()
+        client = jsonrpc.JSONCall('method', params=[1, 2], _id=1)
+        found[f'assign_response/success/{size_name}'] = (
+            lambda response=response: client.assign_response(response)
+        )
+    for code in [-32601, 1]:
+        call = _answered(code=code)
+        kind = 'builtin' if code < -32000 else 'custom'
+        found[f'response/error/{kind}'] = call.response
+        response = call.response()
+
+        def assign(response=response):
+            try:
+                client.assign_response(response)
+            except jsonrpc.JSONCallError:
+                pass
+        found[f'assign_response/error/{kind}'] = assign
+    error = jsonrpc.JSONCallError(-32700)
+    found['response/error/parse'] = error.response
+
+    def handler(call):
+        return call.args
+
+    for size in BATCH_SIZES:
+        request = b'[' + b', '.join(_request('list', 4, _id=i) for i in range(size)) + b']'
+        found[f'batch/{size}'] = (
+            lambda request=request: jsonrpc.JSONCall.from_request(request).dispatch(handler).response()
+        )
+    found['from_url/query'] = lambda: jsonrpc.JSONCall.from_url(
+        'http://localhost/api?method=subtract&id=7&jsonrpc=2.0'
+    )
+    found['from_url/path'] = lambda: jsonrpc.JSONCall.from_url('http://localhost/subtract?id=7')
+    return found
+
+
+def measure(func, repeat=5, min_time=0.2):
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    number = max(1, int(number * min_time / 0.2))
+    times = [t / number for t in timer.repeat(repeat=repeat, number=number)]
+    return {
+        'best': min(times),
+        'mean': sum(times) / len(times),
+        'number': number,
+        'repeat': repeat,
+    }
+
+
+def run(selected=None, repeat=5, min_time=0.2, out=sys.stdout):
+    results = {}
+    for name, func in cases().items():
+        if selected and not any(s in name for s in selected):
+            continue
+        results[name] = measure(func, repeat=repeat, min_time=min_time)
+        print(f"{name:<36} {results[name]['best'] * 1e6:>10.2f} us", file=out)
+    return {
+        'python': platform.python_version(),
+        'codec': repr(codec.get_codec()),
+        'results': results,
+    }
+
+
+def compare(current, baseline, threshold):
+    # returns the names of cases slower than the baseline by more than threshold
+    regressions = []
+    print(f"\n{'case':<36} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name, result in current['results'].items():
+        base = baseline['results'].get(name)
+        if base is None:
+            continue
+        change = result['best'] / base['best'] - 1
+        flag = ''
+        if change > threshold:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print(f"{name:<36} {base['best'] * 1e6:>10.2f} {result['best'] * 1e6:>10.2f} {change:>+8.1%}{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="micro-benchmarks of the parse, validate and serialize hot paths")
+    parser.add_argument('cases', nargs='*', help="only run cases whose name contains one of these")
+    parser.add_argument('--save', metavar='PATH', help="write results as json")
+    parser.add_argument('--compare', metavar='PATH', help="compare against saved results")
+    parser.add_argument('--threshold', type=float, default=0.1, help="allowed slowdown (default 0.1 = 10%%)")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--min-time', type=float, default=0.2, help="seconds per repeat")
+    args = parser.parse_args(argv)
+    current = run(args.cases, repeat=args.repeat, min_time=args.min_time)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(current, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(current, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,42 @@
+# Compares request-id generators against the previous uuid4 default.
+# Run with: python -m benchmarks.bench_ids
+import timeit
+import uuid
+
+from jsonrpc import ids
+from jsonrpc import jsonrpc
+
+NUMBER = 200000
+
+
+def uuid_replace():
+    # JSONCall's previous default id
+    return str(uuid.uuid4()).replace('-', '')
+
+
+GENERATORS = {
+    'uuid4 (previous default)': uuid_replace,
+    'uuid_ids': ids.uuid_ids(),
+    'counter_ids': ids.counter_ids(),
+    'prefixed_ids': ids.prefixed_ids(),
+    'random_ids': ids.random_ids(),
+}
+
+
+def main(number=NUMBER):
+    print(f"{'generator':<26} {'id (ns)':>10} {'JSONCall (ns)':>14}")
+    previous = ids.get_id_generator()
+    try:
+        for name, generator in GENERATORS.items():
+            per_id = min(timeit.repeat(generator, number=number, repeat=3)) / number
+            ids.set_id_generator(generator)
+            per_call = min(timeit.repeat(
+                lambda: jsonrpc.JSONCall('subtract', params=[42, 23]), number=number // 4, repeat=3
+            )) / (number // 4)
+            print(f"{name:<26} {per_id * 1e9:>10.0f} {per_call * 1e9:>14.0f}")
+    finally:
+        ids.set_id_generator(previous)
+
+
+if __name__ == '__main__':
+    main()
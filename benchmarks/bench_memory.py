@@ -0,0 +1,39 @@
+# Measures the memory held per JSONCall / JSONCallError instance.
+# Run with: python -m benchmarks.bench_memory
+import gc
+import tracemalloc
+
+from jsonrpc import jsonrpc
+
+NUMBER = 20000
+REQUEST = b'{"jsonrpc": "2.0", "method": "subtract", "params": [42, 23], "id": 1}'
+NAMED_REQUEST = b'{"jsonrpc": "2.0", "method": "subtract", "params": {"minuend": 42, "subtrahend": 23}, "id": 1}'
+
+
+def per_object(factory, number=NUMBER):
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    objects = [factory() for _ in range(number)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del objects
+    return (after - before) / number
+
+
+CASES = {
+    'JSONCall.from_request (list params)': lambda: jsonrpc.JSONCall.from_request(REQUEST),
+    'JSONCall.from_request (dict params)': lambda: jsonrpc.JSONCall.from_request(NAMED_REQUEST),
+    'JSONCall (client, id given)': lambda: jsonrpc.JSONCall('subtract', params=[42, 23], _id=1),
+    'JSONCallError': lambda: jsonrpc.JSONCallError(-32601, _id=1),
+}
+
+
+def main(number=NUMBER):
+    print(f"{'object':<38} {'bytes':>8}")
+    for name, factory in CASES.items():
+        print(f"{name:<38} {per_object(factory, number):>8.0f}")
+
+
+if __name__ == '__main__':
+    main()
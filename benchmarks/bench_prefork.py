@@ -0,0 +1,85 @@
+# Throughput of a PreforkServer over loopback by number of workers, with a
+# handler doing some pure-Python work per call. Load comes from as many
+# client processes, each keeping --concurrency calls in flight.
+# Run with: python -m benchmarks.bench_prefork --workers 1 2 4
+import argparse
+import asyncio
+import multiprocessing
+import os
+import time
+
+from jsonrpc import transport
+from jsonrpc.aio import AsyncDispatcher
+from jsonrpc.prefork import PreforkServer
+
+WORK = 2000
+
+
+def work(n):
+    total = 0
+    for i in range(n):
+        total += i * i
+    return total
+
+
+def factory():
+    dispatcher = AsyncDispatcher()
+    dispatcher.register(work)
+    return dispatcher
+
+
+async def _load(address, duration, concurrency):
+    done = 0
+    deadline = time.monotonic() + duration
+
+    async def worker(client):
+        nonlocal done
+        while time.monotonic() < deadline:
+            await client.call('work', params=[WORK])
+            done += 1
+    async with transport.Client(*address[:2], pool_size=4) as client:
+        await asyncio.gather(*[worker(client) for _ in range(concurrency)])
+    return done
+
+
+def _client(address, duration, concurrency, queue):
+    queue.put(asyncio.run(_load(address, duration, concurrency)))
+
+
+def run(workers, clients=None, duration=2.0, concurrency=32):
+    # calls per second
+    server = PreforkServer(factory, workers=workers).start()
+    try:
+        queue = multiprocessing.Queue()
+        processes = [
+            multiprocessing.Process(target=_client, args=(server.address, duration, concurrency, queue))
+            for _ in range(clients or workers)
+        ]
+        for process in processes:
+            process.start()
+        total = sum(queue.get() for _ in processes)
+        for process in processes:
+            process.join()
+    finally:
+        server.stop()
+    return total / duration
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="loopback throughput of PreforkServer by number of workers")
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--clients', type=int, help="client processes (default: as many as workers)")
+    parser.add_argument('--duration', type=float, default=2.0)
+    parser.add_argument('--concurrency', type=int, default=32, help="calls in flight per client process")
+    args = parser.parse_args(argv)
+    print(f"{os.cpu_count()} cpus")
+    print(f"{'workers':>8} {'calls/s':>10} {'speedup':>8}")
+    base = None
+    for workers in args.workers:
+        rate = run(workers, clients=args.clients, duration=args.duration, concurrency=args.concurrency)
+        base = base or rate
+        print(f"{workers:>8} {rate:>10.0f} {rate / base:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+# Round trips of the shared memory transport against Unix sockets, with
+# the server in another process: latency of one call at a time, then the
+# throughput of --concurrency calls kept in flight over one client.
+# Run with: python -m benchmarks.bench_shm --payload 64 4096
+import argparse
+import asyncio
+import multiprocessing
+import os
+import signal
+import tempfile
+import time
+
+from jsonrpc import shm
+from jsonrpc import transport
+from jsonrpc.aio import AsyncDispatcher
+
+TRANSPORTS = ('shm', 'unix')
+
+
+def _serve(name, queue):
+    async def main():
+        dispatcher = AsyncDispatcher()
+        dispatcher.register(lambda payload: payload, name='echo')
+        stop = asyncio.Event()
+        asyncio.get_event_loop().add_signal_handler(signal.SIGTERM, stop.set)
+        if name == 'shm':
+            server = await shm.Server(dispatcher).start()
+        else:
+            server = await transport.Server(dispatcher).start(path=os.path.join(tempfile.mkdtemp(), 'bench.sock'))
+        async with server:
+            queue.put(server.address)
+            await stop.wait()
+    asyncio.run(main())
+
+
+async def _measure(client, payload, duration, concurrency):
+    # (mean seconds per call one at a time, calls per second pipelined)
+    for _ in range(100):
+        await client.call('echo', [payload])
+    calls = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < duration / 2:
+        await client.call('echo', [payload])
+        calls += 1
+    latency = (time.perf_counter() - start) / calls
+    done = 0
+    deadline = time.perf_counter() + duration / 2
+
+    async def worker():
+        nonlocal done
+        while time.perf_counter() < deadline:
+            await client.call('echo', [payload])
+            done += 1
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    return latency, done / (time.perf_counter() - start)
+
+
+def run(name, payload_size=64, duration=2.0, concurrency=32):
+    # (mean seconds per call, calls per second) over transport name
+    if name not in TRANSPORTS:
+        raise ValueError(f"unknown transport {name}: expected one of {', '.join(TRANSPORTS)}")
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_serve, args=(name, queue), daemon=True)
+    process.start()
+    try:
+        address = queue.get(timeout=30)
+
+        async def main():
+            if name == 'shm':
+                client = shm.Client(address)
+            else:
+                client = transport.Client(path=address, pool_size=1)
+            async with client:
+                return await _measure(client, 'x' * payload_size, duration, concurrency)
+        return asyncio.run(main())
+    finally:
+        process.terminate()
+        process.join()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="shared memory transport against Unix sockets")
+    parser.add_argument('--payload', type=int, nargs='+', default=[64, 4096], help="sizes of echoed strings")
+    parser.add_argument('--duration', type=float, default=2.0, help="seconds per transport and payload")
+    parser.add_argument('--concurrency', type=int, default=32, help="calls in flight when pipelined")
+    args = parser.parse_args(argv)
+    print(f"{'transport':>10} {'payload':>8} {'latency us':>11} {'calls/s':>10}")
+    for size in args.payload:
+        for name in TRANSPORTS:
+            latency, rate = run(name, size, duration=args.duration, concurrency=args.concurrency)
+            print(f"{name:>10} {size:>8} {latency * 1e6:>11.1f} {rate:>10.0f}")
+
+
+if __name__ == '__main__':
+    main()
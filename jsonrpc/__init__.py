@@ -2,4 +2,4 @@ __version__ = '0.1.1'
 
 import sys
 
-assert sys.version_info >= (3, 6)
\ No newline at end of file
+assert sys.version_info >= (3, 7)
\ No newline at end of file
@@ -0,0 +1,312 @@
+import asyncio
+import heapq
+import logging
+import time
+
+from . import jsonrpc as _jsonrpc
+from .jsonrpc import DEADLINE_MEMBER, JSONCallError, _ENVELOPES
+from .codec import get_codec
+from .raw import RawMessage, scan_object
+
+logger = logging.getLogger(__name__)
+
+# server errors of shed requests
+OVERLOADED = -32001
+RATE_LIMITED = -32002
+DEADLINE_EXCEEDED = -32003
+_SHED_MESSAGES = {
+    OVERLOADED: "Server overloaded",
+    RATE_LIMITED: "Rate limit exceeded",
+    DEADLINE_EXCEEDED: "Deadline exceeded",
+}
+class TokenBucket:
+    # Allows rate calls per second on average and bursts of up to burst calls.
+
+    def __init__(self, rate, burst=None, clock=time.monotonic):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.burst = max(rate, 1) if burst is None else burst
+        self.clock = clock
+        self._tokens = self.burst
+        self._updated = clock()
+
+    def take(self):
+        now = self.clock()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+
+class _Entry:
+    __slots__ = ('method', 'key', 'rank', 'deadline', 'future')
+
+    def __init__(self, method, priority, notification, deadline, sequence, future):
+        self.method = method
+        # the greatest runs first and the least is shed first: by priority,
+        # calls before notifications, then oldest first
+        self.key = (priority, not notification, -sequence)
+        # the key negated, the least first in heaps
+        self.rank = (-priority, notification, sequence)
+        self.deadline = deadline
+        # set to None when admitted, or to the code of the error it is shed with
+        self.future = future
+
+
+class AdmissionController:
+    # Admits requests to an AsyncDispatcher. At most max_concurrency requests
+    # run at once, and no more than method_limits[method] of one method; the
+    # others wait in a queue of at most max_queue, where those of higher
+    # priorities[method] (0 by default) go first. When the queue is full the
+    # least important waiting request, a notification first, is shed with
+    # OVERLOADED. rate_limits map methods to a TokenBucket, or (rate, burst),
+    # past which requests are shed with RATE_LIMITED. Requests carrying a
+    # timeout member (see jsonrpc.with_timeout), or given default_timeout, whose
+    # deadline passes while they wait are shed with DEADLINE_EXCEEDED instead
+    # of being handled. Shed notifications get no response. Batches are
+    # admitted as one request, without method limits.
+    # Can be served by transport.Server in place of the dispatcher.
+
+    def __init__(
+        self, dispatcher, max_concurrency=100, max_queue=1000, method_limits=None, rate_limits=None,
+        priorities=None, default_timeout=None, clock=time.monotonic
+    ):
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+        self.dispatcher = dispatcher
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.method_limits = dict(method_limits or {})
+        self.priorities = dict(priorities or {})
+        self.default_timeout = default_timeout
+        self.clock = clock
+        self.buckets = {
+            method: limit if isinstance(limit, TokenBucket) else TokenBucket(*limit, clock=clock)
+            for method, limit in (rate_limits or {}).items()
+        }
+        self.running = 0
+        # method: requests running
+        self._running = {}
+        # The queue is kept in heaps of (rank or key, entry): the next to run
+        # first in _ready, the next to shed first in _least, and the first to
+        # expire in _deadlines. Entries which left the queue have their future
+        # done and are skipped when they come up, or dropped by _compact.
+        self._ready = []
+        self._least = []
+        self._deadlines = []
+        # method: heap of the entries waiting for a slot of method
+        self._blocked = {}
+        self._waiting = 0
+        # (time, handle, loop) of the timer expiring the earliest deadline
+        self._timer = None
+        self._sequence = 0
+        # code: shed counts
+        self.shed = dict.fromkeys(_SHED_MESSAGES, 0)
+        # (code, compact): error response up to the id, for _messages
+        self._prefixes = {}
+        self._messages = _jsonrpc._ERROR_MESSAGES
+
+    @property
+    def codec(self):
+        return self.dispatcher.codec
+
+    @property
+    def metrics(self):
+        return self.dispatcher.metrics
+
+    def __len__(self):
+        # requests waiting
+        return self._waiting
+
+    def _peek(self, request):
+        # (method, id, timeout) of a call, or (None, None, None) for batches
+        # and requests left to the dispatcher to reject. Only the top level
+        # members are scanned and only these three decoded.
+        codec = self.codec or get_codec()
+        try:
+            if getattr(codec, 'binary', False):
+                d = codec.loads(request)
+                if not isinstance(d, dict):
+                    return None, None, None
+                method, _id, timeout = d.get('method'), d.get('id', False), d.get(DEADLINE_MEMBER)
+            else:
+                if isinstance(request, str):
+                    request = request.encode('utf8')
+                data = RawMessage._buffer(request)
+                members, _ = scan_object(data)
+                values = {}
+                for name in ('method', 'id', DEADLINE_MEMBER):
+                    if name in members:
+                        start, end = members[name]
+                        values[name] = codec.loads(data[start:end])
+                method, _id, timeout = values.get('method'), values.get('id', False), values.get(DEADLINE_MEMBER)
+        except Exception:
+            return None, None, None
+        if not isinstance(method, str) or not isinstance(_id, (str, int, float, type(None))):
+            return None, None, None
+        if not isinstance(timeout, (int, float)) or isinstance(timeout, bool):
+            timeout = None
+        return method, _id, timeout
+
+    def _response(self, code, _id):
+        self.shed[code] += 1
+        if self.metrics is not None:
+            self.metrics.count_error(code)
+        if _id is False:
+            return None
+        if self._messages is not _jsonrpc._ERROR_MESSAGES:
+            # changed by jsonrpc.set_server_errors
+            self._prefixes.clear()
+            self._messages = _jsonrpc._ERROR_MESSAGES
+        message = self._messages.get(code, _SHED_MESSAGES[code])
+        codec = self.codec or get_codec()
+        if getattr(codec, 'binary', False):
+            return JSONCallError(code, message=message, _id=_id).response(codec=codec)
+        # pre-encoded up to the id
+        compact = getattr(codec, 'compact', False)
+        prefix = self._prefixes.get((code, compact))
+        _, error_prefix, id_sep, suffix = _ENVELOPES[compact, True]
+        if prefix is None:
+            values = JSONCallError(code, message=message).values
+            prefix = self._prefixes[code, compact] = error_prefix + codec.dumpb(values) + id_sep
+        return prefix + codec.dumpb(_id) + suffix
+
+    async def dispatch(self, request):
+        # returns the response bytes, or None when there is nothing to send back
+        method, _id, timeout = self._peek(request)
+        bucket = self.buckets.get(method)
+        if bucket is not None and not bucket.take():
+            return self._response(RATE_LIMITED, _id)
+        if timeout is None:
+            timeout = self.default_timeout
+        deadline = None
+        if timeout is not None:
+            if timeout <= 0:
+                return self._response(DEADLINE_EXCEEDED, _id)
+            deadline = self.clock() + timeout
+        self._sequence += 1
+        entry = _Entry(
+            method, self.priorities.get(method, 0), _id is False, deadline, self._sequence,
+            asyncio.get_event_loop().create_future()
+        )
+        self._enqueue(entry)
+        try:
+            code = await entry.future
+        except asyncio.CancelledError:
+            # e.g. the connection was closed
+            if entry.future.cancelled():
+                # left in the heaps until it comes up
+                self._waiting -= 1
+            elif entry.future.result() is None:
+                self._release(method)
+            raise
+        if code is not None:
+            return self._response(code, _id)
+        try:
+            return await self.dispatcher.dispatch(request)
+        finally:
+            self._release(method)
+
+    def _enqueue(self, entry):
+        self._waiting += 1
+        heapq.heappush(self._ready, (entry.rank, entry))
+        heapq.heappush(self._least, (entry.key, entry))
+        if entry.deadline is not None:
+            heapq.heappush(self._deadlines, (entry.deadline, entry.rank, entry))
+            self._schedule_expiry()
+        self._grant()
+        if self._waiting > self.max_queue:
+            self._shed_one()
+        self._compact()
+
+    def _dequeue(self, entry, code):
+        # code is None to admit it, or the error it is shed with
+        self._waiting -= 1
+        entry.future.set_result(code)
+
+    def _compact(self):
+        # drops the entries which left the queue once they are most of the heaps
+        if len(self._least) <= 2 * self._waiting + 64:
+            return
+        for heap in [self._ready, self._least, self._deadlines, *self._blocked.values()]:
+            heap[:] = [item for item in heap if not item[-1].future.done()]
+            heapq.heapify(heap)
+
+    def _expire(self):
+        # sheds the requests whose deadline passed, returns how many
+        now = self.clock()
+        deadlines = self._deadlines
+        expired = 0
+        while deadlines and (deadlines[0][-1].future.done() or deadlines[0][0] <= now):
+            entry = heapq.heappop(deadlines)[-1]
+            if not entry.future.done():
+                self._dequeue(entry, DEADLINE_EXCEEDED)
+                expired += 1
+        return expired
+
+    def _schedule_expiry(self):
+        # expired requests are answered at their deadline, not when they come up
+        if not self._deadlines:
+            return
+        at = self._deadlines[0][0]
+        loop = asyncio.get_event_loop()
+        if self._timer is not None:
+            timer_at, handle, timer_loop = self._timer
+            if timer_at <= at and timer_loop is loop:
+                return
+            handle.cancel()
+        self._timer = (at, loop.call_later(max(at - self.clock(), 0), self._on_timer), loop)
+
+    def _on_timer(self):
+        self._timer = None
+        self._expire()
+        self._schedule_expiry()
+
+    def _shed_one(self):
+        # the queue is over max_queue: expired requests go first, else the least important
+        if self._expire():
+            return
+        least = self._least
+        while least:
+            entry = heapq.heappop(least)[-1]
+            if not entry.future.done():
+                self._dequeue(entry, OVERLOADED)
+                return
+
+    def _runnable(self, entry):
+        limit = self.method_limits.get(entry.method)
+        return limit is None or self._running.get(entry.method, 0) < limit
+
+    def _grant(self):
+        ready = self._ready
+        while ready and self.running < self.max_concurrency:
+            item = heapq.heappop(ready)
+            entry = item[-1]
+            if entry.future.done():
+                continue
+            if not self._runnable(entry):
+                # back in _ready when a request of its method ends
+                heapq.heappush(self._blocked.setdefault(entry.method, []), item)
+                continue
+            if entry.deadline is not None and self.clock() >= entry.deadline:
+                self._dequeue(entry, DEADLINE_EXCEEDED)
+                continue
+            self.running += 1
+            self._running[entry.method] = self._running.get(entry.method, 0) + 1
+            self._dequeue(entry, None)
+
+    def _release(self, method):
+        self.running -= 1
+        self._running[method] -= 1
+        blocked = self._blocked.get(method)
+        while blocked:
+            item = heapq.heappop(blocked)
+            if not item[-1].future.done():
+                heapq.heappush(self._ready, item)
+                break
+        if blocked is not None and not blocked:
+            del self._blocked[method]
+        self._grant()
@@ -0,0 +1,229 @@
+import asyncio
+import inspect
+import logging
+from collections.abc import Iterator
+from functools import partial
+from time import perf_counter
+
+from .jsonrpc import JSONCall, JSONBatch, JSONCallError, CHUNK_SIZE, _encode_response, _set_exception
+from .dispatcher import Dispatcher, _BatchWriter, _unpack
+from .stream import BatchReader, MAX_FRAME_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+def _result_size(result, limit):
+    # about the encoded size of result: one per value at any depth, plus the
+    # length of strings; measured up to limit only
+    size = 0
+    stack = [result]
+    while stack and size < limit:
+        value = stack.pop()
+        size += 1
+        if isinstance(value, (str, bytes)):
+            size += len(value)
+        elif isinstance(value, (list, tuple, dict)):
+            # each member is at least one more
+            if size + len(value) >= limit:
+                return limit
+            stack.extend(value)
+            if isinstance(value, dict):
+                stack.extend(value.values())
+        elif isinstance(value, Iterator):
+            # the size of a generator isn't known before running it
+            return limit
+    return size
+
+
+class AsyncDispatcher(Dispatcher):
+    # Handlers may be coroutine functions or plain functions. Results of
+    # about encode_threshold or more, counting one per value at any depth
+    # plus the length of strings, are encoded in encode_executor (the loop's
+    # default executor if None) so the event loop isn't blocked.
+    # max_concurrency applies per running event loop.
+
+    def __init__(
+        self, max_concurrency=None, encode_threshold=10000, encode_executor=None, errors=None, metrics=None, codec=None
+    ):
+        super().__init__(errors=errors, metrics=metrics, codec=codec)
+        if max_concurrency is not None and max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+        self.max_concurrency = max_concurrency
+        self.encode_threshold = encode_threshold
+        self.encode_executor = encode_executor
+        # (loop, semaphore)
+        self._semaphore = (None, None)
+
+    @property
+    def semaphore(self):
+        # created for each running loop, as asyncio primitives are bound to one
+        if not self.max_concurrency:
+            return None
+        loop = asyncio.get_running_loop()
+        owner, semaphore = self._semaphore
+        if owner is not loop:
+            semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._semaphore = (loop, semaphore)
+        return semaphore
+
+    async def call_async(self, call):
+        func, args, kwargs, submit = self._bind(call)
+        metrics = self.metrics
+        start = perf_counter()
+        try:
+            if submit is not None:
+                return await asyncio.wrap_future(submit(call, func, args, kwargs))
+            result = func(*args, **kwargs)
+            if inspect.isawaitable(result):
+                result = await result
+            return result
+        finally:
+            if metrics is not None:
+                metrics.observe_latency(call.method, perf_counter() - start)
+
+    async def _run(self, call):
+        try:
+            result = await self.call_async(call)
+        except asyncio.CancelledError:
+            # an Exception on python 3.7
+            raise
+        except Exception as exc:
+            _set_exception(call, exc, self.errors)
+        else:
+            if not call.is_notification:
+                call.set_result(result)
+
+    async def dispatch_call(self, call):
+        semaphore = self.semaphore
+        if semaphore is None:
+            await self._run(call)
+        else:
+            async with semaphore:
+                await self._run(call)
+        return call
+
+    def _is_large(self, call):
+        if self.encode_threshold is None or call.success is not True:
+            return False
+        return _result_size(call._result, self.encode_threshold) >= self.encode_threshold
+
+    async def encode(self, item):
+        # a call whose result fails to encode, e.g. a generator raising, is
+        # answered with the error its exception maps to
+        if isinstance(item, JSONCallError):
+            return item.response(codec=self.codec)
+        if self._is_large(item):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.encode_executor, partial(_encode_response, item, self.errors))
+        return _encode_response(item, self.errors)
+
+    async def dispatch(self, request):
+        # returns the response bytes, or None when there is nothing to send back
+        if self.metrics is not None:
+            self.metrics.observe_request_size(len(request))
+        try:
+            received = JSONCall.from_request(request, codec=self.codec)
+        except JSONCallError as error:
+            received, response = error, error.response(codec=self.codec)
+        else:
+            response = await self._dispatch(received)
+        if self.metrics is not None:
+            self._observe(received, response)
+        return response
+
+    async def _dispatch(self, received):
+        if isinstance(received, JSONBatch):
+            await asyncio.gather(*[self.dispatch_call(call) for call in received.calls])
+            if getattr(self.codec, 'binary', False):
+                # packed whole
+                return received.response(errors=self.errors)
+            responses = [
+                await self.encode(item) for item in received.items
+                if isinstance(item, JSONCallError) or not item.is_notification
+            ]
+            # nothing is returned for all notification batches
+            if not responses:
+                return None
+            separator = b',' if getattr(self.codec, 'compact', False) else b', '
+            return b'[' + separator.join(responses) + b']'
+        await self.dispatch_call(received)
+        if received.is_notification:
+            return None
+        return await self.encode(received)
+
+    async def dispatch_iter(self, request, chunk_size=CHUNK_SIZE):
+        # as Dispatcher.dispatch_iter once the calls are handled: returns an
+        # iterator of response chunks
+        if self.metrics is not None:
+            self.metrics.observe_request_size(len(request))
+        try:
+            received = JSONCall.from_request(request, codec=self.codec)
+        except JSONCallError as error:
+            return self._counted(error, [error.response(codec=self.codec)])
+        return await self._dispatched(received, chunk_size)
+
+    async def _dispatched(self, received, chunk_size):
+        if isinstance(received, JSONBatch):
+            await asyncio.gather(*[self.dispatch_call(call) for call in received.calls])
+        else:
+            await self.dispatch_call(received)
+        return self._counted(received, self._iter_response(received, chunk_size))
+
+    async def dispatch_stream(self, chunks, max_items=None, max_size=MAX_FRAME_SIZE, chunk_size=CHUNK_SIZE):
+        # as Dispatcher.dispatch_stream, reading an async or plain iterable:
+        # an async generator of response chunks
+        if getattr(self.codec, 'binary', False):
+            # read whole, see Dispatcher._stream_binary
+            request = bytearray()
+            try:
+                async for chunk in _aiter(chunks):
+                    request += chunk
+                    if max_size is not None and len(request) > max_size:
+                        raise JSONCallError(-32600, data=f"request exceeds {max_size} bytes")
+                received = _unpack(request, max_items, self.codec)
+            except JSONCallError as error:
+                received = error
+            if self.metrics is not None:
+                self.metrics.observe_request_size(len(request))
+            if isinstance(received, JSONCallError):
+                response = self._counted(received, [received.response(codec=self.codec)])
+            else:
+                response = await self._dispatched(received, chunk_size)
+            for chunk in response:
+                yield chunk
+            return
+        reader = BatchReader(max_items=max_items, max_size=max_size, codec=self.codec)
+        writer = _BatchWriter(self, chunk_size)
+        try:
+            async for data in _aiter(chunks):
+                items = await self._dispatch_items(reader.feed(data))
+                for item in items:
+                    for chunk in writer.write(item, batch=reader.is_batch):
+                        yield chunk
+            for item in await self._dispatch_items(reader.close()):
+                for chunk in writer.write(item, batch=reader.is_batch):
+                    yield chunk
+        except JSONCallError as error:
+            for chunk in writer.fail(error):
+                yield chunk
+        else:
+            for chunk in writer.close():
+                yield chunk
+        if self.metrics is not None:
+            self.metrics.observe_request_size(reader.size)
+            if writer.size:
+                self.metrics.observe_response_size(writer.size)
+
+    async def _dispatch_items(self, items):
+        # the items read from a chunk are handled together
+        await asyncio.gather(*[self.dispatch_call(item) for item in items if isinstance(item, JSONCall)])
+        return items
+
+
+async def _aiter(chunks):
+    if hasattr(chunks, '__aiter__'):
+        async for chunk in chunks:
+            yield chunk
+    else:
+        for chunk in chunks:
+            yield chunk
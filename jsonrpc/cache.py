@@ -0,0 +1,147 @@
+import asyncio
+import inspect
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from .jsonrpc import EncodedResult
+from .codec import get_codec
+
+logger = logging.getLogger(__name__)
+
+
+def canonical_params(params):
+    # the same params give the same key whatever their order and whitespace
+    if not params:
+        return ''
+    return json.dumps(params, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+
+
+def _resolved(value=None, exception=None):
+    future = Future()
+    if exception is None:
+        future.set_result(value)
+    else:
+        future.set_exception(exception)
+    return future
+
+
+class ResultCache:
+    # Caches the encoded results of idempotent methods, keyed on the method
+    # and canonical params. Identical calls arriving while one is being
+    # handled wait for its result instead of running the handler again.
+    # Errors are not cached. Enabled per method with
+    # dispatcher.register(func, cache=ResultCache(...)); a cache may be
+    # shared by several methods.
+
+    def __init__(self, maxsize=1024, ttl=None, clock=time.monotonic):
+        if maxsize is not None and maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        self.maxsize = maxsize
+        # seconds, or None to keep entries until evicted or invalidated
+        self.ttl = ttl
+        self.clock = clock
+        # key: (expiry or None, EncodedResult), least recently used first
+        self._entries = OrderedDict()
+        # key: Future of the call being handled
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(method, params=None):
+        return method, canonical_params(params)
+
+    def get(self, method, params=None):
+        # the cached EncodedResult, or None
+        with self._lock:
+            return self._get(self.key(method, params))
+
+    def _get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expiry, result = entry
+        if expiry is not None and self.clock() >= expiry:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return result
+
+    def set(self, method, params, result, codec=None):
+        if not isinstance(result, EncodedResult):
+            result = EncodedResult((codec or get_codec()).dumpb(result))
+        with self._lock:
+            self._set(self.key(method, params), result)
+        return result
+
+    def _set(self, key, result):
+        expiry = None if self.ttl is None else self.clock() + self.ttl
+        self._entries[key] = (expiry, result)
+        self._entries.move_to_end(key)
+        if self.maxsize is not None and len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, method=None, params=None):
+        # drop one entry, all entries of method, or everything
+        with self._lock:
+            if method is None:
+                self._entries.clear()
+            elif params is None:
+                for key in [key for key in self._entries if key[0] == method]:
+                    del self._entries[key]
+            else:
+                self._entries.pop(self.key(method, params), None)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def submit_call(self, submit, call, func, args, kwargs):
+        # returns a concurrent.futures.Future of the EncodedResult; submit is
+        # how the handler is run when the result isn't cached, None to call it
+        key = self.key(call.method, call.params)
+        with self._lock:
+            result = self._get(key)
+            if result is not None:
+                self.hits += 1
+                return _resolved(result)
+            future = self._inflight.get(key)
+            if future is not None:
+                self.hits += 1
+                return future
+            self.misses += 1
+            future = self._inflight[key] = Future()
+        try:
+            if submit is None:
+                result = func(*args, **kwargs)
+                if inspect.isawaitable(result):
+                    # coroutine handlers of an AsyncDispatcher
+                    source = asyncio.ensure_future(result)
+                else:
+                    source = _resolved(result)
+            else:
+                source = submit(call, func, args, kwargs)
+        except Exception as exc:
+            source = _resolved(exception=exc)
+        source.add_done_callback(lambda source: self._finish(key, future, source, call.codec))
+        return future
+
+    def _finish(self, key, future, source, codec):
+        # store the result and hand it, or the exception, to all waiters
+        try:
+            result = source.result()
+            if not isinstance(result, EncodedResult):
+                result = EncodedResult((codec or get_codec()).dumpb(result))
+        except BaseException as exc:
+            with self._lock:
+                del self._inflight[key]
+            future.set_exception(exc)
+            return
+        with self._lock:
+            del self._inflight[key]
+            self._set(key, result)
+        future.set_result(result)
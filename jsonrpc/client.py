@@ -0,0 +1,241 @@
+import asyncio
+import heapq
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, wait
+
+from .jsonrpc import JSONCall, JSONBatch, JSONCallError, _loads, with_timeout
+
+logger = logging.getLogger(__name__)
+
+
+class _CallFuture(Future):
+    # Waiting on result() or exception() evicts the call at its deadline, so
+    # it times out even when nothing calls feed() or expire().
+
+    def __init__(self, session, deadline):
+        super().__init__()
+        self.session = session
+        self.deadline = deadline
+
+    def _wait(self, timeout):
+        # returns what is left of timeout once waited for the deadline
+        if self.deadline is None or self.done():
+            return timeout
+        start = time.monotonic()
+        remaining = self.deadline - start
+        if timeout is not None and timeout < remaining:
+            return timeout
+        wait([self], max(remaining, 0))
+        if not self.done():
+            self.session.expire()
+        if timeout is None:
+            return None
+        return max(timeout - (time.monotonic() - start), 0)
+
+    def result(self, timeout=None):
+        return super().result(self._wait(timeout))
+
+    def exception(self, timeout=None):
+        return super().exception(self._wait(timeout))
+
+
+class ClientSession:
+    # Issues calls over one connection and routes responses back to them by id.
+    # send is called with the request bytes; responses are passed to feed().
+    # Calls past their deadline are evicted with a TimeoutError, and at most
+    # max_pending calls can be waiting at once. With propagate_timeout, the
+    # timeout of a call is sent along for the server to skip it once expired,
+    # see jsonrpc.admission. An error response with a null id (e.g. the
+    # server couldn't parse a request) fails the call if only one is
+    # pending, and is kept in unmatched otherwise. Sessions can be shared by
+    # threads.
+
+    def __init__(self, send=None, timeout=None, max_pending=None, id_generator=None, codec=None, propagate_timeout=False):
+        self.send = send
+        # defaults to the global generator of jsonrpc.ids
+        self.id_generator = id_generator
+        self.timeout = timeout
+        self.max_pending = max_pending
+        self.codec = codec
+        self.propagate_timeout = propagate_timeout
+        # id: (call, future, sequence)
+        self._pending = {}
+        # heap of (deadline, sequence, id), stale once the pending call of id
+        # has another sequence
+        self._deadlines = []
+        self._sequence = 0
+        # the latest error responses which matched no call
+        self.unmatched = deque(maxlen=64)
+        # held while _pending and _deadlines change, not while futures are set
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def __contains__(self, _id):
+        return _id in self._pending
+
+    def _register(self, call, timeout):
+        self.expire()
+        timeout = self.timeout if timeout is None else timeout
+        deadline = None if timeout is None else time.monotonic() + timeout
+        future = _CallFuture(self, deadline)
+        with self._lock:
+            if self.max_pending is not None and len(self._pending) >= self.max_pending:
+                raise Exception("too many pending calls")
+            if call._id in self._pending:
+                raise ValueError(f"a call with id {call._id!r} is already pending")
+            self._sequence += 1
+            self._pending[call._id] = (call, future, self._sequence)
+            if deadline is not None:
+                heapq.heappush(self._deadlines, (deadline, self._sequence, call._id))
+        return future
+
+    def _forget(self, calls):
+        # calls that were never sent
+        with self._lock:
+            for call in calls:
+                self._pending.pop(call._id, None)
+
+    def prepare(self, method, params=None, timeout=None, _id=True):
+        # register a call without sending it
+        if _id is True and self.id_generator is not None:
+            _id = self.id_generator()
+        call = JSONCall(method, params=params, _id=_id, codec=self.codec)
+        return call, self._register(call, timeout)
+
+    def call(self, method, params=None, timeout=None):
+        call, future = self.prepare(method, params=params, timeout=timeout)
+        try:
+            request = call.request()
+            timeout = self.timeout if timeout is None else timeout
+            if self.propagate_timeout and timeout is not None:
+                request = with_timeout(request, timeout, self.codec)
+            self._send(request)
+        except Exception:
+            # e.g. the connection is closed: the call was never sent
+            self._forget([call])
+            raise
+        return future
+
+    def call_async(self, method, params=None, timeout=None):
+        future = asyncio.wrap_future(self.call(method, params=params, timeout=timeout))
+        timeout = self.timeout if timeout is None else timeout
+        if timeout is not None:
+            asyncio.get_event_loop().call_later(timeout, self.expire)
+        return future
+
+    def notify(self, method, params=None):
+        self._send(JSONCall(method, params=params, _id=False, codec=self.codec).request())
+
+    def batch(self, calls, timeout=None):
+        # calls is an iterable of (method, params) and returns a future per call
+        jsoncalls = []
+        futures = []
+        try:
+            for method, params in calls:
+                call, future = self.prepare(method, params=params, timeout=timeout)
+                jsoncalls.append(call)
+                futures.append(future)
+            self._send(JSONBatch(jsoncalls, codec=self.codec).request())
+        except Exception:
+            self._forget(jsoncalls)
+            raise
+        return futures
+
+    def _send(self, request):
+        if self.send is None:
+            raise Exception("no send function provided")
+        self.send(request)
+
+    def feed(self, response):
+        # route a response (or an array of responses) to the pending calls
+        try:
+            r = _loads(response, self.codec, None)
+        except Exception:
+            logger.warning("discarding unparsable response")
+            return
+        for resp in (r if isinstance(r, list) else [r]):
+            self._route(resp)
+        self.expire()
+
+    def _route(self, resp):
+        try:
+            _id = resp['id']
+            with self._lock:
+                call, future, _ = self._pending.pop(_id)
+        except (KeyError, TypeError):
+            self._unmatched(resp)
+            return
+        try:
+            call._assign(resp)
+        except JSONCallError as error:
+            outcome = error
+        except Exception as error:
+            outcome = error
+        else:
+            outcome = None
+        if future.done():
+            return
+        if outcome is None:
+            future.set_result(call.result)
+        else:
+            future.set_exception(outcome)
+
+    def _unmatched(self, resp):
+        # unknown id (e.g. a call that timed out) or an error without id
+        error = resp.get('error') if isinstance(resp, dict) else None
+        if not isinstance(error, dict) or resp.get('id') is not None:
+            logger.warning("discarding response that matches no pending call: %r", resp)
+            return
+        try:
+            error = JSONCallError(error['code'], message=error['message'], data=error.get('data'))
+        except Exception:
+            logger.warning("discarding malformed error response: %r", resp)
+            return
+        with self._lock:
+            # with one call pending it can only be about that call
+            future = self._pending.popitem()[1][1] if len(self._pending) == 1 else None
+        if future is not None:
+            if not future.done():
+                future.set_exception(error)
+            return
+        logger.warning("error response without id: %r", resp)
+        self.unmatched.append(error)
+
+    def expire(self, now=None):
+        # evict calls past their deadline
+        now = time.monotonic() if now is None else now
+        expired = []
+        with self._lock:
+            deadlines = self._deadlines
+            while deadlines and deadlines[0][0] <= now:
+                _, sequence, _id = heapq.heappop(deadlines)
+                entry = self._pending.get(_id)
+                if entry is None or entry[2] != sequence:
+                    # completed, or the id was reused since
+                    continue
+                del self._pending[_id]
+                expired.append((_id, entry[1]))
+            # drop heap entries of calls that already completed
+            if len(deadlines) > 2 * len(self._pending) + 64:
+                self._deadlines = [d for d in deadlines if d[2] in self._pending and self._pending[d[2]][2] == d[1]]
+                heapq.heapify(self._deadlines)
+        for _id, future in expired:
+            if not future.done():
+                future.set_exception(TimeoutError(f"call {_id!r} timed out"))
+
+    def cancel_all(self, exception=None):
+        # e.g. when the connection is lost
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._deadlines = []
+        for call, future, _ in pending.values():
+            if not future.done():
+                if exception is None:
+                    future.cancel()
+                else:
+                    future.set_exception(exception)
@@ -0,0 +1,252 @@
+import json
+import logging
+import re
+from json.encoder import encode_basestring
+try:
+    from json.encoder import c_make_encoder
+except ImportError:
+    c_make_encoder = None
+
+from .packing import MsgpackCodec
+
+logger = logging.getLogger(__name__)
+
+JSON_CONTENT_TYPE = 'application/json'
+# what stdlib json accepts and the fast backends may reject:
+# NaN, Infinity and numbers beyond the range of doubles or 64 bit integers
+_UNSUPPORTED = re.compile(rb'NaN|Infinity|[0-9]{19}|[eE][+-]?[0-9]{3}')
+
+
+class JSONCodec:
+    # stdlib json, the reference for the wire format
+    name = 'json'
+    # whether output uses (',', ':') separators instead of (', ', ': ')
+    compact = False
+
+    def __init__(self):
+        encoder = json.JSONEncoder(ensure_ascii=False)
+        self._encode = encoder.encode
+        # json.dumps sets up a C encoder per call - build it once instead
+        self._iterencode = None
+        if c_make_encoder is not None:
+            self._iterencode = c_make_encoder(
+                None, encoder.default, encode_basestring, None, ': ', ', ', False, False, True
+            )
+
+    def loads(self, data):
+        if isinstance(data, memoryview):
+            data = bytes(data)
+        return json.loads(data)
+
+    def dumps(self, obj):
+        # scalars are common as ids and results
+        t = type(obj)
+        if t is str:
+            return encode_basestring(obj)
+        elif t is int:
+            return int.__repr__(obj)
+        elif obj is None:
+            return 'null'
+        if self._iterencode is not None:
+            try:
+                return ''.join(self._iterencode(obj, 0))
+            except RecursionError:
+                # no circular reference checks in the C encoder, let stdlib report it
+                pass
+        return self._encode(obj)
+
+    def dumpb(self, obj):
+        return self.dumps(obj).encode('utf8')
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}()"
+
+
+class _FastCodec(JSONCodec):
+    # Decoding with the backend gives the same objects as stdlib json. The
+    # backends format some floats differently (1e16 vs 1e+16) and emit
+    # compact separators, so their encoders are only used with fast_dumps.
+    # Subclasses set _loads(data), _dumpb(obj) and the _decode_error raised
+    # by _loads.
+
+    def __init__(self, fast_dumps=False):
+        super().__init__()
+        self.fast_dumps = fast_dumps
+        self.compact = fast_dumps
+
+    def loads(self, data):
+        try:
+            return self._loads(data)
+        except self._decode_error as error:
+            if isinstance(data, str):
+                data = data.encode('utf8', 'surrogatepass')
+            if _UNSUPPORTED.search(data) is None:
+                raise ValueError(str(error)) from error
+        # defer to stdlib semantics
+        return super().loads(data)
+
+    def dumps(self, obj):
+        if self.fast_dumps:
+            return self.dumpb(obj).decode('utf8')
+        return super().dumps(obj)
+
+    def dumpb(self, obj):
+        if self.fast_dumps:
+            try:
+                return self._dumpb(obj)
+            except Exception:
+                pass
+        return super().dumps(obj).encode('utf8')
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}(fast_dumps={self.fast_dumps})"
+
+
+class OrjsonCodec(_FastCodec):
+    name = 'orjson'
+
+    def __init__(self, fast_dumps=False):
+        import orjson
+        super().__init__(fast_dumps=fast_dumps)
+        self._decode_error = orjson.JSONDecodeError
+        self._loads = orjson.loads
+        self._dumpb = orjson.dumps
+
+
+class MsgspecCodec(_FastCodec):
+    name = 'msgspec'
+
+    def __init__(self, fast_dumps=False):
+        import msgspec
+        super().__init__(fast_dumps=fast_dumps)
+        self._decode_error = msgspec.DecodeError
+        self._loads = msgspec.json.decode
+        self._dumpb = msgspec.json.encode
+
+
+class UjsonCodec(_FastCodec):
+    name = 'ujson'
+
+    def __init__(self, fast_dumps=False):
+        import ujson
+        super().__init__(fast_dumps=fast_dumps)
+        self._decode_error = ujson.JSONDecodeError
+        self._ujson = ujson
+
+    def _loads(self, data):
+        if isinstance(data, memoryview):
+            data = bytes(data)
+        return self._ujson.loads(data)
+
+    def _dumpb(self, obj):
+        return self._ujson.dumps(
+            obj, ensure_ascii=False, escape_forward_slashes=False
+        ).encode('utf8')
+
+
+# in order of preference
+CODECS = {
+    codec.name: codec for codec in [OrjsonCodec, MsgspecCodec, UjsonCodec, JSONCodec]
+}
+
+
+# binary formats carrying the same structures, never selected by default
+BINARY_CODECS = {
+    MsgpackCodec.name: MsgpackCodec,
+}
+# content type: codec name, None for the json codec in use
+CONTENT_TYPES = {
+    'application/json': None,
+    'application/json-rpc': None,
+    'application/jsonrequest': None,
+    'application/msgpack': 'msgpack',
+    'application/x-msgpack': 'msgpack',
+    'application/vnd.msgpack': 'msgpack',
+}
+
+
+def available_codecs():
+    names = []
+    for name, codec in CODECS.items():
+        try:
+            codec()
+        except ImportError:
+            continue
+        names.append(name)
+    return names
+
+
+def make_codec(name, **kwargs):
+    try:
+        codec = CODECS[name] if name in CODECS else BINARY_CODECS[name]
+    except KeyError:
+        raise ValueError(f"unknown codec {name}: expected one of {', '.join([*CODECS, *BINARY_CODECS])}")
+    return codec(**kwargs)
+
+
+_CODEC = None
+
+
+def get_codec():
+    global _CODEC
+    if _CODEC is None:
+        _CODEC = make_codec(available_codecs()[0])
+        logger.debug("using %r", _CODEC)
+    return _CODEC
+
+
+def set_codec(codec):
+    if isinstance(codec, str):
+        codec = make_codec(codec)
+    elif not (hasattr(codec, 'loads') and hasattr(codec, 'dumps') and hasattr(codec, 'dumpb')):
+        raise TypeError("codec must be a codec name or provide loads, dumps and dumpb")
+    global _CODEC
+    _CODEC = codec
+
+
+_BINARY = {}
+
+
+def content_type(codec=None):
+    return getattr(codec or get_codec(), 'content_type', JSON_CONTENT_TYPE)
+
+
+def codec_for(content_type, default=None):
+    # the codec for a Content-Type header value, or default when it isn't supported
+    mime = content_type.split(';', 1)[0].strip().lower()
+    if mime not in CONTENT_TYPES:
+        return default
+    name = CONTENT_TYPES[mime]
+    if name is None:
+        return get_codec()
+    codec = _BINARY.get(name)
+    if codec is None:
+        codec = _BINARY[name] = make_codec(name)
+    return codec
+
+
+def negotiate(accept, default=None):
+    # the codec for the most preferred supported type of an Accept header;
+    # default (the json codec in use if None) when nothing matches
+    choices = []
+    for i, part in enumerate(accept.split(',')):
+        mime, *params = part.split(';')
+        quality = 1.0
+        for param in params:
+            name, _, value = param.strip().partition('=')
+            if name == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        # ties keep the order of the header
+        choices.append((-quality, i, mime.strip().lower()))
+    for quality, _, mime in sorted(choices):
+        if quality == 0:
+            break
+        if mime in ('*/*', 'application/*'):
+            break
+        codec = codec_for(mime)
+        if codec is not None:
+            return codec
+    return default or get_codec()
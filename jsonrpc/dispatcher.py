@@ -0,0 +1,390 @@
+import inspect
+import itertools
+import logging
+from functools import partial
+from time import perf_counter
+
+from .jsonrpc import JSONCall, JSONBatch, JSONCallError, CHUNK_SIZE, _apply, _encode_response, _loads, _set_exception
+from .errors import ErrorRegistry
+from .schema import compile_params
+from .stream import BatchReader, MAX_FRAME_SIZE
+from . import pool
+
+logger = logging.getLogger(__name__)
+
+_POSITIONAL = (inspect.Parameter.POSITIONAL_ONLY, inspect.Parameter.POSITIONAL_OR_KEYWORD)
+_KEYWORD = (inspect.Parameter.POSITIONAL_OR_KEYWORD, inspect.Parameter.KEYWORD_ONLY)
+
+
+def compile_binder(func):
+    # inspect the signature once and return a cheap check of args/kwargs
+    min_args = max_args = 0
+    keywords = set()
+    required = set()
+    var_args = var_kwargs = False
+    by_position = True
+    for p in inspect.signature(func).parameters.values():
+        if p.kind in _POSITIONAL:
+            max_args += 1
+            if p.default is p.empty:
+                min_args = max_args
+        if p.kind in _KEYWORD:
+            keywords.add(p.name)
+        if p.default is p.empty and p.kind not in (p.VAR_POSITIONAL, p.VAR_KEYWORD):
+            required.add(p.name)
+            # required keyword-only params can't be given by position
+            by_position = by_position and p.kind is not p.KEYWORD_ONLY
+        var_args = var_args or p.kind is p.VAR_POSITIONAL
+        var_kwargs = var_kwargs or p.kind is p.VAR_KEYWORD
+    if var_args:
+        max_args = None
+    keywords = frozenset(keywords)
+    required = frozenset(required)
+
+    def binder(args, kwargs, _id=None):
+        if kwargs:
+            if not var_kwargs and not keywords.issuperset(kwargs):
+                unexpected = ', '.join(sorted(set(kwargs) - keywords))
+                raise JSONCallError(-32602, data=f"unexpected params: {unexpected}", _id=_id)
+            if not required.issubset(kwargs):
+                missing = ', '.join(sorted(required - set(kwargs)))
+                raise JSONCallError(-32602, data=f"missing params: {missing}", _id=_id)
+        else:
+            n = len(args)
+            if not by_position or n < min_args or (max_args is not None and n > max_args):
+                if max_args is None:
+                    expected = f"at least {min_args}"
+                elif min_args == max_args:
+                    expected = f"{min_args}"
+                else:
+                    expected = f"{min_args} to {max_args}"
+                if not by_position:
+                    expected = "named"
+                raise JSONCallError(-32602, data=f"expected {expected} params, got {n}", _id=_id)
+
+    return binder
+
+
+def _validating(binder, validate):
+    # binder also checking the values of params
+    def check(args, kwargs, _id=None):
+        binder(args, kwargs, _id)
+        validate(args, kwargs, _id)
+    return check
+
+
+def _unpack(request, max_items, codec):
+    # a binary request, decoded whole: a batch above max_items keeps its first
+    # max_items elements and ends with a -32600 error, as BatchReader answers
+    # json; raises JSONCallError
+    try:
+        d = _loads(request, codec, None)
+    except Exception:
+        raise JSONCallError(-32700)
+    if not isinstance(d, list):
+        return JSONCall.from_dict(d, codec=codec)
+    if max_items is None or len(d) <= max_items:
+        return JSONBatch.from_list(d, codec=codec)
+    batch = JSONBatch.from_list(d[:max_items], codec=codec)
+    batch.items.append(JSONCallError(-32600, data=f"batch exceeds {max_items} items"))
+    return batch
+
+
+class _BatchWriter:
+    # Yields the response chunks of the items of a request read by a
+    # BatchReader, once each is handled, with the brackets and separators of
+    # a batch response.
+
+    def __init__(self, dispatcher, chunk_size):
+        self.dispatcher = dispatcher
+        self.chunk_size = chunk_size
+        self.opened = False
+        # bytes written
+        self.size = 0
+
+    def write(self, item, batch=True):
+        dispatcher = self.dispatcher
+        if dispatcher.metrics is not None:
+            dispatcher._observe(item, None)
+        if isinstance(item, JSONCallError):
+            chunks = [item.response(codec=dispatcher.codec)]
+        elif item.is_notification:
+            return
+        else:
+            chunks = dispatcher._iter_call(item, self.chunk_size)
+        if batch:
+            separator = b',' if getattr(dispatcher.codec, 'compact', False) else b', '
+            chunks = itertools.chain([separator if self.opened else b'['], chunks)
+            self.opened = True
+        for chunk in chunks:
+            self.size += len(chunk)
+            yield chunk
+
+    def fail(self, error):
+        # the request turned out malformed or too large: the error ends the
+        # response, after the responses already written
+        yield from self.write(error, batch=self.opened)
+        yield from self.close()
+
+    def close(self):
+        if self.opened:
+            self.opened = False
+            self.size += 1
+            yield b']'
+
+
+class Dispatcher:
+
+    def __init__(self, executor=None, errors=None, metrics=None, codec=None):
+        self._methods = {}
+        # runs the calls of a batch concurrently
+        self.executor = executor
+        # maps exceptions raised by handlers to error codes
+        self.errors = ErrorRegistry() if errors is None else errors
+        # a jsonrpc.metrics.Metrics, or None to record nothing
+        self.metrics = metrics
+        self.codec = codec
+
+    def register(self, func=None, name=None, executor=None, cache=None, schema=None):
+        # also usable as a decorator: @dispatcher.register or @dispatcher.register(name=...)
+        # executor runs the handler elsewhere, e.g. a ThreadPoolExecutor or a
+        # jsonrpc.pool.ProcessPool for CPU-bound handlers; cache is a
+        # jsonrpc.cache.ResultCache for idempotent methods; schema checks the
+        # values of params: True to compile it from the annotations of func,
+        # an object schema of the params or a jsonrpc.schema.ParamsSchema
+        if func is None:
+            return lambda func: self.register(func, name=name, executor=executor, cache=cache, schema=schema)
+        if name is None:
+            name = getattr(func, '__name__', None)
+            if name is None:
+                raise TypeError(f"name is required for {type(func).__name__} objects, which have no __name__")
+        if not isinstance(name, str) or not name:
+            raise TypeError("method name must be a non-empty string")
+        if name.startswith('rpc.'):
+            raise ValueError("method names beginning with 'rpc.' are reserved")
+        if executor is None:
+            submit = None
+        elif inspect.iscoroutinefunction(func):
+            raise TypeError("coroutine functions can't be run in an executor")
+        elif hasattr(executor, 'submit_call'):
+            submit = executor.submit_call
+        else:
+            submit = partial(pool.submit, executor)
+        if cache is not None:
+            submit = partial(cache.submit_call, submit)
+        binder = compile_binder(func)
+        if schema:
+            binder = _validating(binder, compile_params(func, schema).validate)
+        self._methods[name] = (func, binder, submit)
+        return func
+
+    def register_object(self, obj, prefix=''):
+        # register the public callables of a module or object
+        for name in dir(obj):
+            if name.startswith('_'):
+                continue
+            func = getattr(obj, name)
+            if callable(func) and not inspect.isclass(func):
+                self.register(func, name=prefix + name)
+
+    def unregister(self, name):
+        del self._methods[name]
+
+    @property
+    def methods(self):
+        return list(self._methods)
+
+    def __contains__(self, name):
+        return name in self._methods
+
+    def _bind(self, call):
+        try:
+            func, binder, submit = self._methods[call.method]
+        except KeyError:
+            raise JSONCallError(-32601, _id=call._id)
+        args = call.args
+        kwargs = call.kwargs
+        binder(args, kwargs, call._id)
+        return func, args, kwargs, submit
+
+    def _call(self, call, func, args, kwargs, submit):
+        if submit is None:
+            return func(*args, **kwargs)
+        return submit(call, func, args, kwargs).result()
+
+    def call(self, call):
+        bound = self._bind(call)
+        metrics = self.metrics
+        if metrics is None:
+            return self._call(call, *bound)
+        start = perf_counter()
+        try:
+            return self._call(call, *bound)
+        finally:
+            metrics.observe_latency(call.method, perf_counter() - start)
+
+    def _observe(self, received, response):
+        # record the errors of a dispatched call, batch or JSONCallError, and the response size
+        metrics = self.metrics
+        if isinstance(received, JSONCallError):
+            if received.code == -32700:
+                metrics.count_parse_failure()
+            items = [received]
+        elif isinstance(received, JSONBatch):
+            items = received.items
+        else:
+            items = [received]
+        for item in items:
+            if isinstance(item, JSONCallError):
+                metrics.count_error(item.code)
+            elif item.success is False:
+                metrics.count_error(item._error.code)
+        if response is not None:
+            metrics.observe_response_size(len(response))
+        return response
+
+    def dispatch_call(self, call):
+        _apply(self.call, call, self.errors)
+        return call
+
+    def dispatch(self, request):
+        # returns the response bytes, or None when there is nothing to send back
+        if self.metrics is not None:
+            self.metrics.observe_request_size(len(request))
+        try:
+            received = JSONCall.from_request(request, codec=self.codec)
+        except JSONCallError as error:
+            received, response = error, error.response(codec=self.codec)
+        else:
+            if isinstance(received, JSONBatch):
+                received.dispatch(self.call, executor=self.executor, errors=self.errors)
+                response = received.response(errors=self.errors)
+            else:
+                self.dispatch_call(received)
+                response = None if received.is_notification else _encode_response(received, self.errors)
+        if self.metrics is not None:
+            self._observe(received, response)
+        return response
+
+    def dispatch_iter(self, request, chunk_size=CHUNK_SIZE):
+        # as dispatch, but returns an iterator of response chunks; results are
+        # encoded incrementally, see JSONCall.iter_response. Nothing is
+        # yielded when there is nothing to send back
+        if self.metrics is not None:
+            self.metrics.observe_request_size(len(request))
+        try:
+            received = JSONCall.from_request(request, codec=self.codec)
+        except JSONCallError as error:
+            return self._counted(error, [error.response(codec=self.codec)])
+        return self._dispatched(received, chunk_size)
+
+    def _dispatched(self, received, chunk_size):
+        if isinstance(received, JSONBatch):
+            received.dispatch(self.call, executor=self.executor, errors=self.errors)
+        else:
+            self.dispatch_call(received)
+        return self._counted(received, self._iter_response(received, chunk_size))
+
+    def dispatch_stream(self, chunks, max_items=None, max_size=MAX_FRAME_SIZE, chunk_size=CHUNK_SIZE):
+        # as dispatch_iter for a request read from an iterable of chunks,
+        # without holding all of it or its response: the elements of a batch
+        # are dispatched as they are parsed, those of a chunk together, and
+        # their responses are yielded before the rest is read. A batch above
+        # max_items or max_size bytes, or found malformed, is ended by an error
+        # response (-32600 or -32700) after the responses already yielded
+        if getattr(self.codec, 'binary', False):
+            return self._stream_binary(chunks, max_items, max_size, chunk_size)
+        return self._stream(chunks, max_items, max_size, chunk_size)
+
+    def _stream_binary(self, chunks, max_items, max_size, chunk_size):
+        # no incremental scanner for binary formats: the request is read whole,
+        # checking max_size as it grows and max_items once unpacked
+        request = bytearray()
+        try:
+            for chunk in chunks:
+                request += chunk
+                if max_size is not None and len(request) > max_size:
+                    raise JSONCallError(-32600, data=f"request exceeds {max_size} bytes")
+            received = _unpack(request, max_items, self.codec)
+        except JSONCallError as error:
+            received = error
+        if self.metrics is not None:
+            self.metrics.observe_request_size(len(request))
+        if isinstance(received, JSONCallError):
+            yield from self._counted(received, [received.response(codec=self.codec)])
+        else:
+            yield from self._dispatched(received, chunk_size)
+
+    def _stream(self, chunks, max_items, max_size, chunk_size):
+        reader = BatchReader(max_items=max_items, max_size=max_size, codec=self.codec)
+        writer = _BatchWriter(self, chunk_size)
+        try:
+            for items in reader.read(chunks):
+                calls = [item for item in items if isinstance(item, JSONCall)]
+                if calls:
+                    JSONBatch(calls).dispatch(self.call, executor=self.executor, errors=self.errors)
+                for item in items:
+                    yield from writer.write(item, batch=reader.is_batch)
+        except JSONCallError as error:
+            yield from writer.fail(error)
+        else:
+            yield from writer.close()
+        if self.metrics is not None:
+            self.metrics.observe_request_size(reader.size)
+            if writer.size:
+                self.metrics.observe_response_size(writer.size)
+
+    def _counted(self, received, chunks):
+        if self.metrics is None:
+            return chunks
+        return self._observe_chunks(received, chunks)
+
+    def _observe_chunks(self, received, chunks):
+        size = 0
+        for chunk in chunks:
+            size += len(chunk)
+            yield chunk
+        self._observe(received, None)
+        if size:
+            self.metrics.observe_response_size(size)
+
+    def _iter_response(self, received, chunk_size):
+        if not isinstance(received, JSONBatch):
+            if not received.is_notification:
+                yield from self._iter_call(received, chunk_size)
+            return
+        items = [
+            item for item in received.items
+            if isinstance(item, JSONCallError) or not item.is_notification
+        ]
+        # nothing is returned for all notification batches
+        if not items:
+            return
+        if getattr(self.codec, 'binary', False):
+            yield received.response(errors=self.errors)
+            return
+        separator = b',' if getattr(self.codec, 'compact', False) else b', '
+        yield b'['
+        for i, item in enumerate(items):
+            if i:
+                yield separator
+            if isinstance(item, JSONCallError):
+                yield item.response(codec=self.codec)
+            else:
+                yield from self._iter_call(item, chunk_size)
+        yield b']'
+
+    def _iter_call(self, call, chunk_size):
+        chunks = call.iter_response(chunk_size)
+        try:
+            first = next(chunks)
+        except Exception as exc:
+            # e.g. raised by a generator result; nothing was sent yet, so it
+            # can still be an error response
+            _set_exception(call, exc, self.errors)
+            yield _encode_response(call, self.errors)
+            return
+        yield first
+        # the response can't be completed after a later failure, which is
+        # raised for the transport to close the connection
+        yield from chunks
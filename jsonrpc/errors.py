@@ -0,0 +1,108 @@
+import logging
+
+from .jsonrpc import JSONCallError, JSONRPC_VERSION, _ENVELOPES, _envelope, _dumps
+from . import jsonrpc as _jsonrpc
+
+logger = logging.getLogger(__name__)
+
+
+class ErrorRegistry:
+    # Maps exception classes to error codes. An exception resolves to the entry
+    # of the nearest class in its MRO, and the resolution is cached per type.
+    # message defaults to that of a builtin or server error code, or else to
+    # str() of the exception. data is an optional callable returning error data
+    # for an exception.
+
+    def __init__(self):
+        # exception class: (code, message, data)
+        self._entries = {}
+        # concrete exception class: entry or None
+        self._resolved = {}
+        # (code, message, compact, binary): error response up to the id
+        self._prefixes = {}
+
+    def register(self, exc_type, code, message=None, data=None):
+        if not (isinstance(exc_type, type) and issubclass(exc_type, BaseException)):
+            raise TypeError("exc_type must be an exception class")
+        if data is not None and not callable(data):
+            raise TypeError("data must be callable")
+        # validates code and message as for any error
+        JSONCallError(code, message=message if message is not None else _jsonrpc._ERROR_MESSAGES.get(code, ''))
+        self._entries[exc_type] = (code, message, data)
+        self._resolved.clear()
+
+    def unregister(self, exc_type):
+        del self._entries[exc_type]
+        self._resolved.clear()
+
+    def __contains__(self, exc_type):
+        return exc_type in self._entries
+
+    def resolve(self, exc_type):
+        # (code, message, data) for exc_type, or None
+        try:
+            return self._resolved[exc_type]
+        except KeyError:
+            pass
+        entry = None
+        for klass in exc_type.__mro__:
+            if klass in self._entries:
+                entry = self._entries[klass]
+                break
+        self._resolved[exc_type] = entry
+        return entry
+
+    def _message(self, code, message, exc):
+        if message is None:
+            # follows set_server_errors
+            message = _jsonrpc._ERROR_MESSAGES.get(code)
+        if message is None:
+            message = str(exc) or exc.__class__.__name__
+        return message
+
+    def _data(self, data, exc):
+        if data is None:
+            return None
+        try:
+            return data(exc)
+        except Exception:
+            logger.exception("failed getting error data for %r", exc)
+            return None
+
+    def error_for(self, exc, _id=None):
+        if isinstance(exc, JSONCallError):
+            return exc
+        entry = self.resolve(type(exc))
+        if entry is None:
+            return JSONCallError(-32603, _id=_id)
+        code, message, data = entry
+        return JSONCallError(
+            code, message=self._message(code, message, exc), data=self._data(data, exc), _id=_id
+        )
+
+    def response_for(self, exc, _id=None, encoding='utf8', codec=None):
+        # the error response for exc, spliced from a cached prefix when the
+        # entry has a fixed message and no data
+        entry = None if isinstance(exc, JSONCallError) else self.resolve(type(exc))
+        envelope = _envelope(codec, encoding, {})
+        if envelope is None:
+            return _dumps(
+                {'jsonrpc': JSONRPC_VERSION, 'error': self.error_for(exc).values, 'id': _id},
+                codec, encoding, {}
+            )
+        if entry is None or entry[2] is not None:
+            return self.error_for(exc, _id=_id)._splice(envelope, _id)
+        code, message, _ = entry
+        message = self._message(code, message, exc)
+        codec, binary = envelope
+        compact = getattr(codec, 'compact', False)
+        dump = codec.dumpb if binary else codec.dumps
+        _, prefix, id_sep, suffix = _ENVELOPES[compact, binary]
+        key = (code, message, compact, binary)
+        error_prefix = self._prefixes.get(key)
+        if error_prefix is None:
+            error_prefix = prefix + dump({'code': code, 'message': message}) + id_sep
+            if entry[1] is not None or message == _jsonrpc._ERROR_MESSAGES.get(code):
+                # bounded by the registered entries
+                self._prefixes[key] = error_prefix
+        return error_prefix + dump(_id) + suffix
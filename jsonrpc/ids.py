@@ -0,0 +1,43 @@
+import functools
+import itertools
+import os
+import random
+import uuid
+
+# Id generators are callables taking no arguments and returning a new id.
+
+
+def uuid_ids():
+    # random 32 character hex string (the historical default)
+    return lambda: uuid.uuid4().hex
+
+
+def counter_ids(start=1):
+    # per-process monotonic integers, thread-safe as count() is atomic
+    return itertools.count(start).__next__
+
+
+def prefixed_ids(prefix=None, start=1):
+    # unique strings across connections or processes sharing a peer, e.g. 'a1b2c3d4-1'
+    if prefix is None:
+        prefix = os.urandom(4).hex()
+    return map(f"{prefix}-{{}}".format, itertools.count(start)).__next__
+
+
+def random_ids(bits=64):
+    # non-cryptographic random integers; use bits=53 for javascript peers
+    return functools.partial(random.Random(os.urandom(16)).getrandbits, bits)
+
+
+_ID_GENERATOR = uuid_ids()
+
+
+def get_id_generator():
+    return _ID_GENERATOR
+
+
+def set_id_generator(generator):
+    if not callable(generator):
+        raise TypeError("id generator must be callable")
+    global _ID_GENERATOR
+    _ID_GENERATOR = generator
@@ -1,14 +1,16 @@
 # https://www.jsonrpc.org/specification
 import json
-import uuid
 import logging
-from urllib.parse import urlparse, parse_qs
+from collections.abc import Iterator, Mapping
+from urllib.parse import urlparse, unquote_plus
+
+from .codec import get_codec
+from .ids import get_id_generator
 
 logger = logging.getLogger(__name__)
 
 JSONRPC_VERSION='2.0'
 PARAM_KEY_TYPES = (str, )
-PARAM_VALUE_TYPES = PARAM_KEY_TYPES + (int, float)
 
 _SERVER_ERROR_RANGE = (-32099, -32000)
 
@@ -26,6 +28,13 @@ _BUILTIN_ERRORS = {
 }
 
 _SERVER_ERRORS = {}
+# messages of builtin and server errors, rebuilt by set_server_errors
+_ERROR_MESSAGES = dict(_BUILTIN_ERRORS)
+
+# params not validated yet
+_UNSET = object()
+# about the size of the chunks yielded by iter_response
+CHUNK_SIZE = 64 * 1024
 
 def set_server_errors(dict_like):
     errors = dict(dict_like)
@@ -34,16 +43,139 @@ def set_server_errors(dict_like):
     lower, upper = _SERVER_ERROR_RANGE
     if any(k not in range(lower, upper+1) for k in errors):
         raise ValueError("server error codes must be in the range -32768 to -32000")
-    global _SERVER_ERRORS
+    global _SERVER_ERRORS, _ERROR_MESSAGES
     _SERVER_ERRORS = errors
+    _ERROR_MESSAGES = {**_BUILTIN_ERRORS, **errors}
+    _ERROR_PREFIXES.clear()
+    _ERROR_PAYLOADS.clear()
+
+
+# pre-encoded response envelope fragments keyed by (compact, binary):
+# result prefix, error prefix, id separator, suffix
+_ENVELOPES = {
+    False: ('{"jsonrpc": "2.0", "result": ', '{"jsonrpc": "2.0", "error": ', ', "id": ', '}'),
+    True: ('{"jsonrpc":"2.0","result":', '{"jsonrpc":"2.0","error":', ',"id":', '}'),
+}
+_ENVELOPES = {
+    **{(compact, False): fragments for compact, fragments in _ENVELOPES.items()},
+    **{(compact, True): tuple(f.encode('utf8') for f in fragments) for compact, fragments in _ENVELOPES.items()},
+}
+# error response up to the id for builtin and server errors, keyed by (code, compact, binary)
+_ERROR_PREFIXES = {}
+# complete error responses with a null id, same keys
+_ERROR_PAYLOADS = {}
+
+
+def _envelope(codec, encoding, kwargs):
+    # returns (codec, binary) when a response can be spliced from pre-encoded
+    # fragments, or None when only the generic path gives the requested output
+    if kwargs and (kwargs.get('ensure_ascii', False) or any(k != 'ensure_ascii' for k in kwargs)):
+        return None
+    if encoding is None:
+        binary = False
+    elif encoding in ('utf8', 'utf-8'):
+        binary = True
+    else:
+        return None
+    codec = codec or get_codec()
+    if getattr(codec, 'binary', False):
+        # e.g. msgpack, packed whole
+        return None
+    return codec, binary
+
+
+def _dumps(obj, codec, encoding, kwargs):
+    if getattr(codec, 'binary', False):
+        # binary formats have no text form or formatting options
+        return codec.dumpb(obj)
+    ensure_ascii = kwargs.pop('ensure_ascii', False)
+    if ensure_ascii or kwargs:
+        # formatting options are only understood by stdlib json
+        r = json.dumps(obj, ensure_ascii=ensure_ascii, **kwargs)
+        return r.encode(encoding) if encoding else r
+    codec = codec or get_codec()
+    if encoding in ('utf8', 'utf-8'):
+        return codec.dumpb(obj)
+    r = codec.dumps(obj)
+    if encoding:
+        return r.encode(encoding)
+    return r
+
+
+def _iterencode(result, codec):
+    # the encoded result in pieces, member by member for arrays and objects
+    # and item by item for iterators, which are encoded as arrays
+    compact = getattr(codec, 'compact', False)
+    sep, colon = (',', ':') if compact else (', ', ': ')
+    dumps = codec.dumps
+    t = type(result)
+    if t is dict and all(type(k) is str for k in result):
+        yield '{'
+        first = True
+        for key, value in result.items():
+            yield ('' if first else sep) + dumps(key) + colon
+            yield dumps(value)
+            first = False
+        yield '}'
+    elif t is list or t is tuple or isinstance(result, Iterator):
+        yield '['
+        first = True
+        for item in result:
+            yield dumps(item) if first else sep + dumps(item)
+            first = False
+        yield ']'
+    else:
+        yield dumps(result)
+
+
+def _parse_query(query):
+    # as dict(parse_qsl(query)): the last value of each name, blank values dropped
+    d = {}
+    for pair in query.split('&'):
+        name, _, value = pair.partition('=')
+        if not value:
+            continue
+        if '%' in pair or '+' in pair:
+            name = unquote_plus(name)
+            value = unquote_plus(value)
+        d[name] = value
+    return d
+
+
+def _loads(data, codec, kwargs):
+    if kwargs:
+        return json.loads(data, **kwargs)
+    return (codec or get_codec()).loads(data)
+
+
+# request member with the seconds the client waits for the response, an
+# extension of JSON-RPC 2.0; relative so clocks needn't agree
+DEADLINE_MEMBER = 'timeout'
+
+
+def with_timeout(request, seconds, codec=None):
+    # the encoded request (not a batch) with a timeout member added
+    codec = codec or get_codec()
+    if getattr(codec, 'binary', False):
+        d = codec.loads(request)
+        d[DEADLINE_MEMBER] = seconds
+        return codec.dumpb(d)
+    end = request.rstrip()
+    if not end.endswith(b'}'):
+        raise ValueError("request must be an object")
+    separator, colon = (b',', b':') if getattr(codec, 'compact', False) else (b', ', b': ')
+    return end[:-1] + separator + codec.dumpb(DEADLINE_MEMBER) + colon + codec.dumpb(seconds) + b'}'
 
 
 class JSONCallError(Exception):
+    # instances still get a __dict__ from BaseException, but it is allocated lazily and
+    # stays empty while these live in slots (bench_memory: 289 -> 129 bytes per error)
+    __slots__ = ('code', 'message', 'data', '_id')
 
     def __init__(self, code, *args, message=None, data=None, _id=None, **kwargs):
         if not isinstance(code, int):
             raise TypeError(f"{self.__class__.__name__} requires integer for code")
-        code_msg = {**_BUILTIN_ERRORS, **_SERVER_ERRORS}.get(code, None)
+        code_msg = _ERROR_MESSAGES.get(code, None)
         if message is not None:
             if not isinstance(message, str):
                 raise TypeError(f"{self.__class__.__name__} string expected for message")
@@ -67,19 +199,38 @@ class JSONCallError(Exception):
             d['data'] = self.data
         return d
 
-    def response(self, encoding='utf8', **kwargs):
-        r = json.dumps(
-            {
-                'jsonrpc': JSONRPC_VERSION,
-                'error': self.values,
-                'id': self._id
-            },
-            ensure_ascii=kwargs.pop('ensure_ascii',False),
-            **kwargs
-        )
-        if encoding:
-            return r.encode(encoding)
-        return r
+    def response(self, encoding='utf8', codec=None, **kwargs):
+        envelope = _envelope(codec, encoding, kwargs)
+        if envelope is None:
+            return _dumps(self._response_values(), codec, encoding, kwargs)
+        return self._splice(envelope, self._id)
+
+    def _response_values(self):
+        return {
+            'jsonrpc': JSONRPC_VERSION,
+            'error': self.values,
+            'id': self._id
+        }
+
+    def _splice(self, envelope, _id):
+        codec, binary = envelope
+        compact = getattr(codec, 'compact', False)
+        dump = codec.dumpb if binary else codec.dumps
+        _, prefix, id_sep, suffix = _ENVELOPES[compact, binary]
+        if self.data or _ERROR_MESSAGES.get(self.code) != self.message:
+            return prefix + dump(self.values) + id_sep + dump(_id) + suffix
+        key = (self.code, compact, binary)
+        if _id is None:
+            payload = _ERROR_PAYLOADS.get(key)
+            if payload is not None:
+                return payload
+        error_prefix = _ERROR_PREFIXES.get(key)
+        if error_prefix is None:
+            error_prefix = _ERROR_PREFIXES[key] = prefix + dump(self.values) + id_sep
+        payload = error_prefix + dump(_id) + suffix
+        if _id is None:
+            _ERROR_PAYLOADS[key] = payload
+        return payload
 
     def __str__(self):
         return f"{self.message} [code {self.code}]"
@@ -98,6 +249,26 @@ class JSONCallError(Exception):
         return True
 
 
+class EncodedResult:
+    # A result already encoded as JSON text, e.g. received from another
+    # process. It is spliced into responses without being decoded.
+    __slots__ = ('data', )
+
+    def __init__(self, data):
+        if isinstance(data, str):
+            data = data.encode('utf8')
+        self.data = bytes(data)
+
+    def decode(self, codec=None):
+        return _loads(self.data, codec, None)
+
+    def __eq__(self, other):
+        return isinstance(other, EncodedResult) and self.data == other.data
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.data!r})"
+
+
 class JSONCall:
     FIELDS = [
         'jsonrpc',
@@ -105,24 +276,53 @@ class JSONCall:
         'params',
         'id'
     ]
+    __slots__ = (
+        'jsonrpc', 'method', '_raw_params', '_params', '_id',
+        '_result', '_error', 'success', 'codec'
+    )
 
-    def __init__(self, method, jsonrpc=None, params=None, _id=True, clean=True):
+    def __init__(self, method, jsonrpc=None, params=None, _id=True, clean=True, codec=None):
         self.jsonrpc = jsonrpc or JSONRPC_VERSION
+        self.codec = codec
         self.method = method
-        self.params = params
+        # validated on first access of params, args or kwargs
+        self._raw_params = params
+        self._params = _UNSET
         self._id = _id
-        self.kwargs = {}
-        self.args = []
         self._result = None
         self._error = None
         self.success = None
         self._clean()
-        
+
+    @property
+    def params(self):
+        if self._params is _UNSET:
+            params = self._raw_params
+            self._params = self._clean_params(params) if params else params
+        return self._params
+
+    @params.setter
+    def params(self, params):
+        self._raw_params = params
+        self._params = _UNSET
+
+    @property
+    def args(self):
+        params = self.params
+        return params if isinstance(params, list) else []
+
+    @property
+    def kwargs(self):
+        params = self.params
+        return params if isinstance(params, dict) else {}
+
     @property
     def result(self):
         if self.success is None:
             raise Exception("no result or error has been set")
         elif self.success is True:
+            if isinstance(self._result, EncodedResult):
+                return self._result.decode(self.codec)
             return self._result
         elif self.success is False:
             raise self._error
@@ -147,24 +347,23 @@ class JSONCall:
         raise JSONCallError(code=-32600, _id=_id)
 
     def _clean_params(self, params):
-        try:
-            params = dict(params)
-            if not all(isinstance(k, PARAM_KEY_TYPES) and isinstance(v, PARAM_VALUE_TYPES) for k,v in params.items()):
-                raise JSONCallError(-32602, _id=self._id)
+        # params are an object or an array of any json values; their values
+        # are checked per method, see jsonrpc.schema
+        if type(params) is dict or type(params) is list:
             return params
-        except (ValueError, TypeError):
-            if not isinstance(params, str):
-                params = list(params)
-            else:
-                raise JSONCallError(-32602, _id=self._id)
-            if not all(isinstance(v, PARAM_VALUE_TYPES) for v in params):
-                raise JSONCallError(-32602, _id=self._id)
-            return params 
+        if isinstance(params, Mapping):
+            return dict(params)
+        if isinstance(params, (str, bytes)):
+            raise JSONCallError(-32602, _id=self._id)
+        try:
+            return list(params)
+        except TypeError:
+            raise JSONCallError(-32602, _id=self._id)
 
     def _clean(self, ):
         if not self.is_notification:
             if self._id is True:
-                self._id = str(uuid.uuid4()).replace('-','')
+                self._id = get_id_generator()()
             elif self._id:
                 self._id = self._clean_id(self._id)
         if self.jsonrpc != JSONRPC_VERSION:
@@ -176,37 +375,36 @@ class JSONCall:
         elif self.method.startswith('rpc.'):
             raise JSONCallError(-32600, _id=self._id)
         self.method = str(self.method)
-        if self.params:
-            self.params = self._clean_params(self.params)
-            if isinstance(self.params, list):
-                self.args = self.params
-            else:
-                self.kwargs = self.params
 
     @classmethod
-    def from_request(cls, json_req):
+    def from_request(cls, json_req, codec=None):
         try:
-            d = json.loads(json_req)
+            d = _loads(json_req, codec, None)
         except Exception:
             raise JSONCallError(-32700)
         if isinstance(d, list):
-            raise NotImplementedError("batch calls not implemented")
+            return JSONBatch.from_list(d, codec=codec)
+        return cls.from_dict(d, codec=codec)
+
+    @classmethod
+    def from_dict(cls, d, codec=None):
+        if not isinstance(d, dict):
+            raise JSONCallError(-32600)
         # filter
         d = {k:v for k,v in d.items() if k in cls.FIELDS}
         # fix id field name clash
         d['_id'] = d.pop('id') if 'id' in d else False
-        return cls(d.pop('method', None), **d)
+        return cls(d.pop('method', None), codec=codec, **d)
 
     @classmethod
-    def from_url(cls, url):
+    def from_url(cls, url, codec=None):
         url_parts = urlparse(url)
         # use only last value for key in query string
-        d = {
-            k:v[-1] for k,v in parse_qs(url_parts.query).items()
-        }
-        if 'method' not in d:
-            d['method'] = url_parts.path
-        return cls.from_request(json.dumps(d, ensure_ascii=False))
+        d = _parse_query(url_parts.query)
+        return cls(
+            d.get('method', url_parts.path), jsonrpc=d.get('jsonrpc'), params=d.get('params'),
+            _id=d.get('id', False), codec=codec
+        )
 
     def set_result(self, result):
         if self.is_notification:
@@ -216,37 +414,97 @@ class JSONCall:
         self.success = True
 
     def set_error(self, code, message=None, data=None):
+        # code may also be a JSONCallError
         if self.is_notification:
             raise Exception("cannot set error on a notification")
-        self._error = JSONCallError(code, message=message, data=data)
+        if isinstance(code, JSONCallError):
+            self._error = code
+        else:
+            self._error = JSONCallError(code, message=message, data=data)
         self._result = None
         self.success = False
 
     def response(self, encoding='utf8', **kwargs):
-        resp = {'jsonrpc': self.jsonrpc}
         if self.is_notification:
             raise ValueError("notifications have no response")
-        elif self.success is None:
+        envelope = _envelope(self.codec, encoding, kwargs)
+        if envelope is not None:
+            if self.success is True:
+                codec, binary = envelope
+                dump = codec.dumpb if binary else codec.dumps
+                prefix, _, id_sep, suffix = _ENVELOPES[getattr(codec, 'compact', False), binary]
+                result = self._result
+                if isinstance(result, EncodedResult):
+                    result = result.data if binary else result.data.decode('utf8')
+                else:
+                    try:
+                        result = dump(result)
+                    except TypeError:
+                        if not isinstance(result, Iterator):
+                            raise
+                        result = dump(self._materialize())
+                return prefix + result + id_sep + dump(self._id) + suffix
+            elif self.success is False:
+                return self._error._splice(envelope, self._id)
+        if self.success is True and isinstance(self._result, Iterator):
+            self._materialize()
+        return _dumps(self._response_values(), self.codec, encoding, kwargs)
+
+    def _materialize(self):
+        # iterator results are sent as arrays, streamed by iter_response only;
+        # an iterator failing here fails the response, see _encode_response
+        if isinstance(self._result, Iterator):
+            self._result = list(self._result)
+        return self._result
+
+    def iter_response(self, chunk_size=CHUNK_SIZE):
+        # yields the utf8 response in chunks of about chunk_size, encoding
+        # arrays and objects member by member and iterators item by item, so
+        # memory is bounded by the chunk size and the largest item rather
+        # than the result
+        if self.is_notification:
+            raise ValueError("notifications have no response")
+        codec = self.codec or get_codec()
+        result = self._result
+        if self.success is not True or getattr(codec, 'binary', False) or isinstance(result, EncodedResult):
+            yield self.response()
+            return
+        prefix, _, id_sep, suffix = _ENVELOPES[getattr(codec, 'compact', False), False]
+        pieces = [prefix]
+        size = 0
+        for piece in _iterencode(result, codec):
+            pieces.append(piece)
+            size += len(piece)
+            if size >= chunk_size:
+                yield ''.join(pieces).encode('utf8')
+                pieces = []
+                size = 0
+        pieces += [id_sep, codec.dumps(self._id), suffix]
+        yield ''.join(pieces).encode('utf8')
+
+    def _response_values(self):
+        resp = {'jsonrpc': self.jsonrpc}
+        if self.success is None:
             raise ValueError("no result or error has been set")
         elif self.success is True:
-            resp['result'] = self._result
+            resp['result'] = self.result
         elif self.success is False:
             resp['error'] = self._error.values
         else:
             raise Exception("internal error")
         if self._id is not False:
             resp['id'] = self._id
-        r = json.dumps(resp, ensure_ascii=kwargs.pop('ensure_ascii',False), **kwargs)
-        if encoding:
-            return r.encode(encoding)
-        return r
+        return resp
 
     def assign_response(self, response, **kwargs):
         try:
-            r = json.loads(response, **kwargs)
+            r = _loads(response, self.codec, kwargs)
         except Exception:
             self.set_error(code=-32700)
             raise self._error
+        self._assign(r)
+
+    def _assign(self, r):
         if r['id'] != self._id:
             raise Exception("Response id doesn't match this call.")
         if 'result' in r:
@@ -274,12 +532,13 @@ class JSONCall:
         return d
 
     def request(self, encoding='utf8', **kwargs):
-        if encoding:
-            return str(self).encode(encoding)
-        return str(self)
+        return _dumps(self.values, self.codec, encoding, {})
 
     def __str__(self):
-        return json.dumps(self.values, ensure_ascii=False)
+        codec = self.codec or get_codec()
+        if getattr(codec, 'binary', False):
+            return repr(self.values)
+        return codec.dumps(self.values)
 
     def __eq__(self, other):
         fields = self.FIELDS + ['_id', 'values', 'success', '_error', '_result']
@@ -294,5 +553,177 @@ class JSONCall:
         if self.success is not None and self.response() != other.response():
             return False
         return True
-        
 
+
+def _set_exception(call, exc, errors=None):
+    # store the error for an exception raised while handling call; errors is
+    # an ErrorRegistry mapping exceptions, others become internal errors
+    if isinstance(exc, JSONCallError):
+        error = exc
+    elif errors is not None and errors.resolve(type(exc)) is not None:
+        error = errors.error_for(exc, _id=call._id)
+    else:
+        logger.error("handler failed for method %s", call.method, exc_info=exc)
+        error = JSONCallError(-32603, _id=call._id)
+    if not call.is_notification:
+        call.set_error(error)
+
+
+def _encode_response(call, errors=None, encoding='utf8', **kwargs):
+    # the response of a call; a result that can't be encoded (e.g. a set) is
+    # answered with the error its exception maps to, as if the handler raised
+    try:
+        return call.response(encoding=encoding, **kwargs)
+    except Exception as exc:
+        _set_exception(call, exc, errors)
+    try:
+        return call.response(encoding=encoding, **kwargs)
+    except Exception:
+        # nor can the data of the mapped error
+        logger.error("error response failed to encode for method %s", call.method, exc_info=True)
+        call.set_error(JSONCallError(-32603, _id=call._id))
+        return call.response(encoding=encoding, **kwargs)
+
+
+def _apply(handler, call, errors=None):
+    # run handler for a single call, storing its result or error
+    try:
+        result = handler(call)
+    except Exception as exc:
+        _set_exception(call, exc, errors)
+    else:
+        if not call.is_notification:
+            call.set_result(result)
+
+
+class JSONBatch:
+
+    def __init__(self, items, codec=None):
+        self.items = list(items)
+        if not self.items:
+            raise JSONCallError(-32600)
+        # error responses which could not be matched to a call
+        self.unmatched = []
+        self.codec = codec
+
+    @classmethod
+    def from_request(cls, json_req, codec=None):
+        try:
+            d = _loads(json_req, codec, None)
+        except Exception:
+            raise JSONCallError(-32700)
+        if not isinstance(d, list):
+            raise JSONCallError(-32600)
+        return cls.from_list(d, codec=codec)
+
+    @classmethod
+    def from_list(cls, elements, codec=None):
+        if not elements:
+            raise JSONCallError(-32600)
+        items = []
+        for element in elements:
+            try:
+                items.append(JSONCall.from_dict(element, codec=codec))
+            except JSONCallError as error:
+                items.append(error)
+        return cls(items, codec=codec)
+
+    @property
+    def calls(self):
+        return [item for item in self.items if isinstance(item, JSONCall)]
+
+    @property
+    def errors(self):
+        return [item for item in self.items if isinstance(item, JSONCallError)]
+
+    @property
+    def is_notification(self):
+        return all(
+            isinstance(item, JSONCall) and item.is_notification for item in self.items
+        )
+
+    def dispatch(self, handler, executor=None, errors=None):
+        # handler is called with each valid call and returns its result;
+        # calls are independent so they can be run concurrently by an executor
+        calls = self.calls
+        if executor is None:
+            for call in calls:
+                _apply(handler, call, errors)
+        else:
+            for future in [executor.submit(_apply, handler, call, errors) for call in calls]:
+                future.result()
+        return self
+
+    def response(self, encoding='utf8', errors=None, **kwargs):
+        # a call whose result fails to encode is answered with an error, see
+        # _encode_response; errors is the ErrorRegistry mapping the exception
+        items = [
+            item for item in self.items
+            if isinstance(item, JSONCallError) or not item.is_notification
+        ]
+        # nothing is returned for all notification batches
+        if not items:
+            return None
+        if getattr(self.codec, 'binary', False):
+            try:
+                return self.codec.dumpb([item._response_values() for item in items])
+            except Exception:
+                # find the calls which failed
+                for item in items:
+                    if isinstance(item, JSONCall):
+                        _encode_response(item, errors)
+                return self.codec.dumpb([item._response_values() for item in items])
+        separator = ',' if getattr(self.codec, 'compact', False) else ', '
+        r = '[' + separator.join(
+            item.response(encoding=None, codec=self.codec, **kwargs) if isinstance(item, JSONCallError)
+            else _encode_response(item, errors, encoding=None, **kwargs)
+            for item in items
+        ) + ']'
+        if encoding:
+            return r.encode(encoding)
+        return r
+
+    def request(self, encoding='utf8'):
+        if getattr(self.codec, 'binary', False):
+            return self.codec.dumpb([call.values for call in self.calls])
+        r = '[' + ', '.join(call.request(encoding=None) for call in self.calls) + ']'
+        if encoding:
+            return r.encode(encoding)
+        return r
+
+    def assign_response(self, response, codec=None, **kwargs):
+        try:
+            r = _loads(response, codec or self.codec, kwargs)
+        except Exception:
+            raise JSONCallError(-32700)
+        if isinstance(r, dict):
+            # the batch as a whole was rejected
+            if 'error' in r:
+                raise JSONCallError(
+                    r['error']['code'],
+                    message=r['error']['message'],
+                    data=r['error'].get('data')
+                )
+            raise Exception("batch response must be an array")
+        pending = {call._id: call for call in self.calls if not call.is_notification}
+        for resp in r:
+            call = pending.pop(resp.get('id'), None)
+            if call is None:
+                if 'error' in resp:
+                    self.unmatched.append(JSONCallError(
+                        resp['error']['code'],
+                        message=resp['error']['message'],
+                        data=resp['error'].get('data')
+                    ))
+                    continue
+                raise Exception("Response id doesn't match any call in this batch.")
+            try:
+                call._assign(resp)
+            except JSONCallError:
+                pass
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
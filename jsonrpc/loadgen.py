@@ -0,0 +1,374 @@
+# Load generator measuring client -> server -> client round trips of
+# JSON-RPC calls over loopback sockets or an in-process socket pair.
+# Run with: python -m jsonrpc.loadgen --help
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import random
+import shutil
+import socket
+import tempfile
+import time
+
+from .aio import AsyncDispatcher
+from .jsonrpc import JSONCall, JSONBatch, JSONCallError
+from .stream import StreamDecoder, encode_frame
+from .transport import Server, READ_SIZE
+
+logger = logging.getLogger(__name__)
+
+TRANSPORTS = ('pipe', 'tcp', 'unix')
+PERCENTILES = (50, 75, 90, 99, 99.9, 99.99, 100)
+
+
+class Histogram:
+    # Latencies in buckets whose width grows with the value, as HdrHistogram:
+    # values are kept with a relative error below 2 ** -(sub_bits - 1),
+    # under 1% by default, in a few hundred buckets whatever the range.
+
+    def __init__(self, sub_bits=8, unit=1e-6):
+        self.sub_bits = sub_bits
+        # seconds per recorded integer value, microseconds by default
+        self.unit = unit
+        self._half = 1 << (sub_bits - 1)
+        # bucket index: count
+        self.counts = {}
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def _index(self, value):
+        if value < 2 * self._half:
+            return value
+        shift = value.bit_length() - self.sub_bits
+        return shift * self._half + (value >> shift)
+
+    def _highest(self, index):
+        # the highest value of a bucket
+        if index < 2 * self._half:
+            return index
+        shift = index // self._half - 1
+        return ((index - shift * self._half + 1) << shift) - 1
+
+    def record(self, seconds):
+        value = max(int(seconds / self.unit), 0)
+        index = self._index(value)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other):
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        for name, pick in [('min', min), ('max', max)]:
+            values = [v for v in (getattr(self, name), getattr(other, name)) if v is not None]
+            setattr(self, name, pick(values) if values else None)
+        return self
+
+    def _at(self, percent):
+        # (highest value equivalent to that at percent, values up to its bucket)
+        rank = max(1, -(-self.count * percent // 100))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(self._highest(index), self.max), seen
+        return self.max, seen
+
+    def percentile(self, percent):
+        # in seconds
+        if not self.count:
+            return 0.0
+        return self._at(percent)[0] * self.unit
+
+    @property
+    def mean(self):
+        return self.total * self.unit / self.count if self.count else 0.0
+
+    def summary(self, percentiles=PERCENTILES):
+        return {
+            'count': self.count,
+            'mean': self.mean,
+            'min': (self.min or 0) * self.unit,
+            'percentiles': {str(p): self.percentile(p) for p in percentiles},
+        }
+
+    def format(self, percentiles=PERCENTILES):
+        lines = [f"{'percentile':>10} {'latency ms':>12} {'count':>10}"]
+        for p in percentiles:
+            value, seen = self._at(p) if self.count else (0, 0)
+            lines.append(f"{p:>10} {value * self.unit * 1e3:>12.3f} {seen:>10}")
+        return '\n'.join(lines)
+
+
+def make_dispatcher():
+    # the methods load is generated for
+    dispatcher = AsyncDispatcher()
+    dispatcher.register(lambda payload: payload, name='echo')
+
+    def fail(payload):
+        # an error response, without the logging of unexpected exceptions
+        raise JSONCallError(1, message="requested failure")
+    dispatcher.register(fail)
+    return dispatcher
+
+
+def parse_mix(text):
+    # "64:9,16384:1" -> [(64, 9.0), (16384, 1.0)], payload sizes in bytes and their weights
+    mix = []
+    for part in text.split(','):
+        size, _, weight = part.partition(':')
+        mix.append((int(size), float(weight or 1)))
+    return mix
+
+
+class Workload:
+    # Builds the calls sent: an echo of a string of a size drawn from mix,
+    # a failing call with error_ratio, and batch_size calls at once with
+    # batch_ratio.
+
+    def __init__(self, mix=((64, 1), ), batch_ratio=0.0, batch_size=10, error_ratio=0.0, seed=None):
+        self.sizes = [size for size, _ in mix]
+        self.weights = [weight for _, weight in mix]
+        self.batch_ratio = batch_ratio
+        self.batch_size = batch_size
+        self.error_ratio = error_ratio
+        self.random = random.Random(seed)
+        self._payloads = {size: 'x' * size for size in self.sizes}
+        self._id = 0
+
+    def call(self):
+        self._id += 1
+        method = 'fail' if self.random.random() < self.error_ratio else 'echo'
+        size = self.random.choices(self.sizes, self.weights)[0]
+        return JSONCall(method, params=[self._payloads[size]], _id=self._id)
+
+    def message(self):
+        if self.random.random() < self.batch_ratio:
+            return JSONBatch([self.call() for _ in range(self.batch_size)])
+        return self.call()
+
+
+class _Link:
+    # a connection with one message in flight
+    def __init__(self, reader, writer, framing='ndjson'):
+        self.reader = reader
+        self.writer = writer
+        self.framing = framing
+        self.decoder = StreamDecoder(framing=framing)
+
+    async def roundtrip(self, request):
+        self.writer.write(encode_frame(request, self.framing))
+        while True:
+            data = await self.reader.read(READ_SIZE)
+            if not data:
+                raise ConnectionError("connection closed by server")
+            frames = self.decoder.feed_frames(data)
+            if frames:
+                return frames[0]
+
+    def close(self):
+        self.writer.close()
+
+
+class Stats:
+    def __init__(self):
+        self.latency = Histogram()
+        self.requests = 0
+        self.calls = 0
+        self.errors = 0
+        self.elapsed = 0.0
+
+    def record(self, message, response, seconds):
+        self.latency.record(seconds)
+        self.requests += 1
+        if isinstance(message, JSONBatch):
+            message.assign_response(response)
+            calls = message.calls
+        else:
+            calls = [message]
+            try:
+                message.assign_response(response)
+            except JSONCallError:
+                pass
+        self.calls += len(calls)
+        self.errors += sum(1 for call in calls if call.success is False)
+
+
+async def _closed_loop(links, workload, stats, duration):
+    # each link sends its next request once it has the response
+    deadline = time.monotonic() + duration
+
+    async def run(link):
+        while time.monotonic() < deadline:
+            message = workload.message()
+            request = message.request()
+            start = time.perf_counter()
+            response = await link.roundtrip(request)
+            stats.record(message, response, time.perf_counter() - start)
+    await asyncio.gather(*[run(link) for link in links])
+
+
+async def _open_loop(links, workload, stats, duration, rate):
+    # requests are due at a fixed rate whether or not earlier ones were
+    # answered; latency counts from when a request was due, so waiting for a
+    # free link is measured instead of hidden
+    free = asyncio.Queue()
+    for link in links:
+        free.put_nowait(link)
+    start = time.perf_counter()
+    tasks = []
+
+    async def send(due):
+        link = await free.get()
+        try:
+            message = workload.message()
+            response = await link.roundtrip(message.request())
+            stats.record(message, response, time.perf_counter() - due)
+        finally:
+            free.put_nowait(link)
+    for n in range(int(duration * rate)):
+        due = start + n / rate
+        delay = due - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.ensure_future(send(due)))
+    await asyncio.gather(*tasks)
+
+
+def _serve_process(transport, address, queue):
+    async def main():
+        server = Server(make_dispatcher())
+        if transport == 'unix':
+            await server.start(path=address)
+        else:
+            await server.start(*address)
+        queue.put(server.address)
+        await server.serve_forever()
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
+
+
+async def _connect(transport, address):
+    if transport == 'unix':
+        return await asyncio.open_unix_connection(address)
+    return await asyncio.open_connection(*address[:2])
+
+
+async def run(
+    transport='pipe', mode='closed', concurrency=8, rate=1000.0, duration=5.0, workload=None, address=None
+):
+    # Returns Stats. Over tcp and unix a server process is started unless
+    # address gives one serving echo and fail (see make_dispatcher); pipe
+    # serves socket pairs in this process.
+    if transport not in TRANSPORTS:
+        raise ValueError(f"unknown transport {transport}: expected one of {', '.join(TRANSPORTS)}")
+    workload = workload or Workload()
+    stats = Stats()
+    process = server = directory = None
+    serving = []
+    links = []
+    try:
+        if transport == 'pipe':
+            server = Server(make_dispatcher())
+            pairs = [socket.socketpair() for _ in range(concurrency)]
+            serving = [asyncio.ensure_future(server.serve_socket(theirs)) for _, theirs in pairs]
+            links = [_Link(*await asyncio.open_connection(sock=ours)) for ours, _ in pairs]
+        else:
+            if address is None:
+                queue = multiprocessing.Queue()
+                if transport == 'unix':
+                    directory = tempfile.mkdtemp()
+                    bind = os.path.join(directory, 'loadgen.sock')
+                else:
+                    bind = ('127.0.0.1', 0)
+                process = multiprocessing.Process(target=_serve_process, args=(transport, bind, queue), daemon=True)
+                process.start()
+                address = queue.get(timeout=30)
+            for _ in range(concurrency):
+                links.append(_Link(*await _connect(transport, address)))
+        started = time.perf_counter()
+        try:
+            if mode == 'closed':
+                await _closed_loop(links, workload, stats, duration)
+            elif mode == 'open':
+                await _open_loop(links, workload, stats, duration, rate)
+            else:
+                raise ValueError(f"unknown mode {mode}: expected closed or open")
+        finally:
+            stats.elapsed = time.perf_counter() - started
+    finally:
+        for link in links:
+            link.close()
+        if serving:
+            await asyncio.gather(*serving, return_exceptions=True)
+        if process is not None:
+            process.terminate()
+            process.join()
+        if directory is not None:
+            shutil.rmtree(directory, ignore_errors=True)
+    return stats
+
+
+def report(stats):
+    return {
+        'requests': stats.requests,
+        'calls': stats.calls,
+        'errors': stats.errors,
+        'seconds': stats.elapsed,
+        'requests_per_second': stats.requests / stats.elapsed if stats.elapsed else 0.0,
+        'latency': stats.latency.summary(),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="round trip throughput and latency of JSON-RPC calls over loopback")
+    parser.add_argument('--transport', choices=TRANSPORTS, default='pipe', help="pipe: socket pairs in this process")
+    parser.add_argument('--connect', metavar='HOST:PORT|PATH', help="an already running server, with echo and fail methods")
+    parser.add_argument('--mode', choices=['closed', 'open'], default='closed',
+                        help="closed: each connection waits for its response; open: requests sent at --rate")
+    parser.add_argument('--concurrency', type=int, default=8, help="connections, each with one request in flight")
+    parser.add_argument('--rate', type=float, default=1000.0, help="requests per second in open mode")
+    parser.add_argument('--duration', type=float, default=5.0, help="seconds")
+    parser.add_argument('--payload', type=parse_mix, default='64', metavar='SIZE:WEIGHT,...',
+                        help="sizes of echoed strings and their weights, e.g. 64:9,16384:1")
+    parser.add_argument('--batch-ratio', type=float, default=0.0, help="fraction of requests sent as batches")
+    parser.add_argument('--batch-size', type=int, default=10)
+    parser.add_argument('--error-ratio', type=float, default=0.0, help="fraction of calls that fail")
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--json', action='store_true', help="print the report as json")
+    args = parser.parse_args(argv)
+    address = None
+    if args.connect:
+        host, _, port = args.connect.rpartition(':')
+        address = args.connect if args.transport == 'unix' else (host, int(port))
+    workload = Workload(
+        mix=args.payload, batch_ratio=args.batch_ratio, batch_size=args.batch_size,
+        error_ratio=args.error_ratio, seed=args.seed
+    )
+    stats = asyncio.run(run(
+        args.transport, mode=args.mode, concurrency=args.concurrency, rate=args.rate,
+        duration=args.duration, workload=workload, address=address
+    ))
+    result = report(stats)
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return result
+    print(f"{result['requests']} requests, {result['calls']} calls, {result['errors']} errors in {result['seconds']:.2f}s")
+    print(f"{result['requests_per_second']:.0f} requests/s, mean latency {stats.latency.mean * 1e3:.3f} ms")
+    print(stats.latency.format())
+    return result
+
+
+if __name__ == '__main__':
+    main()
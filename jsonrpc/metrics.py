@@ -0,0 +1,205 @@
+import logging
+import threading
+import weakref
+from bisect import bisect_left
+
+logger = logging.getLogger(__name__)
+
+# upper bounds, in seconds and bytes
+LATENCY_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+SIZE_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+
+class _Histogram:
+    __slots__ = ('bounds', 'counts', 'sum')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        # the last count is for values above all bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    def values(self):
+        return {
+            'buckets': list(self.bounds),
+            'counts': list(self.counts),
+            'sum': self.sum,
+            'count': sum(self.counts),
+        }
+
+
+class _Accumulator:
+    # written by a single thread only
+    __slots__ = ('thread', 'latency', 'errors', 'parse_failures', 'request_size', 'response_size')
+
+    def __init__(self, size_buckets):
+        # a weak reference to the owning thread
+        self.thread = weakref.ref(threading.current_thread())
+        self.latency = {}
+        self.errors = {}
+        self.parse_failures = 0
+        self.request_size = _Histogram(size_buckets)
+        self.response_size = _Histogram(size_buckets)
+
+    @property
+    def retired(self):
+        # once its thread has ended nothing is written to it anymore
+        thread = self.thread()
+        return thread is None or not thread.is_alive()
+
+    def values(self):
+        return {
+            # copied first as the owning thread may be adding keys
+            'latency': {m: h.values() for m, h in dict(self.latency).items()},
+            'errors': dict(self.errors),
+            'parse_failures': self.parse_failures,
+            'request_size': self.request_size.values(),
+            'response_size': self.response_size.values(),
+        }
+
+
+def _merge_histogram(into, values):
+    if into is None:
+        return {**values, 'counts': list(values['counts'])}
+    if into['buckets'] != values['buckets']:
+        raise ValueError("histograms have different buckets")
+    into['counts'] = [a + b for a, b in zip(into['counts'], values['counts'])]
+    into['sum'] += values['sum']
+    into['count'] += values['count']
+    return into
+
+
+def merge_snapshots(snapshots):
+    # combine snapshots, e.g. of several processes
+    merged = {'latency': {}, 'errors': {}, 'parse_failures': 0, 'request_size': None, 'response_size': None}
+    for snapshot in snapshots:
+        for method, values in snapshot['latency'].items():
+            merged['latency'][method] = _merge_histogram(merged['latency'].get(method), values)
+        for code, count in snapshot['errors'].items():
+            # keys become strings in json
+            code = int(code)
+            merged['errors'][code] = merged['errors'].get(code, 0) + count
+        merged['parse_failures'] += snapshot['parse_failures']
+        for name in ['request_size', 'response_size']:
+            merged[name] = _merge_histogram(merged[name], snapshot[name])
+    return merged
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _bound(value):
+    return '+Inf' if value is None else repr(float(value))
+
+
+class Metrics:
+    # Recording only touches an accumulator private to the calling thread, so
+    # the hot path takes no lock. Accumulators are merged when scraped, and
+    # those of ended threads are folded into a retired total.
+
+    def __init__(self, latency_buckets=LATENCY_BUCKETS, size_buckets=SIZE_BUCKETS):
+        self.latency_buckets = tuple(sorted(latency_buckets))
+        self.size_buckets = tuple(sorted(size_buckets))
+        self._local = threading.local()
+        self._accumulators = []
+        # merged values of the accumulators of ended threads
+        self._retired = None
+        # accumulators are also pruned when there are this many
+        self._prune_at = 64
+        self._lock = threading.Lock()
+
+    def _accumulator(self):
+        try:
+            return self._local.accumulator
+        except AttributeError:
+            accumulator = _Accumulator(self.size_buckets)
+            with self._lock:
+                self._accumulators.append(accumulator)
+                if len(self._accumulators) >= self._prune_at:
+                    self._prune()
+                    self._prune_at = max(64, 2 * len(self._accumulators))
+            self._local.accumulator = accumulator
+            return accumulator
+
+    def _prune(self):
+        # with the lock held
+        retired = [a for a in self._accumulators if a.retired]
+        if not retired:
+            return
+        self._accumulators = [a for a in self._accumulators if not a.retired]
+        snapshots = [a.values() for a in retired]
+        if self._retired is not None:
+            snapshots.append(self._retired)
+        self._retired = merge_snapshots(snapshots)
+
+    def observe_latency(self, method, seconds):
+        latency = self._accumulator().latency
+        histogram = latency.get(method)
+        if histogram is None:
+            histogram = latency[method] = _Histogram(self.latency_buckets)
+        histogram.observe(seconds)
+
+    def count_error(self, code):
+        errors = self._accumulator().errors
+        errors[code] = errors.get(code, 0) + 1
+
+    def count_parse_failure(self):
+        self._accumulator().parse_failures += 1
+
+    def observe_request_size(self, size):
+        self._accumulator().request_size.observe(size)
+
+    def observe_response_size(self, size):
+        self._accumulator().response_size.observe(size)
+
+    def snapshot(self):
+        with self._lock:
+            self._prune()
+            accumulators = list(self._accumulators)
+            retired = self._retired
+        snapshots = [accumulator.values() for accumulator in accumulators]
+        if retired is not None:
+            snapshots.append(retired)
+        merged = merge_snapshots(snapshots)
+        for name in ['request_size', 'response_size']:
+            merged[name] = merged[name] or _Histogram(self.size_buckets).values()
+        return merged
+
+    def prometheus(self, prefix='jsonrpc', snapshot=None):
+        # text exposition format
+        snapshot = self.snapshot() if snapshot is None else snapshot
+        lines = []
+
+        def histogram(name, values, labels=''):
+            # labels is '' or 'name="value",'
+            cumulative = 0
+            for bound, count in zip(values['buckets'] + [None], values['counts']):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{labels}le="{_bound(bound)}"}} {cumulative}')
+            labels = f'{{{labels[:-1]}}}' if labels else ''
+            lines.append(f'{name}_sum{labels} {values["sum"]}')
+            lines.append(f'{name}_count{labels} {values["count"]}')
+
+        name = f'{prefix}_request_duration_seconds'
+        lines += [f'# HELP {name} Handler latency per method.', f'# TYPE {name} histogram']
+        for method, values in sorted(snapshot['latency'].items()):
+            histogram(name, values, labels=f'method="{_escape(method)}",')
+        name = f'{prefix}_errors_total'
+        lines += [f'# HELP {name} Error responses per code.', f'# TYPE {name} counter']
+        for code, count in sorted(snapshot['errors'].items()):
+            lines.append(f'{name}{{code="{code}"}} {count}')
+        name = f'{prefix}_parse_failures_total'
+        lines += [f'# HELP {name} Requests that could not be parsed.', f'# TYPE {name} counter']
+        lines.append(f'{name} {snapshot["parse_failures"]}')
+        for kind in ['request', 'response']:
+            name = f'{prefix}_{kind}_size_bytes'
+            lines += [f'# HELP {name} Size of {kind}s.', f'# TYPE {name} histogram']
+            histogram(name, snapshot[f'{kind}_size'])
+        return '\n'.join(lines) + '\n'
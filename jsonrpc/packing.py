@@ -0,0 +1,242 @@
+import logging
+import struct
+
+logger = logging.getLogger(__name__)
+
+# MessagePack (https://github.com/msgpack/msgpack/blob/master/spec.md) for
+# the json types plus bytes, which are packed as bin without base64. The
+# msgpack library is used when installed; both give the same bytes. Lists of
+# floats are packed and unpacked by struct in one call, as numeric arrays are
+# what binary formats are mostly chosen for.
+
+_FLOAT = 0xcb
+_PACK_FLOAT = struct.Struct('>Bd').pack
+_UNPACK = {
+    0xca: struct.Struct('>f'), 0xcb: struct.Struct('>d'),
+    0xcc: struct.Struct('>B'), 0xcd: struct.Struct('>H'), 0xce: struct.Struct('>I'), 0xcf: struct.Struct('>Q'),
+    0xd0: struct.Struct('>b'), 0xd1: struct.Struct('>h'), 0xd2: struct.Struct('>i'), 0xd3: struct.Struct('>q'),
+}
+# (size of the length, types) by first byte, for str, bin, array and map
+_LENGTHS = {
+    0xd9: (1, str), 0xda: (2, str), 0xdb: (4, str),
+    0xc4: (1, bytes), 0xc5: (2, bytes), 0xc6: (4, bytes),
+    0xdc: (2, list), 0xdd: (4, list),
+    0xde: (2, dict), 0xdf: (4, dict),
+}
+_LENGTH_FORMATS = {1: struct.Struct('>B'), 2: struct.Struct('>H'), 4: struct.Struct('>I')}
+
+
+def _pack_int(n, out):
+    if 0 <= n < 0x80:
+        out.append(bytes((n, )))
+    elif -32 <= n < 0:
+        out.append(bytes((n & 0xff, )))
+    elif n >= 0:
+        if n <= 0xff:
+            out.append(struct.pack('>BB', 0xcc, n))
+        elif n <= 0xffff:
+            out.append(struct.pack('>BH', 0xcd, n))
+        elif n <= 0xffffffff:
+            out.append(struct.pack('>BI', 0xce, n))
+        elif n <= 0xffffffffffffffff:
+            out.append(struct.pack('>BQ', 0xcf, n))
+        else:
+            raise ValueError("integer out of range for msgpack")
+    else:
+        if n >= -0x80:
+            out.append(struct.pack('>Bb', 0xd0, n))
+        elif n >= -0x8000:
+            out.append(struct.pack('>Bh', 0xd1, n))
+        elif n >= -0x80000000:
+            out.append(struct.pack('>Bi', 0xd2, n))
+        elif n >= -0x8000000000000000:
+            out.append(struct.pack('>Bq', 0xd3, n))
+        else:
+            raise ValueError("integer out of range for msgpack")
+
+
+def _pack_header(size, fix, fix_max, codes, out):
+    # codes are the first bytes for 8 (or None), 16 and 32 bit lengths
+    if size <= fix_max:
+        out.append(bytes((fix | size, )))
+    elif codes[0] is not None and size <= 0xff:
+        out.append(struct.pack('>BB', codes[0], size))
+    elif size <= 0xffff:
+        out.append(struct.pack('>BH', codes[1], size))
+    elif size <= 0xffffffff:
+        out.append(struct.pack('>BI', codes[2], size))
+    else:
+        raise ValueError("object too large for msgpack")
+
+
+def _pack(obj, out):
+    t = type(obj)
+    if t is str:
+        data = obj.encode('utf8')
+        _pack_header(len(data), 0xa0, 31, (0xd9, 0xda, 0xdb), out)
+        out.append(data)
+    elif t is int:
+        _pack_int(obj, out)
+    elif t is float:
+        out.append(_PACK_FLOAT(_FLOAT, obj))
+    elif obj is None:
+        out.append(b'\xc0')
+    elif t is bool:
+        out.append(b'\xc3' if obj else b'\xc2')
+    elif t is list or t is tuple:
+        _pack_header(len(obj), 0x90, 15, (None, 0xdc, 0xdd), out)
+        if obj and all(type(v) is float for v in obj):
+            values = [None] * (2 * len(obj))
+            values[::2] = [_FLOAT] * len(obj)
+            values[1::2] = obj
+            out.append(struct.pack('>' + 'Bd' * len(obj), *values))
+        else:
+            for value in obj:
+                _pack(value, out)
+    elif t is dict:
+        _pack_header(len(obj), 0x80, 15, (None, 0xde, 0xdf), out)
+        for key, value in obj.items():
+            _pack(key, out)
+            _pack(value, out)
+    elif isinstance(obj, (bytes, bytearray, memoryview)):
+        data = bytes(obj)
+        _pack_header(len(data), 0, -1, (0xc4, 0xc5, 0xc6), out)
+        out.append(data)
+    elif isinstance(obj, int):
+        _pack_int(int(obj), out)
+    elif isinstance(obj, float):
+        _pack(float(obj), out)
+    elif isinstance(obj, str):
+        _pack(str(obj), out)
+    elif isinstance(obj, (list, tuple)):
+        _pack(list(obj), out)
+    elif isinstance(obj, dict):
+        _pack(dict(obj), out)
+    else:
+        raise TypeError(f"Object of type {t.__name__} is not msgpack serializable")
+
+
+def packb(obj):
+    out = []
+    _pack(obj, out)
+    return b''.join(out)
+
+
+def _unpack(data, pos):
+    # returns (object, end)
+    code = data[pos]
+    pos += 1
+    if code < 0x80:
+        return code, pos
+    elif code >= 0xe0:
+        return code - 0x100, pos
+    elif code & 0xe0 == 0xa0:
+        end = pos + (code & 0x1f)
+        if end > len(data):
+            raise ValueError("truncated msgpack data")
+        return data[pos:end].decode('utf8'), end
+    elif code & 0xf0 == 0x90:
+        return _unpack_array(data, pos, code & 0x0f)
+    elif code & 0xf0 == 0x80:
+        return _unpack_map(data, pos, code & 0x0f)
+    elif code == 0xc0:
+        return None, pos
+    elif code == 0xc2:
+        return False, pos
+    elif code == 0xc3:
+        return True, pos
+    elif code in _UNPACK:
+        unpack = _UNPACK[code]
+        return unpack.unpack_from(data, pos)[0], pos + unpack.size
+    elif code in _LENGTHS:
+        size, kind = _LENGTHS[code]
+        length = _LENGTH_FORMATS[size].unpack_from(data, pos)[0]
+        pos += size
+        if kind is list:
+            return _unpack_array(data, pos, length)
+        elif kind is dict:
+            return _unpack_map(data, pos, length)
+        end = pos + length
+        if end > len(data):
+            raise ValueError(f"truncated msgpack {kind.__name__}")
+        value = data[pos:end]
+        return (value.decode('utf8') if kind is str else bytes(value)), end
+    raise ValueError(f"unsupported msgpack type 0x{code:02x}")
+
+
+def _unpack_array(data, pos, length):
+    # lengths are checked against the data before anything is allocated,
+    # every item taking at least a byte
+    if pos + length > len(data):
+        raise ValueError("truncated msgpack array")
+    end = pos + 9 * length
+    if length and end <= len(data) and data[pos:end:9] == b'\xcb' * length:
+        # all floats
+        return list(struct.unpack_from('>' + 'xd' * length, data, pos)), end
+    items = []
+    for _ in range(length):
+        item, pos = _unpack(data, pos)
+        items.append(item)
+    return items, pos
+
+
+def _unpack_map(data, pos, length):
+    # a key and a value take at least two bytes
+    if pos + 2 * length > len(data):
+        raise ValueError("truncated msgpack map")
+    d = {}
+    for _ in range(length):
+        key, pos = _unpack(data, pos)
+        value, pos = _unpack(data, pos)
+        d[key] = value
+    return d, pos
+
+
+def unpackb(data):
+    if isinstance(data, str):
+        raise TypeError("msgpack data must be bytes")
+    if not isinstance(data, bytes):
+        data = bytes(data)
+    try:
+        obj, end = _unpack(data, 0)
+    except (IndexError, struct.error):
+        raise ValueError("truncated msgpack data")
+    if end != len(data):
+        raise ValueError("extra data after msgpack object")
+    return obj
+
+
+class MsgpackCodec:
+    # Carries the same JSON-RPC 2.0 structures as MessagePack. Responses are
+    # built as objects and packed, not spliced from json fragments.
+    name = 'msgpack'
+    content_type = 'application/msgpack'
+    binary = True
+    compact = True
+
+    def __init__(self, accelerated=True):
+        self.accelerated = False
+        self._packb = packb
+        self._unpackb = unpackb
+        if accelerated:
+            try:
+                import msgpack
+            except ImportError:
+                return
+            self.accelerated = True
+            self._packb = lambda obj: msgpack.packb(obj, use_bin_type=True)
+            self._unpackb = lambda data: msgpack.unpackb(data, raw=False, strict_map_key=False)
+
+    def loads(self, data):
+        if isinstance(data, memoryview):
+            data = bytes(data)
+        return self._unpackb(data)
+
+    def dumpb(self, obj):
+        return self._packb(obj)
+
+    # there is no text form
+    dumps = dumpb
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}(accelerated={self.accelerated})"
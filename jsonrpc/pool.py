@@ -0,0 +1,108 @@
+import logging
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from .jsonrpc import JSONCallError, EncodedResult
+from .raw import RawResponse
+
+logger = logging.getLogger(__name__)
+
+# set in worker processes, where calls are handled inline
+_in_worker = False
+# factory: dispatcher built in this worker process
+_dispatchers = {}
+
+
+def _dispatch(factory, request):
+    # runs in a worker process: only request and response bytes are pickled
+    global _in_worker
+    _in_worker = True
+    dispatcher = _dispatchers.get(factory)
+    if dispatcher is None:
+        dispatcher = _dispatchers[factory] = factory()
+    return dispatcher.dispatch(request)
+
+
+def _chain(source, convert):
+    # a future of convert(result of source)
+    future = Future()
+
+    def done(source):
+        try:
+            future.set_result(convert(source.result()))
+        except BaseException as exc:
+            future.set_exception(exc)
+    source.add_done_callback(done)
+    return future
+
+
+def _result_of(response, codec=None):
+    # the result of a response as EncodedResult, raising its error
+    if response is None:
+        # notification
+        return None
+    if getattr(codec, 'binary', False):
+        # no scanner for binary formats
+        response = codec.loads(response)
+        if 'error' in response:
+            error = response['error']
+            raise JSONCallError(error['code'], message=error['message'], data=error.get('data'))
+        return response['result']
+    response = RawResponse.from_response(response, codec=codec)
+    if response.success:
+        return EncodedResult(response.result)
+    error = response.error
+    raise JSONCallError(error['code'], message=error['message'], data=error.get('data'))
+
+
+def submit(executor, call, func, args, kwargs):
+    # run a handler in a thread pool, or any concurrent.futures executor
+    # whose calls don't cross a process boundary
+    return executor.submit(func, *args, **kwargs)
+
+
+class ProcessPool:
+    # Runs calls in worker processes. Each worker builds its own dispatcher
+    # once by calling factory, which must be importable (a module-level
+    # function) and is typically the one building the parent's dispatcher.
+    # The encoded request goes to the worker and the encoded response comes
+    # back, results are spliced into responses without being decoded.
+    # Exceptions are mapped to error codes by the worker's dispatcher, and
+    # set_server_errors should be called by factory too.
+
+    def __init__(self, factory, max_workers=None, mp_context=None):
+        self.factory = factory
+        self.max_workers = max_workers
+        self.mp_context = mp_context
+        self._executor = None
+
+    @property
+    def executor(self):
+        # workers are started on first use
+        if self._executor is None:
+            kwargs = {} if self.mp_context is None else {'mp_context': self.mp_context}
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers, **kwargs)
+        return self._executor
+
+    def submit_call(self, call, func, args, kwargs):
+        # returns a concurrent.futures.Future of the result
+        if _in_worker:
+            # the worker's dispatcher registered the method with this pool too
+            future = Future()
+            try:
+                future.set_result(func(*args, **kwargs))
+            except Exception as exc:
+                future.set_exception(exc)
+            return future
+        request = call.request()
+        return _chain(self.executor.submit(_dispatch, self.factory, request), lambda r: _result_of(r, call.codec))
+
+    def shutdown(self, wait=True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
@@ -0,0 +1,302 @@
+import asyncio
+import json
+import logging
+import os
+import select
+import signal
+import socket
+import time
+
+from .metrics import merge_snapshots
+from .stream import MAX_FRAME_SIZE
+from .transport import Server
+
+logger = logging.getLogger(__name__)
+
+BACKLOG = 1024
+
+
+def _write(fd, data):
+    # returns what a non-blocking fd had no room for
+    try:
+        while data:
+            data = data[os.write(fd, data):]
+    except BlockingIOError:
+        pass
+    return data
+
+
+class _Worker:
+    __slots__ = ('pid', 'fd', 'buffer', 'snapshot', 'retiring', 'started')
+
+    def __init__(self, pid, fd):
+        self.pid = pid
+        # read end of the pipe the worker reports metrics on
+        self.fd = fd
+        self.buffer = b''
+        self.snapshot = None
+        self.retiring = False
+        self.started = time.monotonic()
+
+
+class PreforkServer:
+    # Serves the dispatcher built by factory in forked worker processes, one
+    # transport.Server each, to use several cores (Unix only). With
+    # SO_REUSEPORT every worker listens on its own socket bound to the same
+    # port and the kernel spreads connections over them; otherwise, and for
+    # Unix sockets, workers accept on one socket inherited from the parent.
+    # factory is called in each worker. When its dispatcher has metrics,
+    # snapshots are sent to the parent every metrics_interval seconds and
+    # merged by snapshot(); a worker drops a snapshot rather than block when
+    # the pipe is full. Workers that exit are restarted after restart_delay,
+    # doubled for each exit in a row up to max_restart_delay; a worker that
+    # ran for max_restart_delay resets it. SIGTERM or SIGINT stop
+    # serve_forever and SIGHUP reloads: new workers are started, then the
+    # old ones drain.
+
+    def __init__(
+        self, factory, workers=None, host='127.0.0.1', port=0, path=None, framing='ndjson',
+        max_frame_size=MAX_FRAME_SIZE, reuse_port=None, metrics_interval=1.0, drain_timeout=10.0,
+        restart_delay=0.1, max_restart_delay=30.0
+    ):
+        self.factory = factory
+        self.workers = workers or os.cpu_count() or 1
+        self.host = host
+        self.port = port
+        self.path = path
+        self.framing = framing
+        self.max_frame_size = max_frame_size
+        if reuse_port is None:
+            reuse_port = hasattr(socket, 'SO_REUSEPORT')
+        self.reuse_port = reuse_port and path is None
+        self.metrics_interval = metrics_interval
+        self.drain_timeout = drain_timeout
+        self.restart_delay = restart_delay
+        self.max_restart_delay = max_restart_delay
+        self.address = None
+        self._socket = None
+        # pid: _Worker
+        self._workers = {}
+        # last snapshots of exited workers merged, so counters don't go back
+        self._retired = None
+        # times workers are due to be restarted, and the exits in a row
+        self._restarts = []
+        self._crashes = 0
+        self._stopping = False
+        self._reloading = False
+
+    def _bind(self, listen):
+        if self.path is not None:
+            sock = socket.socket(socket.AF_UNIX)
+            sock.bind(self.path)
+        else:
+            sock = socket.socket(socket.AF_INET6 if ':' in self.host else socket.AF_INET)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if self.reuse_port:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            # the port picked for the parent's socket when port is 0
+            sock.bind((self.host, self.address[1] if self.address else self.port))
+        if listen:
+            sock.listen(BACKLOG)
+        return sock
+
+    def start(self):
+        # with SO_REUSEPORT the parent's socket only holds the port and
+        # doesn't listen, so it gets no connections
+        self._socket = self._bind(listen=not self.reuse_port)
+        self.address = self._socket.getsockname()
+        for _ in range(self.workers):
+            self._spawn()
+        return self
+
+    @property
+    def pids(self):
+        return [w.pid for w in self._workers.values() if not w.retiring]
+
+    def _spawn(self):
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            code = 0
+            try:
+                self._run_worker(write_fd)
+            except BaseException:
+                logger.exception("worker failed")
+                code = 1
+            finally:
+                os._exit(code)
+        os.close(write_fd)
+        self._workers[pid] = _Worker(pid, read_fd)
+        return pid
+
+    def _run_worker(self, fd):
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGHUP, signal.SIG_DFL)
+        # Ctrl-C reaches the whole process group, the parent stops the workers
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        for worker in self._workers.values():
+            if worker.fd is not None:
+                os.close(worker.fd)
+        self._workers = {}
+        sock = self._bind(listen=True) if self.reuse_port else self._socket
+        asyncio.run(self._serve(sock, fd))
+
+    async def _serve(self, sock, fd):
+        # the parent may be slow to read, snapshots are dropped meanwhile
+        os.set_blocking(fd, False)
+        unsent = b''
+        dispatcher = self.factory()
+        server = await Server(dispatcher, framing=self.framing, max_frame_size=self.max_frame_size).start(sock=sock)
+        loop = asyncio.get_event_loop()
+        stopping = loop.create_future()
+        loop.add_signal_handler(signal.SIGTERM, lambda: stopping.done() or stopping.set_result(None))
+        while not stopping.done():
+            unsent = self._report(dispatcher, fd, unsent)
+            try:
+                await asyncio.wait_for(asyncio.shield(stopping), self.metrics_interval)
+            except asyncio.TimeoutError:
+                pass
+        # drain: no new connections, requests being handled are answered
+        server.close()
+        try:
+            await asyncio.wait_for(server.wait_closed(), self.drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning("worker %d stopped before draining", os.getpid())
+        # the last snapshot is always sent
+        os.set_blocking(fd, True)
+        self._report(dispatcher, fd, unsent)
+
+    @staticmethod
+    def _report(dispatcher, fd, unsent):
+        # returns the part of a snapshot the pipe had no room for, sent first
+        # next time so lines stay whole; new snapshots are dropped until then
+        if dispatcher.metrics is None:
+            return unsent
+        if unsent:
+            unsent = _write(fd, unsent)
+            if unsent:
+                return unsent
+        return _write(fd, json.dumps(dispatcher.metrics.snapshot()).encode() + b'\n')
+
+    def poll(self, timeout=0):
+        # reads the snapshots sent by workers, reaps those which exited and
+        # restarts them when due
+        if self._restarts:
+            timeout = min(timeout, max(self._restarts[0] - time.monotonic(), 0))
+        workers = {w.fd: w for w in self._workers.values()}
+        if not workers and timeout:
+            time.sleep(timeout)
+        while workers:
+            readable, _, _ = select.select(list(workers), [], [], timeout)
+            if not readable:
+                break
+            timeout = 0
+            for fd in readable:
+                worker = workers[fd]
+                data = os.read(fd, 65536)
+                if not data:
+                    # exited, once its last snapshot is read
+                    del workers[fd]
+                    os.close(fd)
+                    worker.fd = None
+                    continue
+                lines = (worker.buffer + data).split(b'\n')
+                worker.buffer = lines.pop()
+                if lines:
+                    try:
+                        worker.snapshot = json.loads(lines[-1])
+                    except ValueError:
+                        # the previous snapshot is kept
+                        logger.warning("worker %d sent an invalid snapshot", worker.pid, exc_info=True)
+        self._reap()
+        now = time.monotonic()
+        while self._restarts and self._restarts[0] <= now and not self._stopping:
+            self._restarts.pop(0)
+            self._spawn()
+
+    def _reap(self):
+        for worker in list(self._workers.values()):
+            if worker.fd is not None:
+                continue
+            try:
+                pid, status = os.waitpid(worker.pid, 0)
+            except ChildProcessError:
+                status = 0
+            del self._workers[worker.pid]
+            if worker.snapshot is not None:
+                retired = [worker.snapshot] if self._retired is None else [self._retired, worker.snapshot]
+                self._retired = merge_snapshots(retired)
+            if not worker.retiring and not self._stopping:
+                if time.monotonic() - worker.started >= self.max_restart_delay:
+                    self._crashes = 0
+                delay = min(self.restart_delay * 2 ** self._crashes, self.max_restart_delay)
+                self._crashes += 1
+                logger.warning("worker %d exited with status %d, restarting in %.1fs", worker.pid, status, delay)
+                self._restarts.append(time.monotonic() + delay)
+                self._restarts.sort()
+
+    def snapshot(self):
+        # the metrics of all workers, past and present, merged
+        self.poll()
+        snapshots = [w.snapshot for w in self._workers.values() if w.snapshot is not None]
+        if self._retired is not None:
+            snapshots.append(self._retired)
+        return merge_snapshots(snapshots)
+
+    def reload(self):
+        # workers are replaced, e.g. to pick up new code through factory
+        old = [w for w in self._workers.values() if not w.retiring]
+        self._restarts = []
+        self._crashes = 0
+        for _ in range(self.workers):
+            self._spawn()
+        for worker in old:
+            worker.retiring = True
+            self._signal(worker.pid, signal.SIGTERM)
+
+    def stop(self):
+        # drains the workers, killing those still running after drain_timeout
+        self._stopping = True
+        for pid in list(self._workers):
+            self._signal(pid, signal.SIGTERM)
+        deadline = time.monotonic() + self.drain_timeout
+        while self._workers and time.monotonic() < deadline:
+            self.poll(timeout=0.05)
+        for pid in list(self._workers):
+            self._signal(pid, signal.SIGKILL)
+        while self._workers:
+            self.poll(timeout=0.05)
+        self._close_socket()
+
+    def _close_socket(self):
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+            if self.path is not None and os.path.exists(self.path):
+                os.unlink(self.path)
+
+    @staticmethod
+    def _signal(pid, signum):
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            pass
+
+    def serve_forever(self):
+        def stop(signum, frame):
+            self._stopping = True
+
+        def reload(signum, frame):
+            self._reloading = True
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+        signal.signal(signal.SIGHUP, reload)
+        if self._socket is None:
+            self.start()
+        while not self._stopping:
+            self.poll(timeout=0.5)
+            if self._reloading:
+                self._reloading = False
+                self.reload()
+        self.stop()
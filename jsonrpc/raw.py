@@ -0,0 +1,298 @@
+import json
+import re
+import logging
+
+from .jsonrpc import JSONCall, JSONCallError
+from .codec import get_codec
+
+logger = logging.getLogger(__name__)
+
+# The scanner finds the members of a message without decoding their values.
+# It jumps from one structural character to the next, tracking the depth of
+# brackets, and over strings with bytes.find (memchr), so large strings and
+# numeric arrays are skipped at close to memory speed. No search goes past
+# the value being skipped and nothing is copied. Values are not validated,
+# that's left to whoever decodes them.
+_WHITESPACE = re.compile(rb'[ \t\n\r]*')
+_SCALAR = re.compile(rb'[^,:\]}\[{" \t\n\r]+')
+_STRUCTURAL = re.compile(rb'["\[\]{}]')
+_QUOTE = 0x22
+_BACKSLASH = 0x5c
+_OPEN = frozenset(b'[{')
+
+
+def _skip_whitespace(data, pos):
+    return _WHITESPACE.match(data, pos).end()
+
+
+def _string_end(data, pos, searched):
+    # the end of the string opening at pos, whose closing quote isn't before
+    # searched; -1 when it isn't terminated within data
+    end = searched
+    while True:
+        end = data.find(_QUOTE, end + 1)
+        if end == -1:
+            return -1
+        # escaped quotes follow an odd number of backslashes
+        i = end - 1
+        while data[i] == _BACKSLASH:
+            i -= 1
+        if (end - 1 - i) % 2 == 0:
+            return end + 1
+
+
+def _skip_string(data, pos):
+    # pos is at the opening quote
+    end = _string_end(data, pos, pos)
+    if end == -1:
+        raise ValueError("unterminated string")
+    return end
+
+
+def _scan_container(data, pos, depth=0, string=None):
+    # skips the container opening at pos, or resumes a scan that ran out of
+    # data at pos, depth and within the string opening at string (if not
+    # None). Returns (end, 0, None) once the container is complete, else the
+    # state to resume from when more data is appended
+    if string is not None:
+        pos = _string_end(data, string, pos)
+        if pos == -1:
+            return len(data) - 1, depth, string
+    search = _STRUCTURAL.search
+    while True:
+        match = search(data, pos)
+        if match is None:
+            return len(data), depth, None
+        pos = match.start()
+        char = data[pos]
+        if char == _QUOTE:
+            end = _string_end(data, pos, pos)
+            if end == -1:
+                return len(data) - 1, depth, pos
+            pos = end
+            continue
+        pos += 1
+        if char in _OPEN:
+            depth += 1
+        else:
+            depth -= 1
+            if depth == 0:
+                return pos, 0, None
+
+
+def _skip_container(data, pos):
+    # pos is at the opening bracket
+    end, depth, _ = _scan_container(data, pos)
+    if depth:
+        raise ValueError("unterminated value")
+    return end
+
+
+def _skip_value(data, pos):
+    # returns the end of the value starting at pos
+    try:
+        char = data[pos]
+    except IndexError:
+        raise ValueError("value expected")
+    if char == _QUOTE:
+        return _skip_string(data, pos)
+    elif char in _OPEN:
+        return _skip_container(data, pos)
+    match = _SCALAR.match(data, pos)
+    if match is None:
+        raise ValueError("value expected")
+    return match.end()
+
+
+def scan_object(data, pos=0):
+    # returns ({name: (start, end)} of the members' values, end of the object);
+    # data is bytes or bytearray
+    members = {}
+    pos = _skip_whitespace(data, pos)
+    if data[pos:pos+1] != b'{':
+        raise ValueError("object expected")
+    pos = _skip_whitespace(data, pos + 1)
+    if data[pos:pos+1] == b'}':
+        return members, pos + 1
+    while True:
+        end = _skip_string(data, pos)
+        name = json.loads(bytes(data[pos:end]))
+        pos = _skip_whitespace(data, end)
+        if data[pos:pos+1] != b':':
+            raise ValueError("':' expected")
+        start = _skip_whitespace(data, pos + 1)
+        end = _skip_value(data, start)
+        members[name] = (start, end)
+        pos = _skip_whitespace(data, end)
+        char = data[pos:pos+1]
+        if char == b'}':
+            return members, pos + 1
+        elif char != b',':
+            raise ValueError("',' or '}' expected")
+        pos = _skip_whitespace(data, pos + 1)
+
+
+def scan_array(data, pos=0):
+    # returns [(start, end)] of the elements, end of the array
+    elements = []
+    pos = _skip_whitespace(data, pos)
+    if data[pos:pos+1] != b'[':
+        raise ValueError("array expected")
+    pos = _skip_whitespace(data, pos + 1)
+    if data[pos:pos+1] == b']':
+        return elements, pos + 1
+    while True:
+        end = _skip_value(data, pos)
+        elements.append((pos, end))
+        pos = _skip_whitespace(data, end)
+        char = data[pos:pos+1]
+        if char == b']':
+            return elements, pos + 1
+        elif char != b',':
+            raise ValueError("',' or ']' expected")
+        pos = _skip_whitespace(data, pos + 1)
+
+
+class RawMessage:
+    # A message of which only the envelope members are decoded. Other values
+    # are kept as memoryview slices of the original bytes.
+
+    def __init__(self, data, members, codec=None):
+        # data is a memoryview the members' positions refer to
+        self.data = data
+        self._members = members
+        self.codec = codec
+
+    @staticmethod
+    def _buffer(data):
+        if isinstance(data, (bytes, bytearray)):
+            return data
+        # the scanner needs bytes.find
+        return bytes(data)
+
+    @classmethod
+    def _scan(cls, data, start=0, end=None):
+        if end is None:
+            end = len(data)
+        try:
+            members, stop = scan_object(data, start)
+            if _skip_whitespace(data, stop) != end:
+                raise ValueError("trailing data")
+        except (ValueError, IndexError):
+            raise JSONCallError(-32700)
+        view = memoryview(data)[start:end]
+        return view, {name: (s - start, e - start) for name, (s, e) in members.items()}
+
+    def __contains__(self, name):
+        return name in self._members
+
+    def raw(self, name):
+        # the undecoded value of a member, or None
+        if name not in self._members:
+            return None
+        start, end = self._members[name]
+        return self.data[start:end]
+
+    def value(self, name, default=None):
+        if name not in self._members:
+            return default
+        return (self.codec or get_codec()).loads(self.raw(name))
+
+    @property
+    def _id(self):
+        # False when there is no id member, as for JSONCall
+        return self.value('id', False)
+
+    def with_id(self, _id):
+        # the message with its id replaced, without decoding anything else
+        if 'id' not in self._members:
+            raise ValueError("message has no id")
+        start, end = self._members['id']
+        return b''.join((self.data[:start], (self.codec or get_codec()).dumpb(_id), self.data[end:]))
+
+    def __bytes__(self):
+        return bytes(self.data)
+
+
+class RawCall(RawMessage):
+
+    def __init__(self, data, members, codec=None):
+        super().__init__(data, members, codec=codec)
+        _id = self._id
+        # validates the envelope as JSONCall does, without params
+        JSONCall(self.value('method'), jsonrpc=self.value('jsonrpc'), _id=_id, codec=codec)
+        self.method = self.value('method')
+
+    @classmethod
+    def from_request(cls, data, codec=None, _start=0, _end=None):
+        view, members = cls._scan(cls._buffer(data), _start, _end)
+        try:
+            return cls(view, members, codec=codec)
+        except JSONCallError:
+            raise
+        except Exception:
+            raise JSONCallError(-32700)
+
+    @classmethod
+    def from_batch(cls, data, codec=None):
+        # returns a RawCall, or JSONCallError for invalid elements, per element
+        data = cls._buffer(data)
+        try:
+            elements, end = scan_array(data)
+            if _skip_whitespace(data, end) != len(data):
+                raise ValueError("trailing data")
+        except (ValueError, IndexError):
+            raise JSONCallError(-32700)
+        if not elements:
+            raise JSONCallError(-32600)
+        calls = []
+        for start, end in elements:
+            try:
+                calls.append(cls.from_request(data, codec=codec, _start=start, _end=end))
+            except JSONCallError as error:
+                if error.code == -32700:
+                    error = JSONCallError(-32600)
+                calls.append(error)
+        return calls
+
+    @property
+    def params(self):
+        return self.raw('params')
+
+    @property
+    def is_notification(self):
+        return 'id' not in self._members
+
+    def to_call(self):
+        # fully decode, e.g. to handle the call locally
+        return JSONCall.from_request(self.data, codec=self.codec)
+
+
+class RawResponse(RawMessage):
+
+    def __init__(self, data, members, codec=None):
+        super().__init__(data, members, codec=codec)
+        if 'id' not in members or ('result' in members) == ('error' in members):
+            raise Exception("result or error not provided in response")
+
+    @classmethod
+    def from_response(cls, data, codec=None):
+        view, members = cls._scan(cls._buffer(data))
+        return cls(view, members, codec=codec)
+
+    @property
+    def success(self):
+        return 'result' in self._members
+
+    @property
+    def result(self):
+        return self.raw('result')
+
+    @property
+    def error(self):
+        # small, so decoded
+        return self.value('error')
+
+    def assign_to(self, call):
+        # fully decode into a JSONCall, as JSONCall.assign_response
+        call.assign_response(self.data)
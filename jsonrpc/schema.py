@@ -0,0 +1,382 @@
+import inspect
+import logging
+import re
+import types
+import typing
+
+from .jsonrpc import JSONCallError
+
+logger = logging.getLogger(__name__)
+
+# Schemas are a subset of JSON Schema, compiled once into nested checks that
+# only cost a type lookup per value. Annotations are translated to schemas:
+# int, float, str, bool, None, list/List[X], tuple/Tuple[X, ...],
+# dict/Dict[str, X], Optional[X] and Union[...] or X | Y; others (and Any)
+# aren't checked.
+
+_TYPES = {
+    'integer': (int, ),
+    'number': (int, float),
+    'string': (str, ),
+    'boolean': (bool, ),
+    'null': (type(None), ),
+    'array': (list, tuple),
+    'object': (dict, ),
+}
+_ARRAYS = frozenset(_TYPES['array'])
+_NUMBERS = frozenset(_TYPES['number'])
+# ignored, for documentation only
+_ANNOTATIONS = frozenset(['title', 'description', 'default', 'examples', '$schema', '$comment'])
+_KEYWORDS = _ANNOTATIONS | frozenset([
+    'type', 'enum', 'anyOf', 'items', 'properties', 'required', 'additionalProperties',
+    'minimum', 'maximum', 'exclusiveMinimum', 'exclusiveMaximum',
+    'minLength', 'maxLength', 'pattern', 'minItems', 'maxItems',
+])
+
+
+class _Invalid(Exception):
+    # raised by compiled checks; path is built innermost first while unwinding
+    def __init__(self, message):
+        super().__init__(message)
+        self.message = message
+        self.path = []
+
+    def details(self):
+        parts = reversed(self.path)
+        path = str(next(parts))
+        for part in parts:
+            path += f'[{part}]' if isinstance(part, int) else f'.{part}'
+        return f"{path}: {self.message}"
+
+
+def _sequence(checks):
+    if len(checks) == 1:
+        return checks[0]
+
+    def check(value):
+        for c in checks:
+            c(value)
+    return check
+
+
+def _type_check(names):
+    if isinstance(names, str):
+        names = [names]
+    allowed = set()
+    for name in names:
+        try:
+            allowed.update(_TYPES[name])
+        except KeyError:
+            raise ValueError(f"unknown type: {name}")
+    # integral floats, e.g. 1.0, are integers
+    integral = 'integer' in names and 'number' not in names
+    message = f"expected {' or '.join(names)}"
+
+    def check(value):
+        if type(value) not in allowed and not (integral and type(value) is float and value.is_integer()):
+            raise _Invalid(message)
+    return check
+
+
+def _enum_key(value):
+    # True == 1 in python but not in json
+    return (type(value) is bool, value)
+
+
+def _enum_check(values):
+    keys = []
+    hashed = set()
+    for value in values:
+        try:
+            hashed.add(_enum_key(value))
+        except TypeError:
+            keys.append(_enum_key(value))
+    message = f"expected one of {', '.join(repr(v) for v in values)}"
+
+    def check(value):
+        key = _enum_key(value)
+        try:
+            if key in hashed:
+                return
+        except TypeError:
+            pass
+        if key not in keys:
+            raise _Invalid(message)
+    return check
+
+
+def _bound_check(types, measure, bound, compare, message):
+    def check(value):
+        if type(value) in types and not compare(measure(value), bound):
+            raise _Invalid(message)
+    return check
+
+
+def _bound_checks(schema):
+    checks = []
+    numbers = [
+        ('minimum', lambda v, b: v >= b, "less than"),
+        ('maximum', lambda v, b: v <= b, "more than"),
+        ('exclusiveMinimum', lambda v, b: v > b, "at most"),
+        ('exclusiveMaximum', lambda v, b: v < b, "at least"),
+    ]
+    for keyword, compare, relation in numbers:
+        if keyword in schema:
+            bound = schema[keyword]
+            checks.append(_bound_check(_NUMBERS, lambda v: v, bound, compare, f"{relation} {bound}"))
+    lengths = [
+        (frozenset([str]), 'Length', "characters"),
+        (_ARRAYS, 'Items', "items"),
+    ]
+    for types, suffix, unit in lengths:
+        if 'min' + suffix in schema:
+            bound = schema['min' + suffix]
+            checks.append(_bound_check(types, len, bound, lambda v, b: v >= b, f"fewer than {bound} {unit}"))
+        if 'max' + suffix in schema:
+            bound = schema['max' + suffix]
+            checks.append(_bound_check(types, len, bound, lambda v, b: v <= b, f"more than {bound} {unit}"))
+    if 'pattern' in schema:
+        search = re.compile(schema['pattern']).search
+        message = f"does not match {schema['pattern']}"
+
+        def check(value):
+            if type(value) is str and search(value) is None:
+                raise _Invalid(message)
+        checks.append(check)
+    return checks
+
+
+def _any_of_check(schemas):
+    checks = [compile_schema(s) for s in schemas]
+    if any(c is None for c in checks):
+        return None
+
+    def check(value):
+        errors = []
+        for c in checks:
+            try:
+                c(value)
+                return
+            except _Invalid as invalid:
+                errors.append(invalid)
+        # the error of the only schema the value got into, e.g. the list of Optional[List[int]]
+        nested = [e for e in errors if e.path]
+        if len(nested) == 1:
+            raise nested[0]
+        messages = [e.message for e in errors]
+        if all(m.startswith("expected ") for m in messages):
+            raise _Invalid("expected " + " or ".join(m[len("expected "):] for m in messages))
+        raise _Invalid("matches none of the allowed schemas")
+    return check
+
+
+def _items_check(item):
+    def check(value):
+        if type(value) in _ARRAYS:
+            for i, v in enumerate(value):
+                try:
+                    item(v)
+                except _Invalid as invalid:
+                    invalid.path.append(i)
+                    raise
+    return check
+
+
+def _object_check(properties, required, additional):
+    # additional is a check, None for anything or False for nothing
+    def check(value):
+        if type(value) is not dict:
+            return
+        for name in required:
+            if name not in value:
+                raise _Invalid(f"missing member {name}")
+        for name, v in value.items():
+            c = properties.get(name, additional)
+            if c is None:
+                continue
+            if c is False:
+                invalid = _Invalid("unexpected member")
+            else:
+                try:
+                    c(v)
+                    continue
+                except _Invalid as error:
+                    invalid = error
+            invalid.path.append(name)
+            raise invalid
+    return check
+
+
+def compile_schema(schema):
+    # returns a check raising _Invalid for values not matching schema, or
+    # None when any value matches
+    if schema is True or schema is None:
+        return None
+    if not isinstance(schema, dict):
+        raise TypeError("schema must be a dict")
+    unsupported = set(schema) - _KEYWORDS
+    if unsupported:
+        raise ValueError(f"unsupported schema keywords: {', '.join(sorted(unsupported))}")
+    checks = []
+    if 'type' in schema:
+        checks.append(_type_check(schema['type']))
+    if 'enum' in schema:
+        checks.append(_enum_check(schema['enum']))
+    checks += _bound_checks(schema)
+    if 'anyOf' in schema:
+        check = _any_of_check(schema['anyOf'])
+        if check is not None:
+            checks.append(check)
+    if 'items' in schema:
+        item = compile_schema(schema['items'])
+        if item is not None:
+            checks.append(_items_check(item))
+    if any(k in schema for k in ['properties', 'required', 'additionalProperties']):
+        properties = {
+            name: compile_schema(s) for name, s in schema.get('properties', {}).items()
+        }
+        additional = schema.get('additionalProperties', True)
+        additional = False if additional is False else compile_schema(additional)
+        checks.append(_object_check(properties, tuple(schema.get('required', ())), additional))
+    if not checks:
+        return None
+    return _sequence(checks)
+
+
+# the type of X | Y (python 3.10+)
+_UnionType = getattr(types, 'UnionType', ())
+
+
+def _is_union(hint):
+    return getattr(hint, '__origin__', None) is typing.Union or isinstance(hint, _UnionType)
+
+
+def annotation_schema(hint):
+    # the schema of an annotation, or None when it isn't checked
+    if hint is None or hint is type(None):
+        return {'type': 'null'}
+    for name, types in [('boolean', (bool, )), ('integer', (int, )), ('number', (float, )), ('string', (str, ))]:
+        if hint in types:
+            return {'type': name}
+    if hint in (list, tuple, typing.List, typing.Tuple):
+        return {'type': 'array'}
+    if hint in (dict, typing.Dict):
+        return {'type': 'object'}
+    # list for List[int]
+    origin = getattr(hint, '__origin__', None)
+    args = getattr(hint, '__args__', None) or ()
+    if _is_union(hint):
+        schemas = [annotation_schema(arg) for arg in args]
+        if any(s is None for s in schemas):
+            return None
+        return {'anyOf': schemas}
+    if origin in (list, tuple):
+        schema = {'type': 'array'}
+        # Tuple[X, ...] only, fixed length tuples are checked as arrays
+        if args and (origin is list or (len(args) == 2 and args[1] is Ellipsis)):
+            item = annotation_schema(args[0])
+            if item is not None:
+                schema['items'] = item
+        return schema
+    if origin is dict:
+        schema = {'type': 'object'}
+        if len(args) == 2:
+            value = annotation_schema(args[1])
+            if value is not None:
+                schema['additionalProperties'] = value
+        return schema
+    return None
+
+
+class ParamsSchema:
+    # Checks the params of a method, compiled once from a schema per param.
+    # Missing and unexpected params are left to the signature check of the
+    # dispatcher.
+
+    __slots__ = ('names', 'checks', 'rest', 'extra')
+
+    def __init__(self, names, checks, rest=None, extra=None):
+        # names of the positional params in order
+        self.names = tuple(names)
+        # name: check or None
+        self.checks = checks
+        # checks of values for *args and **kwargs
+        self.rest = rest
+        self.extra = extra
+
+    def validate(self, args, kwargs, _id=None):
+        checks = self.checks
+        name = None
+        try:
+            if kwargs:
+                extra = self.extra
+                for name, value in kwargs.items():
+                    check = checks.get(name, extra)
+                    if check is not None:
+                        check(value)
+            else:
+                names = self.names
+                for i, value in enumerate(args):
+                    if i < len(names):
+                        name = names[i]
+                        check = checks.get(name)
+                    else:
+                        name = i
+                        check = self.rest
+                    if check is not None:
+                        check(value)
+        except _Invalid as invalid:
+            invalid.path.append(name if isinstance(name, str) else f"[{name}]")
+            raise JSONCallError(-32602, data=invalid.details(), _id=_id)
+
+    @classmethod
+    def _compile(cls, func, schemas):
+        # schemas: {param name: schema}
+        names = []
+        checks = {}
+        rest = extra = None
+        parameters = inspect.signature(func).parameters
+        unknown = set(schemas) - set(parameters)
+        if unknown:
+            raise ValueError(f"no such params: {', '.join(sorted(unknown))}")
+        for p in parameters.values():
+            check = compile_schema(schemas.get(p.name))
+            if p.kind is p.VAR_POSITIONAL:
+                rest = check
+            elif p.kind is p.VAR_KEYWORD:
+                extra = check
+            else:
+                if p.kind is not p.KEYWORD_ONLY:
+                    names.append(p.name)
+                # None for unchecked params, so they aren't checked as **kwargs
+                checks[p.name] = check
+        return cls(names, checks, rest=rest, extra=extra)
+
+    @classmethod
+    def from_annotations(cls, func):
+        hints = typing.get_type_hints(func)
+        hints.pop('return', None)
+        schemas = {name: annotation_schema(hint) for name, hint in hints.items()}
+        return cls._compile(func, schemas)
+
+    @classmethod
+    def from_schema(cls, func, schema):
+        # schema is an object schema whose properties are the params
+        if not isinstance(schema, dict):
+            raise TypeError("schema must be a dict")
+        unsupported = set(schema) - _ANNOTATIONS - {'type', 'properties'}
+        if unsupported:
+            # required and unexpected params follow the signature
+            raise ValueError(f"unsupported params schema keywords: {', '.join(sorted(unsupported))}")
+        if schema.get('type', 'object') != 'object':
+            raise ValueError("params schema must be of type object")
+        return cls._compile(func, schema.get('properties', {}))
+
+
+def compile_params(func, schema=None):
+    # a ParamsSchema from an explicit schema, or from the annotations of func
+    if isinstance(schema, ParamsSchema):
+        return schema
+    if schema is None or schema is True:
+        return ParamsSchema.from_annotations(func)
+    return ParamsSchema.from_schema(func, schema)
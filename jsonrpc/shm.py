@@ -0,0 +1,442 @@
+import asyncio
+import logging
+import os
+import platform
+import struct
+import tempfile
+
+try:
+    from multiprocessing import resource_tracker, shared_memory
+except ImportError:
+    # python < 3.8
+    resource_tracker = shared_memory = None
+
+from .client import ClientSession
+from .dispatcher import Dispatcher
+from .transport import _failure_response
+
+logger = logging.getLogger(__name__)
+
+RING_SIZE = 1024 * 1024
+# per ring: write position, read position and whether the reader sleeps, on
+# separate cache lines, then the data
+_HEAD, _TAIL, _WAITING = 0, 64, 128
+_HEADER_SIZE = 192
+_U64 = struct.Struct('<Q')
+_U32 = struct.Struct('<I')
+# length of the marker sending the reader back to the start of the data
+_WRAP = 0xffffffff
+# how long a full ring is polled for space, doubled up to 10ms
+_FULL_DELAY = 0.0001
+# how long a reader sleeps before looking at the ring again, in case its
+# wakeup was lost (see Ring.wait)
+_WAIT_TIMEOUT = 0.01
+# machines whose stores and loads are seen in program order (see Ring)
+_TSO_MACHINES = frozenset(['x86_64', 'amd64', 'i386', 'i486', 'i586', 'i686', 'x86'])
+
+
+def _align(n):
+    return (n + 7) & ~7
+
+
+class Ring:
+    # A single producer, single consumer queue of messages in shared memory.
+    # Positions only grow and are taken modulo the capacity. Each message is
+    # a 4 byte length then the payload, kept contiguous, and is read as a
+    # memoryview of the shared memory, so it is not copied. The reader sets
+    # waiting before it sleeps on its wakeup fifo, which the writer then
+    # writes to; while both are busy no system call is made.
+    # Python has no memory fences: a message is published by storing head
+    # after its bytes, and read by loading head before them, which relies on
+    # stores and loads being seen in program order as on x86 (TSO). Weakly
+    # ordered CPUs, e.g. ARM, may let the reader see head before the message,
+    # so channels are refused there.
+
+    def __init__(self, buf, offset, size, wakeup):
+        self.buf = buf
+        self.offset = offset
+        self.data = offset + _HEADER_SIZE
+        self.capacity = size - _HEADER_SIZE
+        # so a message always fits once the ring is empty, even after a wrap
+        self.max_message = self.capacity // 2 - 4
+        # fifo opened read-write and non-blocking by both sides
+        self.wakeup = wakeup
+
+    def _get(self, field):
+        return _U64.unpack_from(self.buf, self.offset + field)[0]
+
+    def _set(self, field, value):
+        _U64.pack_into(self.buf, self.offset + field, value)
+
+    def write(self, data):
+        # False when there is no room for data yet
+        if len(data) > self.max_message:
+            raise ValueError(f"message of {len(data)} bytes exceeds {self.max_message} bytes")
+        size = _align(4 + len(data))
+        head = self._get(_HEAD)
+        free = self.capacity - (head - self._get(_TAIL))
+        index = head % self.capacity
+        skip = self.capacity - index if index + size > self.capacity else 0
+        if skip + size > free:
+            return False
+        if skip:
+            _U32.pack_into(self.buf, self.data + index, _WRAP)
+            index = 0
+        start = self.data + index
+        _U32.pack_into(self.buf, start, len(data))
+        self.buf[start + 4:start + 4 + len(data)] = data
+        # published once written, ordered by the cpu on x86 only
+        self._set(_HEAD, head + skip + size)
+        return True
+
+    def wake(self):
+        # wakes the reader if it sleeps, once for the messages written since
+        # as the reader may be switched to straight away
+        if self._get(_WAITING):
+            self._set(_WAITING, 0)
+            try:
+                os.write(self.wakeup, b'\0')
+            except BlockingIOError:
+                # the fifo is full of wakeups already
+                pass
+
+    def read(self):
+        # (memoryviews of the messages available, position to pass to
+        # advance() once they are no longer used)
+        head = self._get(_HEAD)
+        tail = self._get(_TAIL)
+        views = []
+        while tail < head:
+            index = tail % self.capacity
+            start = self.data + index
+            length = _U32.unpack_from(self.buf, start)[0]
+            if length == _WRAP:
+                tail += self.capacity - index
+                continue
+            views.append(self.buf[start + 4:start + 4 + length])
+            tail += _align(4 + length)
+        return views, tail
+
+    def advance(self, tail):
+        self._set(_TAIL, tail)
+
+    def wait(self):
+        # sets waiting; returns False if messages came in meanwhile. Even x86
+        # may load head before the store of waiting is seen, missing a message
+        # whose writer saw waiting unset, so sleeps are bounded
+        self._set(_WAITING, 1)
+        if self._get(_HEAD) != self._get(_TAIL):
+            self._set(_WAITING, 0)
+            return False
+        return True
+
+    def woken(self):
+        self._set(_WAITING, 0)
+        try:
+            while os.read(self.wakeup, 4096):
+                pass
+        except BlockingIOError:
+            pass
+
+
+def _shared_memory(**kwargs):
+    # Shared memory left out of the resource tracker, which python < 3.13
+    # also registers attached segments with, unlinking them when the
+    # attaching process exits. The creator unlinks it in Channel.close.
+    if shared_memory is None:
+        raise RuntimeError("shared memory transport needs python 3.8+")
+    if platform.machine().lower() not in _TSO_MACHINES:
+        raise RuntimeError(f"shared memory transport needs x86, not {platform.machine()}")
+    try:
+        return shared_memory.SharedMemory(track=False, **kwargs)
+    except TypeError:
+        shm = shared_memory.SharedMemory(**kwargs)
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+
+class Channel:
+    # Shared memory holding a ring of requests and a ring of responses, with a
+    # wakeup fifo for each, between one server and one client process. The
+    # fifos are in a private directory; the address is the name of the
+    # shared memory in that directory.
+
+    def __init__(self, shm, ring_size, directory, created):
+        self.shm = shm
+        self.name = shm.name
+        self.directory = directory
+        self.address = os.path.join(directory, shm.name.lstrip('/'))
+        self.created = created
+        self.fifos = [os.path.join(directory, direction) for direction in ('requests', 'responses')]
+        self._fds = [os.open(path, os.O_RDWR | os.O_NONBLOCK) for path in self.fifos]
+        self.requests = Ring(shm.buf, 0, ring_size, self._fds[0])
+        self.responses = Ring(shm.buf, ring_size, ring_size, self._fds[1])
+
+    @classmethod
+    def create(cls, ring_size=RING_SIZE):
+        ring_size = _align(ring_size)
+        shm = _shared_memory(create=True, size=2 * ring_size)
+        shm.buf[:2 * ring_size] = bytes(2 * ring_size)
+        # only accessible to this user, unlike predictable names in the shared tempdir
+        directory = tempfile.mkdtemp(prefix='jsonrpc-')
+        for direction in ('requests', 'responses'):
+            os.mkfifo(os.path.join(directory, direction), 0o600)
+        return cls(shm, ring_size, directory, created=True)
+
+    @classmethod
+    def attach(cls, address):
+        directory, name = os.path.split(address)
+        shm = _shared_memory(name=name)
+        return cls(shm, shm.size // 2, directory, created=False)
+
+    def close(self):
+        for fd in self._fds:
+            os.close(fd)
+        self._fds = []
+        self.requests = self.responses = None
+        self.shm.close()
+        if self.created:
+            if not hasattr(self.shm, '_track'):
+                # python < 3.13 unregisters on unlink
+                resource_tracker.register(self.shm._name, 'shared_memory')
+            self.shm.unlink()
+            for path in self.fifos:
+                if os.path.exists(path):
+                    os.unlink(path)
+            os.rmdir(self.directory)
+
+
+async def _receive(ring, handle):
+    # calls handle with the messages of ring as they come, sleeping on its
+    # fifo when there are none
+    loop = asyncio.get_event_loop()
+    waiter = None
+
+    def release():
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+    def woken():
+        ring.woken()
+        release()
+    # registered throughout, as adding and removing it per wait is costlier
+    loop.add_reader(ring.wakeup, woken)
+    try:
+        while True:
+            views, tail = ring.read()
+            if views:
+                try:
+                    await handle(views)
+                finally:
+                    for view in views:
+                        view.release()
+                ring.advance(tail)
+                continue
+            if ring.wait():
+                waiter = loop.create_future()
+                # not wait_for, which may swallow a cancellation before python 3.12
+                timer = loop.call_later(_WAIT_TIMEOUT, release)
+                try:
+                    await waiter
+                finally:
+                    timer.cancel()
+                waiter = None
+    finally:
+        loop.remove_reader(ring.wakeup)
+
+
+class _Sender:
+    # writes to a ring, keeping what doesn't fit until the reader makes room,
+    # and wakes the reader once per event loop iteration
+    def __init__(self, ring):
+        self.ring = ring
+        self._backlog = []
+        self._task = None
+        self._waking = False
+
+    def send(self, data):
+        if len(data) > self.ring.max_message:
+            raise ValueError(f"message of {len(data)} bytes exceeds {self.ring.max_message} bytes")
+        if not self._backlog and self.ring.write(data):
+            self._wake_soon()
+            return
+        self._backlog.append(data)
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._flush())
+
+    def _wake_soon(self):
+        if not self._waking:
+            self._waking = True
+            asyncio.get_event_loop().call_soon(self._wake)
+
+    def _wake(self):
+        self._waking = False
+        if self.ring is not None:
+            self.ring.wake()
+
+    async def _flush(self):
+        delay = _FULL_DELAY
+        try:
+            while self._backlog:
+                if self.ring.write(self._backlog[0]):
+                    self._backlog.pop(0)
+                    delay = _FULL_DELAY
+                else:
+                    self.ring.wake()
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, 0.01)
+            self._wake_soon()
+        finally:
+            self._task = None
+
+    def cancel(self):
+        if self._task is not None:
+            self._task.cancel()
+        self.ring = None
+
+
+class Server:
+    # Serves a Dispatcher or AsyncDispatcher to one client process through
+    # shared memory, as transport.Server does over a socket; the client
+    # attaches to address. Requests are passed to a dispatcher as memoryviews
+    # of the shared memory and parsed before the ring moves on, other
+    # dispatch objects (e.g. an AdmissionController) get copies. A request
+    # whose dispatch raises, or whose response doesn't fit in the ring, is
+    # answered with an internal error. Refused on CPUs other than x86, see Ring.
+
+    def __init__(self, dispatcher, ring_size=RING_SIZE):
+        self.dispatcher = dispatcher
+        self.ring_size = ring_size
+        self.channel = None
+        self._concurrent = asyncio.iscoroutinefunction(dispatcher.dispatch)
+        self._zero_copy = isinstance(dispatcher, Dispatcher)
+        self._task = None
+        self._tasks = set()
+
+    async def start(self):
+        self.channel = Channel.create(self.ring_size)
+        self._sender = _Sender(self.channel.responses)
+        self._task = asyncio.ensure_future(_receive(self.channel.requests, self._handle))
+        return self
+
+    @property
+    def address(self):
+        # for Client, see Channel
+        return self.channel.address
+
+    async def _handle(self, views):
+        if not self._zero_copy:
+            views = [bytes(view) for view in views]
+        if not self._concurrent:
+            for view in views:
+                try:
+                    response = self.dispatcher.dispatch(view)
+                except Exception:
+                    response = self._failed(view)
+                self._respond(response)
+            return
+        for view in views:
+            # a failed request's ids are read back from a copy, as the view is
+            # released once the ring moves on
+            task = asyncio.ensure_future(self._dispatch(view, bytes(view) if self._zero_copy else view))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        # the requests are parsed by the first step of the dispatch
+        await asyncio.sleep(0)
+
+    async def _dispatch(self, request, copy):
+        try:
+            response = await self.dispatcher.dispatch(request)
+        except asyncio.CancelledError:
+            # an Exception on python 3.7
+            raise
+        except Exception:
+            response = self._failed(copy)
+        self._respond(response)
+
+    def _failed(self, request):
+        # called while handling the exception
+        logger.exception("dispatch of a request failed")
+        return _failure_response(request, self.dispatcher.codec)
+
+    def _respond(self, response):
+        if response is None:
+            return
+        if len(response) > self._sender.ring.max_message:
+            logger.error("response of %d bytes exceeds %d bytes", len(response), self._sender.ring.max_message)
+            response = _failure_response(response, self.dispatcher.codec, data="response too large")
+        self._sender.send(response)
+
+    async def serve_forever(self):
+        await self._task
+
+    def close(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    async def wait_closed(self):
+        if self._task is None:
+            return
+        try:
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            if self._tasks:
+                await asyncio.gather(*self._tasks, return_exceptions=True)
+        finally:
+            self._sender.cancel()
+            self._task = None
+            self.channel.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+        await self.wait_closed()
+
+
+class Client:
+    # Calls a shm.Server at address, with the interface of transport.Client.
+    # Calls are pipelined and matched to responses by id.
+
+    def __init__(self, address, timeout=None, max_pending=None, id_generator=None, codec=None, propagate_timeout=False):
+        self.address = address
+        self.channel = Channel.attach(address)
+        self._sender = _Sender(self.channel.requests)
+        self.session = ClientSession(
+            send=self._sender.send, timeout=timeout, max_pending=max_pending, id_generator=id_generator,
+            codec=codec, propagate_timeout=propagate_timeout
+        )
+        self._task = asyncio.ensure_future(_receive(self.channel.responses, self._feed))
+
+    async def _feed(self, views):
+        for view in views:
+            self.session.feed(view)
+
+    async def call(self, method, params=None, timeout=None):
+        return await self.session.call_async(method, params=params, timeout=timeout)
+
+    async def notify(self, method, params=None):
+        self.session.notify(method, params=params)
+
+    async def batch(self, calls, timeout=None):
+        # returns an awaitable per call
+        return [asyncio.wrap_future(future) for future in self.session.batch(calls, timeout=timeout)]
+
+    async def close(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._sender.cancel()
+        self.session.cancel_all(ConnectionError("connection closed"))
+        self.channel.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
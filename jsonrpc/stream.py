@@ -0,0 +1,282 @@
+import logging
+
+from .jsonrpc import JSONCall, JSONCallError
+from .raw import _OPEN, _scan_container, _skip_value, _skip_whitespace
+from .codec import get_codec
+
+logger = logging.getLogger(__name__)
+
+FRAMINGS = ('ndjson', 'content-length')
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+MAX_HEADER_SIZE = 8 * 1024
+# consumed bytes are only dropped from the buffer past this size
+_COMPACT_SIZE = 64 * 1024
+_WHITESPACE = b' \t\r\n'
+# batch reader states
+_START, _ELEMENT, _FIRST, _SEPARATOR, _END, _SINGLE = range(6)
+
+
+def encode_frame(payload, framing='ndjson'):
+    if framing == 'ndjson':
+        # encoded json never contains a raw newline
+        return payload + b'\n'
+    elif framing == 'content-length':
+        return b'Content-Length: %d\r\n\r\n' % len(payload) + payload
+    raise ValueError(f"unknown framing {framing}: expected one of {', '.join(FRAMINGS)}")
+
+
+class StreamDecoder:
+    # Accepts arbitrary chunks of a byte stream and returns complete messages.
+    # Chunks are appended to one growable buffer; frames are parsed through
+    # memoryview slices of it. A ValueError is raised for a frame above
+    # max_frame_size or malformed framing, after which the stream should be closed.
+
+    def __init__(self, framing='ndjson', max_frame_size=MAX_FRAME_SIZE, codec=None):
+        if framing not in FRAMINGS:
+            raise ValueError(f"unknown framing {framing}: expected one of {', '.join(FRAMINGS)}")
+        self.framing = framing
+        self.max_frame_size = max_frame_size
+        self.codec = codec
+        self._buffer = bytearray()
+        # start of the unconsumed data
+        self._start = 0
+        # ndjson: position already searched for a newline
+        self._scanned = 0
+        # content-length: start and end of the body being read
+        self._body = None
+
+    @property
+    def pending(self):
+        return len(self._buffer) - self._start
+
+    def _split(self):
+        if self.framing == 'ndjson':
+            return self._split_lines()
+        return self._split_content_length()
+
+    def _split_lines(self):
+        buffer = self._buffer
+        while True:
+            end = buffer.find(b'\n', self._scanned)
+            if end == -1:
+                self._scanned = len(buffer)
+                if self._scanned - self._start > self.max_frame_size:
+                    raise ValueError("frame exceeds max_frame_size")
+                return
+            start = self._start
+            self._start = self._scanned = end + 1
+            if end - start > self.max_frame_size:
+                raise ValueError("frame exceeds max_frame_size")
+            # skip blank lines (and lone \r of \r\n line endings)
+            if end - start > 1 or buffer[start:end].strip(_WHITESPACE):
+                yield start, end
+
+    def _split_content_length(self):
+        buffer = self._buffer
+        while True:
+            if self._body is None:
+                header_end = buffer.find(b'\r\n\r\n', self._start)
+                if header_end == -1:
+                    if len(buffer) - self._start > MAX_HEADER_SIZE:
+                        raise ValueError("frame header exceeds maximum size")
+                    return
+                length = None
+                for line in bytes(buffer[self._start:header_end]).split(b'\r\n'):
+                    name, sep, value = line.partition(b':')
+                    if not sep:
+                        raise ValueError("malformed frame header")
+                    if name.strip().lower() == b'content-length':
+                        try:
+                            length = int(value)
+                        except ValueError:
+                            raise ValueError("malformed Content-Length header")
+                if length is None or length < 0:
+                    raise ValueError("Content-Length header required")
+                if length > self.max_frame_size:
+                    raise ValueError("frame exceeds max_frame_size")
+                self._body = (header_end + 4, header_end + 4 + length)
+            start, end = self._body
+            if len(buffer) < end:
+                return
+            self._body = None
+            self._start = end
+            yield start, end
+
+    def _compact(self):
+        start = self._start
+        if start == len(self._buffer):
+            self._buffer.clear()
+        elif start >= _COMPACT_SIZE and start * 2 >= len(self._buffer):
+            del self._buffer[:start]
+        else:
+            return
+        self._scanned = max(self._scanned - start, 0)
+        if self._body is not None:
+            self._body = (self._body[0] - start, self._body[1] - start)
+        self._start = 0
+
+    def feed_frames(self, data):
+        # returns the payloads of completed frames, copied out once
+        self._buffer += data
+        with memoryview(self._buffer) as view:
+            frames = [bytes(view[start:end]) for start, end in self._split()]
+        self._compact()
+        return frames
+
+    def feed(self, data):
+        # returns a JSONCall, JSONBatch or JSONCallError (to send back) per completed frame
+        self._buffer += data
+        messages = []
+        with memoryview(self._buffer) as view:
+            for start, end in self._split():
+                with view[start:end] as frame:
+                    try:
+                        messages.append(JSONCall.from_request(frame, codec=self.codec))
+                    except JSONCallError as error:
+                        messages.append(error)
+        self._compact()
+        return messages
+
+
+class BatchReader:
+    # Parses a request from chunks as they arrive. Elements of a batch array
+    # are returned as soon as they are complete, as a JSONCall or a
+    # JSONCallError for invalid elements, so they can be handled before the
+    # rest arrives; consumed bytes are dropped. Other requests are returned
+    # whole by close(). A JSONCallError is raised, and reading should stop,
+    # when the request is malformed or goes over max_items or max_size.
+
+    def __init__(self, max_items=None, max_size=MAX_FRAME_SIZE, codec=None):
+        self.max_items = max_items
+        self.max_size = max_size
+        self.codec = codec
+        self._buffer = bytearray()
+        self._pos = 0
+        self._state = _START
+        # (start, scanner state) of an array or object element, kept while it
+        # is incomplete so each chunk is scanned once
+        self._partial = None
+        # bytes and elements read so far
+        self.size = 0
+        self.count = 0
+        self._error = None
+
+    @property
+    def is_batch(self):
+        # None until the first non-whitespace byte is read
+        if self._state == _START:
+            return None
+        return self._state != _SINGLE
+
+    def feed(self, data):
+        self.size += len(data)
+        if self.max_size is not None and self.size > self.max_size:
+            raise JSONCallError(-32600, data=f"request exceeds {self.max_size} bytes")
+        self._buffer += data
+        return self._parse(final=False)
+
+    def close(self):
+        items = self._parse(final=True)
+        if self._state == _SINGLE:
+            message = JSONCall.from_request(bytes(self._buffer), codec=self.codec)
+            items.append(message)
+        elif self._state != _END:
+            raise JSONCallError(-32700)
+        return items
+
+    def read(self, chunks):
+        # yields the items parsed from each chunk of an iterable, then those
+        # returned by close()
+        for chunk in chunks:
+            items = self.feed(chunk)
+            if items:
+                yield items
+        yield self.close()
+
+    def _element(self, data):
+        self.count += 1
+        if self.max_items is not None and self.count > self.max_items:
+            raise JSONCallError(-32600, data=f"batch exceeds {self.max_items} items")
+        try:
+            element = (self.codec or get_codec()).loads(data)
+        except Exception:
+            raise JSONCallError(-32700)
+        try:
+            return JSONCall.from_dict(element, codec=self.codec)
+        except JSONCallError as error:
+            return error
+
+    def _parse(self, final):
+        if self._error is not None:
+            raise self._error
+        items = []
+        try:
+            self._scan(items, final)
+        except JSONCallError as error:
+            if not items:
+                raise
+            # raised once the items parsed before it are handled
+            self._error = error
+        return items
+
+    def _scan(self, items, final):
+        buffer = self._buffer
+        while self._state not in (_END, _SINGLE):
+            pos = _skip_whitespace(buffer, self._pos)
+            if pos == len(buffer):
+                break
+            char = buffer[pos]
+            if self._state == _START:
+                self._state = _FIRST if char == 0x5b else _SINGLE
+                self._pos = pos + 1 if char == 0x5b else pos
+            elif self._state == _SEPARATOR:
+                if char == 0x2c:
+                    self._state = _ELEMENT
+                elif char == 0x5d:
+                    self._state = _END
+                else:
+                    raise JSONCallError(-32700)
+                self._pos = pos + 1
+            elif self._state == _FIRST and char == 0x5d:
+                # an empty array
+                raise JSONCallError(-32600)
+            elif char in _OPEN:
+                partial = self._partial
+                state = partial[1] if partial is not None and partial[0] == pos else (pos, 0, None)
+                end, depth, string = _scan_container(buffer, *state)
+                if depth:
+                    if final:
+                        raise JSONCallError(-32700)
+                    self._partial = (pos, (end, depth, string))
+                    break
+                self._partial = None
+                self._element_at(items, pos, end)
+            else:
+                try:
+                    end = _skip_value(buffer, pos)
+                except (ValueError, IndexError):
+                    # incomplete, or malformed which tells once all is read
+                    if final:
+                        raise JSONCallError(-32700)
+                    break
+                if end == len(buffer) and not final and char != 0x22:
+                    # a number or literal may continue in the next chunk
+                    break
+                self._element_at(items, pos, end)
+        if self._state == _END:
+            if final and _skip_whitespace(buffer, self._pos) != len(buffer):
+                raise JSONCallError(-32700)
+        elif self._state != _SINGLE and self._pos >= _COMPACT_SIZE:
+            shift = self._pos
+            del buffer[:shift]
+            self._pos = 0
+            if self._partial is not None:
+                start, (end, depth, string) = self._partial
+                self._partial = (start - shift, (end - shift, depth, None if string is None else string - shift))
+
+    def _element_at(self, items, start, end):
+        with memoryview(self._buffer) as view:
+            element = bytes(view[start:end])
+        items.append(self._element(element))
+        self._state = _SEPARATOR
+        self._pos = end
@@ -0,0 +1,411 @@
+import asyncio
+import inspect
+import logging
+import socket
+
+from .client import ClientSession
+from .codec import get_codec
+from .jsonrpc import JSONCallError
+from .stream import StreamDecoder, encode_frame, MAX_FRAME_SIZE
+
+logger = logging.getLogger(__name__)
+
+READ_SIZE = 64 * 1024
+# sent by health checks; any response, "Method not found" included, shows
+# the connection is alive (rpc. names are reserved)
+PING_METHOD = 'ping'
+# reading a connection pauses while this many requests, or frames of this
+# many bytes, are being handled
+MAX_PENDING = 1024
+MAX_PENDING_SIZE = MAX_FRAME_SIZE
+
+
+def _check_framing(framing, codec):
+    if framing == 'ndjson' and getattr(codec, 'binary', False):
+        # binary payloads may contain newlines
+        raise ValueError("binary codecs need content-length framing")
+
+
+def _failure_response(message, codec, data=None):
+    # internal errors for a request whose dispatch raised, or a response that
+    # can't be sent, with the ids of its calls when they can be read back;
+    # None when there are none, e.g. for notifications
+    codec = codec or get_codec()
+    try:
+        decoded = codec.loads(message)
+    except Exception:
+        decoded = None
+    if isinstance(decoded, list):
+        ids = [d['id'] for d in decoded if isinstance(d, dict) and 'id' in d]
+    elif isinstance(decoded, dict):
+        ids = [decoded['id']] if 'id' in decoded else []
+    else:
+        ids = [None]
+    if not ids:
+        return None
+    errors = [
+        JSONCallError(-32603, data=data, _id=_id if isinstance(_id, (str, int, float, type(None))) else None)
+        for _id in ids
+    ]
+    if not isinstance(decoded, list):
+        return errors[0].response(codec=codec)
+    if getattr(codec, 'binary', False):
+        return codec.dumpb([error._response_values() for error in errors])
+    return b'[' + b', '.join(error.response(codec=codec) for error in errors) + b']'
+
+
+class Server:
+    # Serves a Dispatcher or AsyncDispatcher over TCP or a Unix socket, one
+    # message per frame. Requests of a connection are handled concurrently by
+    # an AsyncDispatcher, so responses may come back out of order and are
+    # matched by id; a Dispatcher handles them in order on the loop, so its
+    # handlers shouldn't block. A request whose dispatch raises is answered
+    # with an internal error, the connection is kept.
+
+    def __init__(
+        self, dispatcher, framing='ndjson', max_frame_size=MAX_FRAME_SIZE,
+        max_pending=MAX_PENDING, max_pending_size=MAX_PENDING_SIZE
+    ):
+        _check_framing(framing, dispatcher.codec)
+        self.dispatcher = dispatcher
+        self.framing = framing
+        self.max_frame_size = max_frame_size
+        # per connection, for an AsyncDispatcher
+        self.max_pending = max_pending
+        self.max_pending_size = max_pending_size
+        self._concurrent = inspect.iscoroutinefunction(dispatcher.dispatch)
+        self._server = None
+        # writer: (task serving the connection, tasks of its requests being handled)
+        self._connections = {}
+
+    async def start(self, host='127.0.0.1', port=0, path=None, sock=None):
+        # listens on path (a Unix socket), sock (an already bound socket) or host and port
+        if path is not None:
+            self._server = await asyncio.start_unix_server(self._serve, path=path)
+        elif sock is not None:
+            if sock.family == getattr(socket, 'AF_UNIX', None):
+                self._server = await asyncio.start_unix_server(self._serve, sock=sock)
+            else:
+                self._server = await asyncio.start_server(self._serve, sock=sock)
+        else:
+            self._server = await asyncio.start_server(self._serve, host=host, port=port)
+        return self
+
+    async def serve_socket(self, sock):
+        # serves one already connected socket, e.g. an end of socket.socketpair(),
+        # until the peer closes it
+        reader, writer = await asyncio.open_connection(sock=sock)
+        await self._serve(reader, writer)
+
+    @property
+    def address(self):
+        # (host, port) or the path of the first listening socket
+        return self._server.sockets[0].getsockname()
+
+    async def serve_forever(self):
+        await self._server.serve_forever()
+
+    def close(self):
+        # stops listening; wait_closed() then drains the connections
+        if self._server is not None:
+            self._server.close()
+
+    async def wait_closed(self):
+        # the requests being handled are answered before connections are closed
+        connections = list(self._connections.items())
+        for writer, (_, tasks) in connections:
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+            writer.close()
+        await asyncio.gather(*[serving for _, (serving, _) in connections], return_exceptions=True)
+        if self._server is not None:
+            await self._server.wait_closed()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+        await self.wait_closed()
+
+    async def _serve(self, reader, writer):
+        decoder = StreamDecoder(framing=self.framing, max_frame_size=self.max_frame_size)
+        tasks = set()
+        self._connections[writer] = (asyncio.current_task(), tasks)
+        # bytes of the frames being handled
+        pending_size = 0
+
+        def done(task, size):
+            nonlocal pending_size
+            tasks.discard(task)
+            pending_size -= size
+        try:
+            while True:
+                data = await reader.read(READ_SIZE)
+                if not data:
+                    break
+                try:
+                    frames = decoder.feed_frames(data)
+                except ValueError as exc:
+                    logger.warning("closing connection: %s", exc)
+                    break
+                for frame in frames:
+                    if self._concurrent:
+                        while tasks and (len(tasks) >= self.max_pending or pending_size >= self.max_pending_size):
+                            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                        task = asyncio.ensure_future(self._respond(frame, writer))
+                        tasks.add(task)
+                        pending_size += len(frame)
+                        task.add_done_callback(lambda task, size=len(frame): done(task, size))
+                    else:
+                        try:
+                            response = self.dispatcher.dispatch(frame)
+                        except Exception:
+                            response = self._failed(frame)
+                        self._write(writer, response)
+                # the responses written so far leave together
+                await writer.drain()
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        except ConnectionError:
+            pass
+        finally:
+            if self._connections.pop(writer, None) is not None:
+                writer.close()
+
+    async def _respond(self, frame, writer):
+        try:
+            response = await self.dispatcher.dispatch(frame)
+        except asyncio.CancelledError:
+            # an Exception on python 3.7
+            raise
+        except Exception:
+            response = self._failed(frame)
+        self._write(writer, response)
+
+    def _failed(self, frame):
+        # called while handling the exception
+        logger.exception("dispatch of a request failed")
+        return _failure_response(frame, self.dispatcher.codec)
+
+    def _write(self, writer, response):
+        if response is not None and not writer.is_closing():
+            writer.write(encode_frame(response, self.framing))
+
+
+class Connection:
+    # One client connection. Calls are pipelined: requests are sent without
+    # waiting for earlier responses, which are routed back by id. Requests
+    # made in the same loop iteration are written together. Calls wait while
+    # the transport's write buffer is over its high-water mark; await drain()
+    # after notify() and batch() for the same.
+
+    def __init__(self, reader, writer, framing='ndjson', max_frame_size=MAX_FRAME_SIZE, **session):
+        self.reader = reader
+        self.writer = writer
+        self.framing = framing
+        self.decoder = StreamDecoder(framing=framing, max_frame_size=max_frame_size)
+        self.session = ClientSession(send=self._send, **session)
+        self.closed = False
+        self._output = []
+        self._drain_lock = None
+        self._task = asyncio.ensure_future(self._read())
+
+    @classmethod
+    async def open(cls, host='127.0.0.1', port=None, path=None, **kwargs):
+        if path is not None:
+            reader, writer = await asyncio.open_unix_connection(path)
+        else:
+            reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer, **kwargs)
+
+    def __len__(self):
+        # pending calls
+        return len(self.session)
+
+    def _send(self, request):
+        if self.closed:
+            raise ConnectionError("connection closed")
+        if not self._output:
+            asyncio.get_event_loop().call_soon(self._flush)
+        self._output.append(encode_frame(request, self.framing))
+
+    def _flush(self):
+        output, self._output = self._output, []
+        if not self.closed and output:
+            self.writer.write(b''.join(output))
+
+    async def _read(self):
+        exception = ConnectionError("connection closed by peer")
+        try:
+            while True:
+                data = await self.reader.read(READ_SIZE)
+                if not data:
+                    break
+                for frame in self.decoder.feed_frames(data):
+                    self.session.feed(frame)
+        except asyncio.CancelledError:
+            exception = ConnectionError("connection closed")
+        except (ConnectionError, ValueError) as exc:
+            exception = ConnectionError(f"connection lost: {exc}")
+        self._lose(exception)
+
+    def _lose(self, exception):
+        if self.closed:
+            return
+        self.closed = True
+        self.session.cancel_all(exception)
+        self.writer.close()
+
+    async def drain(self):
+        # waits until the write buffer is below its high-water mark
+        transport = self.writer.transport
+        if transport.get_write_buffer_size() <= transport.get_write_buffer_limits()[1]:
+            return
+        if self._drain_lock is None:
+            self._drain_lock = asyncio.Lock()
+        # StreamWriter.drain() takes one waiter at a time before python 3.10
+        async with self._drain_lock:
+            await self.writer.drain()
+
+    async def call(self, method, params=None, timeout=None):
+        if self.closed:
+            raise ConnectionError("connection closed")
+        await self.drain()
+        return await self.session.call_async(method, params=params, timeout=timeout)
+
+    def notify(self, method, params=None):
+        self.session.notify(method, params=params)
+
+    def batch(self, calls, timeout=None):
+        # returns an awaitable per call
+        return [asyncio.wrap_future(future) for future in self.session.batch(calls, timeout=timeout)]
+
+    async def ping(self, timeout=None):
+        # True if the server answered
+        try:
+            await self.call(PING_METHOD, timeout=timeout)
+        except JSONCallError:
+            pass
+        except (ConnectionError, TimeoutError):
+            return False
+        return True
+
+    async def close(self):
+        self._flush()
+        self._lose(ConnectionError("connection closed"))
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+
+class Client:
+    # A pool of up to pool_size connections to one server, opened as needed:
+    # calls go to the connection with the fewest pending calls, and a new one
+    # is opened while all are busy. Lost connections fail their pending calls
+    # with ConnectionError and are replaced on the next call. With
+    # health_interval, idle connections are pinged and closed when they don't
+    # answer within health_timeout.
+
+    def __init__(
+        self, host='127.0.0.1', port=None, path=None, pool_size=1, framing='ndjson', max_frame_size=MAX_FRAME_SIZE,
+        timeout=None, max_pending=None, id_generator=None, codec=None, propagate_timeout=False,
+        connect_attempts=3, connect_delay=0.05, health_interval=None, health_timeout=1.0
+    ):
+        if pool_size < 1:
+            raise ValueError("pool_size must be at least 1")
+        _check_framing(framing, codec)
+        self.host = host
+        self.port = port
+        self.path = path
+        self.pool_size = pool_size
+        self.connect_attempts = connect_attempts
+        # doubled after each failed attempt
+        self.connect_delay = connect_delay
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        self._options = {
+            'framing': framing, 'max_frame_size': max_frame_size, 'timeout': timeout,
+            'max_pending': max_pending, 'id_generator': id_generator, 'codec': codec,
+            'propagate_timeout': propagate_timeout,
+        }
+        self.connections = []
+        self._lock = None
+        self._health = None
+
+    async def _open(self):
+        delay = self.connect_delay
+        for attempt in range(self.connect_attempts):
+            try:
+                return await Connection.open(self.host, self.port, path=self.path, **self._options)
+            except OSError:
+                if attempt == self.connect_attempts - 1:
+                    raise
+                logger.debug("connection attempt %d failed, retrying", attempt + 1)
+                await asyncio.sleep(delay)
+                delay *= 2
+
+    async def connection(self):
+        # the connection for the next call
+        connections = self.connections = [c for c in self.connections if not c.closed]
+        best = min(connections, key=len) if connections else None
+        if best is not None and (not len(best) or len(connections) >= self.pool_size):
+            return best
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            # opened by other calls meanwhile
+            connections = self.connections = [c for c in self.connections if not c.closed]
+            if connections:
+                best = min(connections, key=len)
+                if not len(best) or len(connections) >= self.pool_size:
+                    return best
+            try:
+                connection = await self._open()
+            except OSError:
+                if best is None or best.closed:
+                    raise
+                return best
+            self.connections.append(connection)
+        if self.health_interval is not None and self._health is None:
+            self._health = asyncio.ensure_future(self._check_health())
+        return connection
+
+    async def call(self, method, params=None, timeout=None):
+        return await (await self.connection()).call(method, params=params, timeout=timeout)
+
+    async def notify(self, method, params=None):
+        connection = await self.connection()
+        await connection.drain()
+        connection.notify(method, params=params)
+
+    async def batch(self, calls, timeout=None):
+        # returns an awaitable per call
+        connection = await self.connection()
+        await connection.drain()
+        return connection.batch(calls, timeout=timeout)
+
+    async def _check_health(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            idle = [c for c in self.connections if not c.closed and not len(c)]
+            for connection, alive in zip(idle, await asyncio.gather(*[c.ping(self.health_timeout) for c in idle])):
+                if not alive:
+                    logger.warning("closing unresponsive connection")
+                    await connection.close()
+
+    async def close(self):
+        if self._health is not None:
+            self._health.cancel()
+            self._health = None
+        connections, self.connections = self.connections, []
+        for connection in connections:
+            await connection.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
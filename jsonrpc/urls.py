@@ -0,0 +1,168 @@
+import asyncio
+import inspect
+import logging
+import math
+import re
+import typing
+from urllib.parse import unquote, urlparse
+
+from .jsonrpc import JSONCall, JSONCallError, _encode_response, _parse_query
+from .schema import _is_union
+
+logger = logging.getLogger(__name__)
+
+_TRUE = frozenset(['true', '1', 'yes', 'on'])
+_FALSE = frozenset(['false', '0', 'no', 'off'])
+_SEGMENT = re.compile(r'{([A-Za-z_][A-Za-z0-9_]*)}')
+
+
+def _bool(value):
+    lowered = value.lower()
+    if lowered in _TRUE:
+        return True
+    if lowered in _FALSE:
+        return False
+    raise ValueError(f"invalid bool: {value}")
+
+
+def _float(value):
+    # nan and inf aren't valid json, so they can't be params either
+    converted = float(value)
+    if not math.isfinite(converted):
+        raise ValueError(f"invalid float: {value}")
+    return converted
+
+
+_CONVERTERS = {int: int, float: _float, bool: _bool, str: str}
+
+
+def _unwrap_optional(kind):
+    # Optional[X] and X | None are X
+    if _is_union(kind):
+        args = [arg for arg in kind.__args__ if arg is not type(None)]
+        if len(args) == 1:
+            return args[0]
+    return kind
+
+
+def compile_converters(func):
+    # {param name: converter of query strings}, from the annotations of func
+    # or else the types of its defaults; other params are left as strings
+    try:
+        hints = typing.get_type_hints(func)
+    except Exception:
+        hints = {}
+    converters = {}
+    for p in inspect.signature(func).parameters.values():
+        kind = hints.get(p.name)
+        if kind is None and p.default is not p.empty and p.default is not None:
+            kind = type(p.default)
+        convert = _CONVERTERS.get(_unwrap_optional(kind))
+        if convert is not None and convert is not str:
+            converters[p.name] = convert
+    return converters
+
+
+def compile_path(path):
+    # a regex matching path, whose {name} segments become named groups
+    pattern = ''
+    end = 0
+    for match in _SEGMENT.finditer(path):
+        pattern += re.escape(path[end:match.start()]) + f'(?P<{match.group(1)}>[^/]+)'
+        end = match.end()
+    return re.compile(pattern + re.escape(path[end:]) + '$')
+
+
+class UrlRouter:
+    # Builds calls of a dispatcher's methods from GET urls. Paths are mapped
+    # to methods by an exact lookup, or by patterns whose {name} segments are
+    # params. Query values other than id and jsonrpc are params too, and are
+    # converted to the types of the handler's annotations or defaults.
+
+    def __init__(self, dispatcher):
+        self.dispatcher = dispatcher
+        # path: method
+        self._exact = {}
+        # (compiled path, method)
+        self._patterns = []
+        # method: (handler, converters)
+        self._converters = {}
+
+    def add(self, path, method=None):
+        # method defaults to the path without slashes at its ends
+        method = method or path.strip('/')
+        if _SEGMENT.search(path):
+            self._patterns.append((compile_path(path), method))
+        else:
+            self._exact[path] = method
+        return self
+
+    def match(self, path):
+        # (method, params from the path), or None
+        method = self._exact.get(path)
+        if method is not None:
+            return method, {}
+        for pattern, method in self._patterns:
+            match = pattern.match(path)
+            if match is not None:
+                return method, {name: unquote(value) for name, value in match.groupdict().items()}
+        return None
+
+    def converters(self, method):
+        try:
+            func = self.dispatcher._methods[method][0]
+        except KeyError:
+            return {}
+        cached = self._converters.get(method)
+        # compiled again if the method was registered again
+        if cached is None or cached[0] is not func:
+            cached = self._converters[method] = (func, compile_converters(func))
+        return cached[1]
+
+    def call_from_url(self, url):
+        url_parts = urlparse(url)
+        # use only last value for key in query string
+        query = _parse_query(url_parts.query)
+        _id = query.pop('id', False)
+        version = query.pop('jsonrpc', None)
+        matched = self.match(url_parts.path)
+        if matched is None:
+            raise JSONCallError(-32601, _id=_id)
+        method, params = matched
+        # path params win over the query
+        params = {**query, **params}
+        converters = self.converters(method)
+        for name, value in params.items():
+            convert = converters.get(name)
+            if convert is not None:
+                try:
+                    params[name] = convert(value)
+                except ValueError:
+                    raise JSONCallError(-32602, data=f"{name}: expected {convert.__name__.lstrip('_')}", _id=_id)
+        return JSONCall(method, jsonrpc=version, params=params or None, _id=_id, codec=self.dispatcher.codec)
+
+    def dispatch(self, url):
+        # returns the response bytes, or None for notifications (no id)
+        if asyncio.iscoroutinefunction(self.dispatcher.dispatch_call):
+            raise TypeError(f"{type(self.dispatcher).__name__} is async, use dispatch_async")
+        try:
+            call = self.call_from_url(url)
+        except JSONCallError as error:
+            return error.response(codec=self.dispatcher.codec)
+        self.dispatcher.dispatch_call(call)
+        if call.is_notification:
+            return None
+        return _encode_response(call, self.dispatcher.errors)
+
+    async def dispatch_async(self, url):
+        # dispatch for an AsyncDispatcher, whose large results are encoded off the loop
+        if not asyncio.iscoroutinefunction(self.dispatcher.dispatch_call):
+            return self.dispatch(url)
+        try:
+            call = self.call_from_url(url)
+        except JSONCallError as error:
+            return error.response(codec=self.dispatcher.codec)
+        await self.dispatcher.dispatch_call(call)
+        if call.is_notification:
+            return None
+        return await self.dispatcher.encode(call)
@@ -0,0 +1,229 @@
+import unittest
+import asyncio
+import json
+import time
+
+from jsonrpc import admission
+from jsonrpc import client
+from jsonrpc import jsonrpc
+from jsonrpc.aio import AsyncDispatcher
+from jsonrpc.metrics import Metrics
+from jsonrpc.packing import MsgpackCodec
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def request(method, params=None, _id=1, timeout=None):
+    data = jsonrpc.JSONCall(method, params=params, _id=_id).request()
+    if timeout is not None:
+        data = jsonrpc.with_timeout(data, timeout)
+    return data
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_rate_and_burst(self):
+        clock = Clock()
+        bucket = admission.TokenBucket(2, burst=3, clock=clock)
+        self.assertEqual([bucket.take() for _ in range(4)], [True, True, True, False])
+        clock.now = 0.5
+        self.assertEqual([bucket.take() for _ in range(2)], [True, False])
+        clock.now = 100
+        self.assertEqual(sum(bucket.take() for _ in range(10)), 3)
+
+
+class TestAdmissionController(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        self.dispatcher = AsyncDispatcher(metrics=Metrics())
+        self.started = []
+        self.release = None
+
+        async def work(name):
+            self.started.append(name)
+            await self.release.wait()
+            return name
+        self.dispatcher.register(work)
+        self.dispatcher.register(work, name='other')
+        self.dispatcher.register(lambda: 'pong', name='ping')
+
+    def controller(self, **kwargs):
+        return admission.AdmissionController(self.dispatcher, clock=self.clock, **kwargs)
+
+    def run_async(self, coro):
+        async def main():
+            self.release = asyncio.Event()
+            return await coro()
+        return asyncio.run(asyncio.wait_for(main(), 5))
+
+    def code(self, response):
+        return json.loads(response)['error']['code']
+
+    def test_admits_and_queues(self):
+        controller = self.controller(max_concurrency=2, max_queue=10, method_limits={'other': 1})
+
+        async def main():
+            tasks = [asyncio.ensure_future(controller.dispatch(request('work', [i], _id=i))) for i in range(3)]
+            tasks += [asyncio.ensure_future(controller.dispatch(request('other', [i], _id=i))) for i in range(3, 5)]
+            await asyncio.sleep(0.01)
+            self.assertEqual(self.started, [0, 1])
+            self.assertEqual(len(controller), 3)
+            self.release.set()
+            responses = await asyncio.gather(*tasks)
+            self.assertEqual([json.loads(r)['result'] for r in responses], list(range(5)))
+            self.assertEqual(controller.running, 0)
+        self.run_async(main)
+
+    def test_method_limits_and_priorities(self):
+        controller = self.controller(max_concurrency=2, method_limits={'work': 1}, priorities={'other': 1})
+
+        async def main():
+            tasks = [asyncio.ensure_future(controller.dispatch(request('work', ['w%d' % i]))) for i in range(2)]
+            tasks += [asyncio.ensure_future(controller.dispatch(request('other', ['o%d' % i]))) for i in range(2)]
+            await asyncio.sleep(0.01)
+            # work is at its limit, other takes the free slot
+            self.assertEqual(self.started, ['w0', 'o0'])
+            self.release.set()
+            await asyncio.gather(*tasks)
+            self.assertEqual(self.started, ['w0', 'o0', 'o1', 'w1'])
+        self.run_async(main)
+
+    def test_shedding(self):
+        controller = self.controller(max_concurrency=1, max_queue=2)
+
+        async def main():
+            running = asyncio.ensure_future(controller.dispatch(request('work', ['running'])))
+            notification = asyncio.ensure_future(controller.dispatch(request('work', ['notification'], _id=False)))
+            first = asyncio.ensure_future(controller.dispatch(request('work', ['first'], _id=2)))
+            await asyncio.sleep(0.01)
+            # the notification is dropped for a call
+            second = asyncio.ensure_future(controller.dispatch(request('work', ['second'], _id=3)))
+            await asyncio.sleep(0.01)
+            self.assertIsNone(await notification)
+            # then the newest call
+            self.assertEqual(
+                await controller.dispatch(request('work', ['third'], _id=4)),
+                b'{"jsonrpc": "2.0", "error": {"code": -32001, "message": "Server overloaded"}, "id": 4}'
+            )
+            self.release.set()
+            await asyncio.gather(running, first, second)
+            self.assertEqual(self.started, ['running', 'first', 'second'])
+            self.assertEqual(controller.shed[admission.OVERLOADED], 2)
+            self.assertEqual(self.dispatcher.metrics.snapshot()['errors'], {-32001: 2})
+        self.run_async(main)
+
+    def test_rate_limits(self):
+        controller = self.controller(rate_limits={'ping': (1, 2)})
+
+        async def main():
+            responses = [await controller.dispatch(request('ping')) for _ in range(3)]
+            self.assertEqual([json.loads(r).get('result') for r in responses[:2]], ['pong', 'pong'])
+            self.assertEqual(self.code(responses[2]), admission.RATE_LIMITED)
+            self.clock.now = 1
+            self.assertEqual(json.loads(await controller.dispatch(request('ping')))['result'], 'pong')
+            # other methods and unparsable requests aren't limited
+            self.assertEqual(json.loads(await controller.dispatch(request('work', ['x'])))['result'], 'x')
+            self.assertEqual(self.code(await controller.dispatch(b'{')), -32700)
+        self.release = asyncio.Event()
+        self.release.set()
+        asyncio.run(main())
+
+    def test_deadlines(self):
+        controller = self.controller(max_concurrency=1)
+
+        async def main():
+            running = asyncio.ensure_future(controller.dispatch(request('work', ['running'])))
+            expiring = asyncio.ensure_future(controller.dispatch(request('work', ['expiring'], _id=2, timeout=1)))
+            waiting = asyncio.ensure_future(controller.dispatch(request('work', ['waiting'], _id=3, timeout=10)))
+            await asyncio.sleep(0.01)
+            self.clock.now = 5
+            self.release.set()
+            self.assertEqual(self.code(await expiring), admission.DEADLINE_EXCEEDED)
+            self.assertEqual(json.loads(await waiting)['result'], 'waiting')
+            await running
+            self.assertEqual(self.started, ['running', 'waiting'])
+            self.assertEqual(self.code(await controller.dispatch(request('ping', timeout=0))), admission.DEADLINE_EXCEEDED)
+        self.run_async(main)
+
+    def test_cancelled_while_queued(self):
+        controller = self.controller(max_concurrency=1)
+
+        async def main():
+            running = asyncio.ensure_future(controller.dispatch(request('work', ['running'])))
+            waiting = asyncio.ensure_future(controller.dispatch(request('work', ['waiting'])))
+            await asyncio.sleep(0.01)
+            waiting.cancel()
+            await asyncio.sleep(0.01)
+            self.assertEqual(len(controller), 0)
+            self.release.set()
+            await running
+            self.assertEqual(controller.running, 0)
+        self.run_async(main)
+
+    def test_expired_while_waiting(self):
+        # answered at the deadline, while the slot is still taken
+        controller = admission.AdmissionController(self.dispatcher, max_concurrency=1)
+
+        async def main():
+            running = asyncio.ensure_future(controller.dispatch(request('work', ['running'])))
+            await asyncio.sleep(0)
+            expiring = controller.dispatch(request('work', ['expiring'], _id=2, timeout=0.05))
+            self.assertEqual(self.code(await asyncio.wait_for(expiring, 1)), admission.DEADLINE_EXCEEDED)
+            self.assertEqual(len(controller), 0)
+            self.release.set()
+            await running
+        self.run_async(main)
+
+    def test_many_waiting(self):
+        # shedding and admitting take O(log n)
+        controller = self.controller(max_concurrency=1, max_queue=5000, method_limits={'other': 1})
+
+        async def main():
+            start = time.perf_counter()
+            tasks = [
+                asyncio.ensure_future(controller.dispatch(request('work' if i % 2 else 'other', [i], _id=i)))
+                for i in range(20000)
+            ]
+            await asyncio.sleep(0)
+            self.assertEqual(len(controller), 5000)
+            self.release.set()
+            responses = await asyncio.gather(*tasks)
+            self.assertEqual(sum('result' in json.loads(r) for r in responses), 5001)
+            self.assertLess(time.perf_counter() - start, 20)
+            # entries which left the queue are dropped from its heaps
+            await controller.dispatch(request('ping'))
+            self.assertEqual(len(controller._least), 0)
+        self.run_async(main)
+
+    def test_server_errors_changed(self):
+        controller = self.controller()
+        self.assertIn(b'Server overloaded', controller._response(admission.OVERLOADED, 1))
+        self.addCleanup(jsonrpc.set_server_errors, jsonrpc._SERVER_ERRORS)
+        jsonrpc.set_server_errors({admission.OVERLOADED: 'Busy'})
+        self.assertIn(b'"Busy"', controller._response(admission.OVERLOADED, 1))
+
+    def test_binary_codec(self):
+        codec = MsgpackCodec()
+        self.dispatcher.codec = codec
+        controller = self.controller(rate_limits={'ping': (1, 1)})
+
+        async def main():
+            data = jsonrpc.with_timeout(jsonrpc.JSONCall('ping', _id=1, codec=codec).request(), 5, codec)
+            self.assertEqual(codec.loads(await controller.dispatch(data))['result'], 'pong')
+            self.assertEqual(codec.loads(await controller.dispatch(data))['error']['code'], admission.RATE_LIMITED)
+        asyncio.run(main())
+
+
+class TestPropagateTimeout(unittest.TestCase):
+    def test_sent_with_request(self):
+        sent = []
+        session = client.ClientSession(send=sent.append, timeout=2.5, propagate_timeout=True)
+        session.call('subtract', params=[42, 23])
+        session.call('subtract', params=[42, 23], timeout=1)
+        self.assertEqual([json.loads(r)['timeout'] for r in sent], [2.5, 1])
+        self.assertEqual(jsonrpc.JSONCall.from_request(sent[0]).args, [42, 23])
@@ -0,0 +1,138 @@
+import unittest
+import asyncio
+import json
+import threading
+
+from jsonrpc import aio
+
+
+class TestAsyncDispatcher(unittest.TestCase):
+    def setUp(self):
+        self.dispatcher = aio.AsyncDispatcher(max_concurrency=2, encode_threshold=3)
+        self.running = 0
+        self.peak = 0
+
+        @self.dispatcher.register
+        async def sleep(value):
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+            await asyncio.sleep(0.01)
+            self.running -= 1
+            return value
+
+        @self.dispatcher.register
+        def add(a, b):
+            return a + b
+
+        @self.dispatcher.register
+        async def fail():
+            raise ValueError("nope")
+
+        @self.dispatcher.register
+        def items(n):
+            return list(range(n))
+
+        @self.dispatcher.register
+        def text(n):
+            return ['x' * n]
+
+    def dispatch(self, request):
+        return asyncio.run(self.dispatcher.dispatch(request))
+
+    def test_dispatch_iter(self):
+        chunks = asyncio.run(self.dispatcher.dispatch_iter(
+            '[{"jsonrpc": "2.0", "method": "items", "params": [500], "id": 1}, {"jsonrpc": "2.0", "method": "sleep", "params": [1], "id": 2}]',
+            chunk_size=100
+        ))
+        response = json.loads(b''.join(chunks))
+        self.assertEqual([r['result'] for r in response], [list(range(500)), 1])
+
+    def test_dispatch_stream(self):
+        request = b'[{"jsonrpc": "2.0", "method": "sleep", "params": [1], "id": 1}, {"jsonrpc": "2.0", "method": "add", "params": [1, 2], "id": 2}]'
+
+        async def chunks():
+            for i in range(0, len(request), 10):
+                yield request[i:i+10]
+
+        async def read(source, **kwargs):
+            return b''.join([chunk async for chunk in self.dispatcher.dispatch_stream(source, **kwargs)])
+        self.assertEqual(asyncio.run(read(chunks())), self.dispatch(request))
+        self.assertEqual(asyncio.run(read([request])), self.dispatch(request))
+        response = json.loads(asyncio.run(read([request], max_items=1)))
+        self.assertEqual([r.get('result') for r in response], [1, None])
+        self.assertEqual(response[1]['error']['code'], -32600)
+
+    def test_single(self):
+        self.assertEqual(
+            self.dispatch('{"jsonrpc": "2.0", "method": "sleep", "params": [3], "id": 1}'),
+            b'{"jsonrpc": "2.0", "result": 3, "id": 1}'
+        )
+        self.assertEqual(
+            self.dispatch('{"jsonrpc": "2.0", "method": "add", "params": [1, 2], "id": 1}'),
+            b'{"jsonrpc": "2.0", "result": 3, "id": 1}'
+        )
+        self.assertIsNone(self.dispatch('{"jsonrpc": "2.0", "method": "sleep", "params": [3]}'))
+
+    def test_errors(self):
+        self.assertEqual(
+            self.dispatch('{"jsonrpc": "2.0", "method": "fail", "id": 1}'),
+            b'{"jsonrpc": "2.0", "error": {"code": -32603, "message": "Internal error"}, "id": 1}'
+        )
+        self.assertEqual(json.loads(self.dispatch('{"jsonrpc": "2.0", "method": "nope", "id": 1}'))['error']['code'], -32601)
+        self.assertEqual(json.loads(self.dispatch('{"jsonrpc": "2.0", "method": "add", "id": 1}'))['error']['code'], -32602)
+        self.assertEqual(json.loads(self.dispatch('{"jsonrpc": "2.0", "method": "add"'))['error']['code'], -32700)
+
+    def test_failing_generator(self):
+        @self.dispatcher.register
+        def rows(n):
+            yield from range(n)
+            raise KeyError('row')
+        for request in [
+            '{"jsonrpc": "2.0", "method": "rows", "params": [1], "id": 1}',
+            '[{"jsonrpc": "2.0", "method": "rows", "params": [1], "id": 1}]',
+        ]:
+            with self.subTest(request):
+                with self.assertLogs('jsonrpc.jsonrpc', 'ERROR'):
+                    response = json.loads(self.dispatch(request))
+                if isinstance(response, list):
+                    response, = response
+                self.assertEqual(response['error']['code'], -32603)
+
+    def test_batch_bounded(self):
+        request = json.dumps([
+            {"jsonrpc": "2.0", "method": "sleep", "params": [i], "id": i} for i in range(6)
+        ] + [{"jsonrpc": "2.0", "method": "sleep", "params": [0]}, {"foo": "boo"}])
+        response = json.loads(self.dispatch(request))
+        self.assertEqual([r.get('result') for r in response], list(range(6)) + [None])
+        self.assertEqual(response[-1]['error']['code'], -32600)
+        self.assertEqual(self.peak, 2)
+        self.assertIsNone(self.dispatch('[{"jsonrpc": "2.0", "method": "sleep", "params": [0]}]'))
+
+    def test_large_results_encoded_off_loop(self):
+        self.assertEqual(
+            json.loads(self.dispatch('{"jsonrpc": "2.0", "method": "items", "params": [5], "id": 1}'))['result'],
+            [0, 1, 2, 3, 4]
+        )
+        calls = []
+        original = aio.JSONCall.response
+
+        def response(call, *args, **kwargs):
+            calls.append(threading.current_thread())
+            return original(call, *args, **kwargs)
+        aio.JSONCall.response = response
+        try:
+            self.dispatch('{"jsonrpc": "2.0", "method": "items", "params": [5], "id": 1}')
+            self.dispatch('{"jsonrpc": "2.0", "method": "items", "params": [1], "id": 1}')
+            # a short list of a long string is large too
+            self.dispatch('{"jsonrpc": "2.0", "method": "text", "params": [10], "id": 1}')
+            self.dispatch('{"jsonrpc": "2.0", "method": "text", "params": [0], "id": 1}')
+        finally:
+            aio.JSONCall.response = original
+        main = threading.main_thread()
+        self.assertEqual([thread is main for thread in calls], [False, True, False, True])
+
+    def test_semaphore_per_loop(self):
+        # more calls than max_concurrency, so they wait on it in each loop
+        request = json.dumps([{"jsonrpc": "2.0", "method": "sleep", "params": [i], "id": i} for i in range(3)])
+        for _ in range(2):
+            self.assertEqual([r['result'] for r in json.loads(self.dispatch(request))], [0, 1, 2])
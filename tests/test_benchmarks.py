@@ -0,0 +1,38 @@
+import unittest
+import io
+
+from benchmarks import bench_hotpaths
+from benchmarks import bench_from_url
+from benchmarks import bench_prefork
+from benchmarks import bench_shm
+
+
+class TestBenchmarks(unittest.TestCase):
+    def test_cases_run(self):
+        for name, func in bench_hotpaths.cases().items():
+            with self.subTest(name):
+                func()
+
+    def test_from_url_cases_run(self):
+        for name, func in bench_from_url.cases().items():
+            with self.subTest(name):
+                func()
+
+    def test_compare(self):
+        current = bench_hotpaths.run(['response/error/parse'], repeat=1, min_time=0.001, out=io.StringIO())
+        result = current['results']['response/error/parse']
+        baseline = {'results': {'response/error/parse': {**result, 'best': result['best'] / 2}}}
+        self.assertEqual(bench_hotpaths.compare(current, baseline, 0.1), ['response/error/parse'])
+        baseline['results']['response/error/parse']['best'] = result['best'] * 2
+        self.assertEqual(bench_hotpaths.compare(current, baseline, 0.1), [])
+
+    def test_prefork_runs(self):
+        self.assertGreater(bench_prefork.run(1, duration=0.2, concurrency=2), 0)
+
+    @unittest.skipIf(bench_shm.shm.shared_memory is None, "needs python 3.8+")
+    def test_shm_runs(self):
+        for name in bench_shm.TRANSPORTS:
+            with self.subTest(name):
+                latency, rate = bench_shm.run(name, duration=0.2, concurrency=2)
+                self.assertGreater(latency, 0)
+                self.assertGreater(rate, 0)
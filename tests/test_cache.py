@@ -0,0 +1,141 @@
+import unittest
+import asyncio
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from jsonrpc import jsonrpc
+from jsonrpc import cache
+from jsonrpc.dispatcher import Dispatcher
+from jsonrpc.aio import AsyncDispatcher
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+def request(method, params=None, _id=1):
+    return jsonrpc.JSONCall(method, params=params, _id=_id).request()
+
+
+class TestResultCache(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        self.cache = cache.ResultCache(maxsize=2, ttl=10, clock=self.clock)
+
+    def test_canonical_params(self):
+        self.assertEqual(cache.canonical_params({'b': 1, 'a': [1, 2]}), cache.canonical_params({'a': [1, 2], 'b': 1}))
+        self.assertNotEqual(cache.canonical_params([1]), cache.canonical_params([1.0]))
+        self.assertNotEqual(cache.canonical_params([1]), cache.canonical_params({'0': 1}))
+        self.assertEqual(cache.canonical_params(None), cache.canonical_params([]))
+
+    def test_lru(self):
+        self.cache.set('a', [1], {'x': 1})
+        self.cache.set('a', [2], 2)
+        self.assertEqual(self.cache.get('a', [1]), jsonrpc.EncodedResult(b'{"x": 1}'))
+        # [2] is the least recently used
+        self.cache.set('b', None, 3)
+        self.assertIsNone(self.cache.get('a', [2]))
+        self.assertEqual(len(self.cache), 2)
+        with self.assertRaises(ValueError):
+            cache.ResultCache(maxsize=0)
+
+    def test_ttl(self):
+        self.cache.set('a', [1], 1)
+        self.clock.now = 9.9
+        self.assertIsNotNone(self.cache.get('a', [1]))
+        self.clock.now = 10
+        self.assertIsNone(self.cache.get('a', [1]))
+        self.assertEqual(len(self.cache), 0)
+
+    def test_invalidate(self):
+        self.cache = cache.ResultCache(maxsize=None)
+        for method, params in [('a', [1]), ('a', [2]), ('b', [1])]:
+            self.cache.set(method, params, 1)
+        self.cache.invalidate('a', [1])
+        self.assertIsNone(self.cache.get('a', [1]))
+        self.assertIsNotNone(self.cache.get('a', [2]))
+        self.cache.invalidate('a')
+        self.assertEqual(len(self.cache), 1)
+        self.cache.invalidate()
+        self.assertEqual(len(self.cache), 0)
+
+
+class TestDispatcherCache(unittest.TestCase):
+    def setUp(self):
+        self.calls = []
+        self.cache = cache.ResultCache()
+        self.dispatcher = Dispatcher()
+
+        @self.dispatcher.register(cache=self.cache)
+        def lookup(key, fail=False):
+            self.calls.append(key)
+            if fail:
+                raise ValueError(key)
+            return {'key': key}
+
+    def test_dispatch(self):
+        for _id in [1, 2]:
+            self.assertEqual(
+                self.dispatcher.dispatch(request('lookup', {'key': 'a'}, _id)),
+                b'{"jsonrpc": "2.0", "result": {"key": "a"}, "id": %d}' % _id
+            )
+        self.dispatcher.dispatch(request('lookup', ['b']))
+        self.assertEqual(self.calls, ['a', 'b'])
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 2))
+        self.cache.invalidate('lookup')
+        self.dispatcher.dispatch(request('lookup', {'key': 'a'}))
+        self.assertEqual(self.calls, ['a', 'b', 'a'])
+
+    def test_errors_not_cached(self):
+        for _ in range(2):
+            response = json.loads(self.dispatcher.dispatch(request('lookup', ['a', True])))
+            self.assertEqual(response['error']['code'], -32603)
+        self.assertEqual(self.calls, ['a', 'a'])
+        self.assertEqual(len(self.cache._inflight), 0)
+
+    def test_single_flight(self):
+        release = threading.Event()
+        started = threading.Event()
+        dispatcher = Dispatcher()
+
+        @dispatcher.register(cache=self.cache)
+        def slow(key):
+            self.calls.append(key)
+            started.set()
+            release.wait()
+            return key
+
+        with ThreadPoolExecutor(4) as executor:
+            first = executor.submit(dispatcher.dispatch, request('slow', ['a'], 0))
+            started.wait()
+            others = [executor.submit(dispatcher.dispatch, request('slow', ['a'], i)) for i in range(1, 4)]
+            while len(self.cache._inflight) and self.cache.hits < 3:
+                threading.Event().wait(0.001)
+            release.set()
+            responses = [json.loads(f.result()) for f in [first] + others]
+        self.assertEqual(self.calls, ['a'])
+        self.assertEqual([(r['result'], r['id']) for r in responses], [('a', i) for i in range(4)])
+
+    def test_async(self):
+        dispatcher = AsyncDispatcher()
+
+        @dispatcher.register(cache=self.cache)
+        async def fetch(key):
+            self.calls.append(key)
+            await asyncio.sleep(0.01)
+            return key
+
+        async def main():
+            return await asyncio.gather(*[dispatcher.dispatch(request('fetch', ['a'], i)) for i in range(3)])
+        responses = [json.loads(r) for r in asyncio.run(main())]
+        self.assertEqual([r['result'] for r in responses], ['a'] * 3)
+        self.assertEqual(self.calls, ['a'])
+
+
+if __name__ == '__main__':
+    unittest.main()
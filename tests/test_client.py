@@ -0,0 +1,153 @@
+import unittest
+import asyncio
+import json
+import threading
+import time
+
+from jsonrpc import jsonrpc
+from jsonrpc import client
+from jsonrpc.dispatcher import Dispatcher
+
+
+class TestClientSession(unittest.TestCase):
+    def setUp(self):
+        self.sent = []
+        self.session = client.ClientSession(send=self.sent.append)
+        self.dispatcher = Dispatcher()
+        self.dispatcher.register(lambda a, b: a - b, name='subtract')
+
+    def serve(self):
+        # answer everything sent so far, in reverse order
+        responses = [self.dispatcher.dispatch(request) for request in self.sent]
+        self.sent.clear()
+        for response in reversed(responses):
+            if response is not None:
+                self.session.feed(response)
+
+    def test_pipelined(self):
+        futures = [self.session.call('subtract', params=[i, 1]) for i in range(10)]
+        self.session.notify('subtract', params=[1, 1])
+        self.assertEqual(len(self.session), 10)
+        self.assertEqual(len(self.sent), 11)
+        self.serve()
+        self.assertEqual([f.result(timeout=0) for f in futures], list(range(-1, 9)))
+        self.assertEqual(len(self.session), 0)
+
+    def test_errors(self):
+        future = self.session.call('missing')
+        self.serve()
+        with self.assertRaises(jsonrpc.JSONCallError) as e:
+            future.result(timeout=0)
+        self.assertEqual(e.exception.code, -32601)
+        # unmatched and unparsable responses are discarded
+        self.session.feed(b'{"jsonrpc": "2.0", "result": 1, "id": "unknown"}')
+        self.session.feed(b'{"jsonrpc": "2.0", "error": {"code": -32700, "message": "Parse error"}, "id": null}')
+        self.session.feed(b'not json')
+        with self.assertRaises(Exception):
+            client.ClientSession().call('subtract', params=[1, 2])
+
+    def test_batch(self):
+        futures = self.session.batch([('subtract', [2, 1]), ('missing', None), ('subtract', {'a': 5, 'b': 1})])
+        self.assertEqual(len(json.loads(self.sent[0])), 3)
+        self.serve()
+        self.assertEqual(futures[0].result(timeout=0), 1)
+        self.assertIsInstance(futures[1].exception(timeout=0), jsonrpc.JSONCallError)
+        self.assertEqual(futures[2].result(timeout=0), 4)
+
+    def test_timeouts(self):
+        session = client.ClientSession(send=self.sent.append, timeout=10)
+        slow = session.call('subtract', params=[1, 1])
+        fast = session.call('subtract', params=[1, 1], timeout=1)
+        self.assertEqual(len(session), 2)
+        session.expire(now=session._deadlines[0][0])
+        self.assertIsInstance(fast.exception(timeout=0), TimeoutError)
+        self.assertFalse(slow.done())
+        self.assertEqual(len(session), 1)
+        # a late response is discarded
+        self.session = session
+        self.serve()
+        self.assertEqual(slow.result(timeout=0), 0)
+        self.assertEqual(len(session), 0)
+
+    def test_timeout_while_waiting(self):
+        # nothing is fed, the wait itself times the call out
+        session = client.ClientSession(send=self.sent.append, timeout=0.05)
+        future = session.call('subtract', params=[1, 1])
+        start = time.monotonic()
+        with self.assertRaises(TimeoutError):
+            future.result()
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual(len(session), 0)
+        # a shorter wait than the deadline is the caller's own timeout
+        future = session.call('subtract', params=[1, 1], timeout=10)
+        with self.assertRaises(TimeoutError):
+            future.result(timeout=0.01)
+        self.assertEqual(len(session), 1)
+
+    def test_threads(self):
+        # calls made and answered from several threads
+        session = client.ClientSession(send=lambda request: session.feed(self.dispatcher.dispatch(request)), timeout=10)
+
+        def run():
+            for i in range(500):
+                self.assertEqual(session.call('subtract', params=[i, 1]).result(), i - 1)
+        threads = [threading.Thread(target=run) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(session), 0)
+
+    def test_send_failures(self):
+        def send(request):
+            raise ConnectionError("closed")
+        session = client.ClientSession(send=send, timeout=1, max_pending=1, id_generator=lambda: 1)
+        for _ in range(2):
+            with self.assertRaises(ConnectionError):
+                session.call('subtract', params=[1, 1])
+            with self.assertRaises(ConnectionError):
+                session.batch([('subtract', [1, 1])])
+            self.assertEqual(len(session), 0)
+        # the deadlines of unsent calls don't expire a call reusing their id
+        session.send = self.sent.append
+        deadline = session._deadlines[0][0]
+        future = session.call('subtract', params=[1, 1], timeout=10)
+        session.expire(now=deadline)
+        self.assertFalse(future.done())
+
+    def test_error_without_id(self):
+        future = self.session.call('subtract', params=[1, 1])
+        error = b'{"jsonrpc": "2.0", "error": {"code": -32700, "message": "Parse error"}, "id": null}'
+        self.session.feed(error)
+        self.assertEqual(future.exception(timeout=0).code, -32700)
+        futures = [self.session.call('subtract', params=[1, 1]) for _ in range(2)]
+        with self.assertLogs('jsonrpc.client', 'WARNING'):
+            self.session.feed(error)
+        self.assertFalse(any(f.done() for f in futures))
+        self.assertEqual(self.session.unmatched[-1].code, -32700)
+
+    def test_max_pending(self):
+        session = client.ClientSession(send=self.sent.append, max_pending=2)
+        session.call('subtract', params=[1, 1])
+        session.call('subtract', params=[1, 1])
+        with self.assertRaises(Exception):
+            session.call('subtract', params=[1, 1])
+        with self.assertRaises(Exception):
+            session.batch([('subtract', [1, 1])])
+        self.assertEqual(len(session), 2)
+        session.cancel_all()
+        self.assertEqual(len(session), 0)
+
+    def test_asyncio(self):
+        async def main():
+            future = self.session.call_async('subtract', params=[5, 2])
+            timed_out = self.session.call_async('subtract', params=[5, 2], timeout=0.01)
+            asyncio.get_event_loop().call_soon(self.serve)
+            self.assertEqual(await future, 3)
+            await asyncio.sleep(0.02)
+            self.assertEqual(await timed_out, 3)
+            self.session.send = lambda request: None
+            with self.assertRaises(TimeoutError):
+                await self.session.call_async('subtract', params=[5, 2], timeout=0.01)
+            self.assertEqual(len(self.session), 0)
+        asyncio.run(main())
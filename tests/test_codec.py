@@ -0,0 +1,96 @@
+import unittest
+import json
+from unittest import mock
+
+from jsonrpc import codec
+from jsonrpc import jsonrpc
+
+SAMPLES = [
+    '{"jsonrpc": "2.0", "method": "subtract", "params": [42, 23], "id": 1}',
+    '{"jsonrpc": "2.0", "result": {"a": [1, 2.5, 1e+16, -0.0, true, null], "b": "é\\u0000\\"/"}, "id": "x"}',
+    '{"big": 123456789012345678901234567890, "nan": NaN}',
+    '[{"jsonrpc": "2.0", "method": "update", "params": {"ü": "😀"}}]',
+]
+
+
+class TestCodec(unittest.TestCase):
+    def setUp(self):
+        self.codecs = [codec.make_codec(name) for name in codec.available_codecs()]
+        self.codecs += [codec.make_codec(name, fast_dumps=True) for name in codec.available_codecs() if name != 'json']
+        self.addCleanup(codec.set_codec, codec.get_codec())
+
+    def test_available(self):
+        self.assertEqual(codec.available_codecs()[-1], 'json')
+        with self.assertRaises(ValueError):
+            codec.make_codec('yaml')
+        with self.assertRaises(TypeError):
+            codec.set_codec(object())
+
+    def test_backends_agree(self):
+        for sample in SAMPLES:
+            expected = json.loads(sample)
+            for c in self.codecs:
+                for data in [sample, sample.encode('utf8'), memoryview(sample.encode('utf8'))]:
+                    loaded = c.loads(data)
+                    # NaN != NaN, so compare the stdlib encoding
+                    self.assertEqual(json.dumps(loaded), json.dumps(expected), c)
+        for c in self.codecs:
+            with self.assertRaises(ValueError):
+                c.loads('{"jsonrpc": "2.0", "method": "foobar, "params": "bar", "baz]')
+
+    def test_invalid_parsed_once(self):
+        # only input the backend doesn't support falls back to stdlib json
+        for c in self.codecs:
+            if c.name == 'json':
+                continue
+            with mock.patch.object(codec.JSONCodec, 'loads', side_effect=AssertionError) as loads:
+                with self.assertRaises(ValueError):
+                    c.loads(b'{"jsonrpc": "2.0", "method": "foobar, "params": "bar", "baz]')
+                self.assertFalse(loads.called)
+            self.assertEqual(json.dumps(c.loads(b'[1e400]')), '[Infinity]')
+
+    def test_byte_for_byte(self):
+        for sample in SAMPLES:
+            obj = json.loads(sample)
+            expected = json.dumps(obj, ensure_ascii=False)
+            for c in self.codecs:
+                if getattr(c, 'fast_dumps', False):
+                    continue
+                self.assertEqual(c.dumps(obj), expected, c)
+                self.assertEqual(c.dumpb(obj), expected.encode('utf8'), c)
+
+    def test_fast_dumps_round_trip(self):
+        for sample in SAMPLES[:2] + SAMPLES[3:]:
+            obj = json.loads(sample)
+            for c in self.codecs:
+                self.assertEqual(json.loads(c.dumpb(obj)), obj, c)
+
+    def test_jsoncall(self):
+        request = '{"jsonrpc": "2.0", "method": "subtract", "params": [42, 23], "id": 1}'
+        response = b'{"jsonrpc": "2.0", "result": 19, "id": 1}'
+        for c in self.codecs:
+            codec.set_codec(c)
+            call = jsonrpc.JSONCall.from_request(request)
+            self.assertEqual(call.args, [42, 23])
+            call.set_result(19)
+            if not getattr(c, 'fast_dumps', False):
+                self.assertEqual(call.request(encoding=None), request)
+                self.assertEqual(call.response(), response)
+            client = jsonrpc.JSONCall('subtract', params=[42, 23], _id=1)
+            client.assign_response(call.response())
+            self.assertEqual(client.result, 19)
+
+    def test_per_call(self):
+        codec.set_codec('json')
+        fast = [c for c in self.codecs if getattr(c, 'fast_dumps', False)]
+        if not fast:
+            self.skipTest("no fast codec available")
+        call = jsonrpc.JSONCall.from_request(
+            '{"jsonrpc": "2.0", "method": "subtract", "params": [42, 23], "id": 1}',
+            codec=fast[0]
+        )
+        self.assertIs(call.codec, fast[0])
+        call.set_result(19)
+        self.assertEqual(call.response(), b'{"jsonrpc":"2.0","result":19,"id":1}')
+        # stdlib formatting options are still honoured
+        self.assertEqual(call.response(encoding=None, indent=None, separators=(',', ':')), '{"jsonrpc":"2.0","result":19,"id":1}')
@@ -0,0 +1,226 @@
+import unittest
+import json
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from jsonrpc import dispatcher, codec
+from jsonrpc.aio import AsyncDispatcher
+
+
+def subtract(minuend, subtrahend):
+    return minuend - subtrahend
+
+
+def greet(name, greeting='hello', *, punctuation='!'):
+    return f"{greeting} {name}{punctuation}"
+
+
+def total(*values):
+    return sum(values)
+
+
+def fail():
+    raise RuntimeError("boom")
+
+
+class TestDispatcher(unittest.TestCase):
+    def setUp(self):
+        self.dispatcher = dispatcher.Dispatcher()
+        for func in [subtract, greet, total, fail]:
+            self.dispatcher.register(func)
+
+    def dispatch(self, request):
+        return json.loads(self.dispatcher.dispatch(request))
+
+    def assertInvalidParams(self, request):
+        response = self.dispatch(request)
+        self.assertEqual(response['error']['code'], -32602, response)
+
+    def test_register(self):
+        @self.dispatcher.register(name='math.add')
+        def add(a, b):
+            return a + b
+        self.assertIn('math.add', self.dispatcher)
+        self.assertEqual(self.dispatcher.methods, ['subtract', 'greet', 'total', 'fail', 'math.add'])
+        with self.assertRaises(ValueError):
+            self.dispatcher.register(add, name='rpc.add')
+        self.dispatcher.unregister('math.add')
+        self.assertNotIn('math.add', self.dispatcher)
+        # callables without a __name__ need one
+        with self.assertRaises(TypeError):
+            self.dispatcher.register(partial(subtract, 10))
+        self.dispatcher.register(partial(subtract, 10), name='from_ten')
+        self.assertEqual(self.dispatch('{"jsonrpc": "2.0", "method": "from_ten", "params": [3], "id": 1}')['result'], 7)
+
+    def test_dispatch(self):
+        self.assertEqual(
+            self.dispatcher.dispatch('{"jsonrpc": "2.0", "method": "subtract", "params": [42, 23], "id": 1}'),
+            b'{"jsonrpc": "2.0", "result": 19, "id": 1}'
+        )
+        self.assertEqual(
+            self.dispatch('{"jsonrpc": "2.0", "method": "subtract", "params": {"subtrahend": 23, "minuend": 42}, "id": 3}')['result'],
+            19
+        )
+        self.assertEqual(
+            self.dispatch('{"jsonrpc": "2.0", "method": "greet", "params": {"name": "bob", "punctuation": "?"}, "id": 3}')['result'],
+            "hello bob?"
+        )
+        self.assertEqual(self.dispatch('{"jsonrpc": "2.0", "method": "total", "params": [1, 2, 3], "id": 1}')['result'], 6)
+        self.assertEqual(self.dispatch('{"jsonrpc": "2.0", "method": "total", "id": 1}')['result'], 0)
+        self.assertIsNone(self.dispatcher.dispatch('{"jsonrpc": "2.0", "method": "subtract", "params": [42, 23]}'))
+
+    def test_errors(self):
+        self.assertEqual(
+            self.dispatcher.dispatch('{"jsonrpc": "2.0", "method": "foobar", "id": "1"}'),
+            b'{"jsonrpc": "2.0", "error": {"code": -32601, "message": "Method not found"}, "id": "1"}'
+        )
+        self.assertEqual(
+            self.dispatcher.dispatch('{"jsonrpc": "2.0", "method": "foobar, "params": "bar", "baz]'),
+            b'{"jsonrpc": "2.0", "error": {"code": -32700, "message": "Parse error"}, "id": null}'
+        )
+        self.assertEqual(self.dispatch('{"jsonrpc": "2.0", "method": "fail", "id": 1}')['error']['code'], -32603)
+
+    def test_unencodable_result(self):
+        self.dispatcher.register(lambda: {1, 2}, name='numbers')
+        with self.assertLogs('jsonrpc.jsonrpc', 'ERROR'):
+            self.assertEqual(
+                self.dispatcher.dispatch('{"jsonrpc": "2.0", "method": "numbers", "id": 1}'),
+                b'{"jsonrpc": "2.0", "error": {"code": -32603, "message": "Internal error"}, "id": 1}'
+            )
+            response = self.dispatch(
+                '[{"jsonrpc": "2.0", "method": "numbers", "id": 1}, {"jsonrpc": "2.0", "method": "total", "params": [1], "id": 2}]'
+            )
+        self.assertEqual([r.get('error', {}).get('code') for r in response], [-32603, None])
+        self.assertEqual(response[1]['result'], 1)
+        self.dispatcher.errors.register(TypeError, -32000, message="Unsupported result")
+        self.assertEqual(self.dispatch('{"jsonrpc": "2.0", "method": "numbers", "id": 1}')['error']['code'], -32000)
+
+    def test_failing_generator(self):
+        def rows(n):
+            yield from range(n)
+            raise KeyError('row')
+        self.dispatcher.register(rows)
+        request = '{"jsonrpc": "2.0", "method": "rows", "params": [2], "id": 1}'
+        with self.assertLogs('jsonrpc.jsonrpc', 'ERROR'):
+            self.assertEqual(self.dispatch(request)['error']['code'], -32603)
+            response = self.dispatch('[%s, {"jsonrpc": "2.0", "method": "total", "params": [1], "id": 2}]' % request)
+        self.assertEqual([r.get('error', {}).get('code') for r in response], [-32603, None])
+        self.dispatcher.errors.register(KeyError, -32004)
+        self.assertEqual(self.dispatch(request)['error']['code'], -32004)
+
+    def test_invalid_params(self):
+        self.assertInvalidParams('{"jsonrpc": "2.0", "method": "subtract", "params": [42], "id": 1}')
+        self.assertInvalidParams('{"jsonrpc": "2.0", "method": "subtract", "params": [42, 23, 1], "id": 1}')
+        self.assertInvalidParams('{"jsonrpc": "2.0", "method": "subtract", "params": {"minuend": 42}, "id": 1}')
+        self.assertInvalidParams('{"jsonrpc": "2.0", "method": "subtract", "params": {"minuend": 42, "subtrahend": 1, "x": 1}, "id": 1}')
+        self.assertInvalidParams('{"jsonrpc": "2.0", "method": "greet", "params": {"greeting": "hi"}, "id": 1}')
+        self.assertInvalidParams('{"jsonrpc": "2.0", "method": "total", "params": {"values": 1}, "id": 1}')
+        response = self.dispatch('{"jsonrpc": "2.0", "method": "subtract", "params": [42], "id": 1}')
+        self.assertEqual(response['error']['data'], "expected 2 params, got 1")
+        self.assertEqual(response['id'], 1)
+
+        def keyword_only(*, a):
+            return a
+        self.dispatcher.register(keyword_only)
+        self.assertInvalidParams('{"jsonrpc": "2.0", "method": "keyword_only", "params": [1], "id": 1}')
+        self.assertEqual(self.dispatch('{"jsonrpc": "2.0", "method": "keyword_only", "params": {"a": 1}, "id": 1}')['result'], 1)
+
+    def test_bound_methods(self):
+        class Service:
+            offset = 10
+
+            def shift(self, value):
+                return value + self.offset
+
+            def _private(self):
+                pass
+
+        self.dispatcher.register_object(Service(), prefix='service.')
+        self.assertIn('service.shift', self.dispatcher)
+        self.assertNotIn('service._private', self.dispatcher)
+        self.assertEqual(self.dispatch('{"jsonrpc": "2.0", "method": "service.shift", "params": [1], "id": 1}')['result'], 11)
+
+    def test_batch(self):
+        request = """[
+            {"jsonrpc": "2.0", "method": "total", "params": [1,2,4], "id": "1"},
+            {"jsonrpc": "2.0", "method": "subtract", "params": [42,23], "id": "2"},
+            {"jsonrpc": "2.0", "method": "subtract", "params": [42]},
+            {"jsonrpc": "2.0", "method": "subtract", "params": [42], "id": "3"}
+        ]"""
+        expected = [
+            {"jsonrpc": "2.0", "result": 7, "id": "1"},
+            {"jsonrpc": "2.0", "result": 19, "id": "2"},
+            {"jsonrpc": "2.0", "error": {"code": -32602, "message": "Invalid params", "data": "expected 2 params, got 1"}, "id": "3"}
+        ]
+        self.assertEqual(self.dispatch(request), expected)
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            self.dispatcher.executor = executor
+            self.assertEqual(self.dispatch(request), expected)
+
+    @unittest.skipUnless('orjson' in codec.available_codecs(), "needs orjson")
+    def test_compact_batch(self):
+        orjson = codec.make_codec('orjson', fast_dumps=True)
+        request = '[{"jsonrpc": "2.0", "method": "subtract", "params": [42, 23], "id": 1}, 1, {"jsonrpc": "2.0", "method": "missing", "id": 2}]'
+        expected = json.dumps([
+            {'jsonrpc': '2.0', 'result': 19, 'id': 1},
+            {'jsonrpc': '2.0', 'error': {'code': -32600, 'message': 'Invalid Request'}, 'id': None},
+            {'jsonrpc': '2.0', 'error': {'code': -32601, 'message': 'Method not found'}, 'id': 2},
+        ], separators=(',', ':')).encode()
+        sync = dispatcher.Dispatcher(codec=orjson)
+        async_ = AsyncDispatcher(codec=orjson)
+        for d in (sync, async_):
+            d.register(subtract)
+        self.assertEqual(sync.dispatch(request), expected)
+        self.assertEqual(b''.join(sync.dispatch_iter(request)), expected)
+        self.assertEqual(b''.join(sync.dispatch_stream([request.encode()])), expected)
+        self.assertEqual(asyncio.run(async_.dispatch(request)), expected)
+
+    def test_dispatch_iter(self):
+        def rows(n, fail_at=None):
+            for i in range(n):
+                if i == fail_at:
+                    raise RuntimeError("failed")
+                yield {'row': i}
+        self.dispatcher.register(rows)
+        chunks = list(self.dispatcher.dispatch_iter(
+            '{"jsonrpc": "2.0", "method": "rows", "params": [1000], "id": 1}', chunk_size=1000
+        ))
+        self.assertGreater(len(chunks), 10)
+        self.assertEqual(json.loads(b''.join(chunks))['result'], [{'row': i} for i in range(1000)])
+        # failures before the first chunk are sent as errors
+        chunks = self.dispatcher.dispatch_iter('{"jsonrpc": "2.0", "method": "rows", "params": [10, 1], "id": 1}')
+        self.assertEqual(json.loads(b''.join(chunks))['error']['code'], -32603)
+        chunks = self.dispatcher.dispatch_iter(
+            '{"jsonrpc": "2.0", "method": "rows", "params": [1000, 900], "id": 1}', chunk_size=100
+        )
+        with self.assertRaises(RuntimeError):
+            list(chunks)
+        request = '[{"jsonrpc": "2.0", "method": "rows", "params": [2], "id": 1}, 1, {"jsonrpc": "2.0", "method": "rows", "params": [1]}]'
+        self.assertEqual(b''.join(self.dispatcher.dispatch_iter(request)), self.dispatcher.dispatch(request))
+        self.assertEqual(list(self.dispatcher.dispatch_iter('{"jsonrpc": "2.0", "method": "rows", "params": [1]}')), [])
+        self.assertEqual(json.loads(b''.join(self.dispatcher.dispatch_iter('[')))['error']['code'], -32700)
+
+    def test_dispatch_stream(self):
+        self.dispatcher.register(lambda a, b: a - b, name='subtract')
+        request = json.dumps(
+            [{'jsonrpc': '2.0', 'method': 'subtract', 'params': [i, 1], 'id': i} for i in range(100)]
+            + [{'jsonrpc': '2.0', 'method': 'subtract', 'params': [1, 1]}, 1]
+        ).encode()
+        chunks = (request[i:i+100] for i in range(0, len(request), 100))
+        self.assertEqual(b''.join(self.dispatcher.dispatch_stream(chunks)), self.dispatcher.dispatch(request))
+        # responses are sent before the rest of the batch is read
+        def source():
+            yield request[:200]
+            raise AssertionError("read ahead")
+        chunks = self.dispatcher.dispatch_stream(source())
+        self.assertEqual(next(chunks), b'[')
+        self.assertEqual(json.loads(next(chunks)), {'jsonrpc': '2.0', 'result': -1, 'id': 0})
+        response = json.loads(b''.join(self.dispatcher.dispatch_stream([request], max_items=10)))
+        self.assertEqual(len(response), 11)
+        self.assertEqual(response[-1]['error']['code'], -32600)
+        response = json.loads(b''.join(self.dispatcher.dispatch_stream([request], max_size=100)))
+        self.assertEqual(response['error']['code'], -32600)
+        response = json.loads(b''.join(self.dispatcher.dispatch_stream([b'{"jsonrpc": "2.0", "method": "subtract", "params": [3, 1], "id": 1}'])))
+        self.assertEqual(response['result'], 2)
+        self.assertEqual(list(self.dispatcher.dispatch_stream([b'[{"jsonrpc": "2.0", "method": "subtract", "params": [3, 1]}]'])), [])
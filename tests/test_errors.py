@@ -0,0 +1,95 @@
+import unittest
+import json
+
+from jsonrpc import jsonrpc
+from jsonrpc import errors
+from jsonrpc.dispatcher import Dispatcher
+
+
+class NotFound(KeyError):
+    pass
+
+
+class Conflict(Exception):
+    def __init__(self, key):
+        super().__init__(f"conflict on {key}")
+        self.key = key
+
+
+class TestErrorRegistry(unittest.TestCase):
+    def setUp(self):
+        self.registry = errors.ErrorRegistry()
+        self.registry.register(LookupError, 1, message="Not found")
+        self.registry.register(Conflict, 2, data=lambda e: {'key': e.key})
+        self.registry.register(TypeError, -32602)
+
+    def test_register(self):
+        with self.assertRaises(TypeError):
+            self.registry.register(object, 1, message="x")
+        with self.assertRaises(TypeError):
+            self.registry.register(ValueError, '1', message="x")
+        with self.assertRaises(ValueError):
+            self.registry.register(ValueError, -32602, message="Bad")
+        with self.assertRaises(TypeError):
+            self.registry.register(ValueError, 3, data="not callable")
+        self.assertIn(LookupError, self.registry)
+        self.registry.unregister(LookupError)
+        self.assertIsNone(self.registry.resolve(NotFound))
+
+    def test_resolve_mro(self):
+        self.assertEqual(self.registry.resolve(KeyError)[0], 1)
+        self.assertEqual(self.registry.resolve(NotFound)[0], 1)
+        self.assertIsNone(self.registry.resolve(ValueError))
+        self.assertIn(NotFound, self.registry._resolved)
+        # more specific registrations win and reset the cache
+        self.registry.register(NotFound, 3, message="Gone")
+        self.assertEqual(self.registry.resolve(NotFound)[0], 3)
+        self.assertEqual(self.registry.resolve(KeyError)[0], 1)
+
+    def test_error_for(self):
+        error = self.registry.error_for(NotFound('x'), _id=4)
+        self.assertEqual((error.code, error.message, error.data, error._id), (1, "Not found", None, 4))
+        error = self.registry.error_for(Conflict('a'))
+        self.assertEqual(error.values, {'code': 2, 'message': "conflict on a", 'data': {'key': 'a'}})
+        self.assertEqual(self.registry.error_for(TypeError('x')).message, "Invalid params")
+        self.assertEqual(self.registry.error_for(ValueError('x')).code, -32603)
+        original = jsonrpc.JSONCallError(-32601)
+        self.assertIs(self.registry.error_for(original), original)
+
+    def test_response_for(self):
+        for exc in [NotFound('x'), Conflict('a'), TypeError(), ValueError(), jsonrpc.JSONCallError(-32601)]:
+            for _id in [None, 1, 'x']:
+                expected = self.registry.error_for(exc, _id=_id)
+                expected._id = _id
+                self.assertEqual(self.registry.response_for(exc, _id=_id), expected.response())
+                self.assertEqual(self.registry.response_for(exc, _id=_id), expected.response())
+                self.assertEqual(self.registry.response_for(exc, _id=_id, encoding=None), expected.response(encoding=None))
+                self.assertEqual(self.registry.response_for(exc, _id=_id, encoding='latin1'), expected.response(encoding='latin1'))
+        self.assertEqual(
+            self.registry.response_for(NotFound('x'), _id=1),
+            b'{"jsonrpc": "2.0", "error": {"code": 1, "message": "Not found"}, "id": 1}'
+        )
+
+    def test_dispatcher(self):
+        dispatcher = Dispatcher(errors=self.registry)
+
+        @dispatcher.register
+        def get(key):
+            raise {'a': Conflict, 'b': NotFound, 'c': RuntimeError}[key](key)
+
+        def error(key):
+            return json.loads(dispatcher.dispatch(json.dumps(
+                {"jsonrpc": "2.0", "method": "get", "params": [key], "id": 1}
+            )))['error']
+        self.assertEqual(error('a'), {'code': 2, 'message': "conflict on a", 'data': {'key': 'a'}})
+        self.assertEqual(error('b'), {'code': 1, 'message': "Not found"})
+        self.assertEqual(error('c'), {'code': -32603, 'message': "Internal error"})
+        # scoped per dispatcher
+        self.assertEqual(
+            json.loads(Dispatcher(executor=None).dispatch('{"jsonrpc": "2.0", "method": "get", "params": ["b"], "id": 1}'))['error']['code'],
+            -32601
+        )
+        dispatcher.register(get, name='other')
+        self.assertEqual(json.loads(dispatcher.dispatch(
+            '[{"jsonrpc": "2.0", "method": "other", "params": ["b"], "id": 1}]'
+        ))[0]['error']['code'], 1)
@@ -0,0 +1,53 @@
+import unittest
+import threading
+
+from jsonrpc import ids
+from jsonrpc import jsonrpc
+from jsonrpc import client
+
+
+class TestIds(unittest.TestCase):
+    def test_generators(self):
+        generator = ids.uuid_ids()
+        self.assertRegex(generator(), r'^[0-9a-f]{32}$')
+        generator = ids.counter_ids()
+        self.assertEqual([generator() for _ in range(3)], [1, 2, 3])
+        generator = ids.prefixed_ids('conn', start=5)
+        self.assertEqual([generator() for _ in range(2)], ['conn-5', 'conn-6'])
+        self.assertNotEqual(ids.prefixed_ids()(), ids.prefixed_ids()())
+        generator = ids.random_ids(bits=53)
+        values = [generator() for _ in range(1000)]
+        self.assertEqual(len(set(values)), 1000)
+        self.assertTrue(all(0 <= v < 2**53 for v in values))
+
+    def test_counter_threads(self):
+        generator = ids.counter_ids()
+        seen = []
+
+        def work():
+            seen.extend(generator() for _ in range(10000))
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(sorted(seen), list(range(1, 40001)))
+
+    def test_default(self):
+        self.addCleanup(ids.set_id_generator, ids.get_id_generator())
+        with self.assertRaises(TypeError):
+            ids.set_id_generator(1)
+        ids.set_id_generator(ids.counter_ids(start=10))
+        self.assertEqual(jsonrpc.JSONCall('add')._id, 10)
+        self.assertEqual(jsonrpc.JSONCall('add')._id, 11)
+        self.assertEqual(jsonrpc.JSONCall('add', _id='x')._id, 'x')
+        self.assertTrue(jsonrpc.JSONCall('add', _id=False).is_notification)
+
+    def test_session(self):
+        sent = []
+        session = client.ClientSession(send=sent.append, id_generator=ids.prefixed_ids('a'))
+        session.call('add')
+        session.call('add')
+        self.assertIn('a-1', session)
+        self.assertIn('a-2', session)
+        self.assertIn(b'"id": "a-2"', sent[1])
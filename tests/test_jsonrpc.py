@@ -1,9 +1,12 @@
 import unittest
+import tracemalloc
 import json
 import logging
+from concurrent.futures import ThreadPoolExecutor
 
 from jsonrpc import __version__
 from jsonrpc import jsonrpc
+from jsonrpc import codec
 
 
 def test_version():
@@ -145,6 +148,36 @@ class TestJSONRPC(unittest.TestCase):
             server_jsoncall.set_error(-32000, message="A big mistake")
         self.assertIn('something weird', str(e.exception))
 
+    def test_lazy_params(self):
+        call = jsonrpc.JSONCall.from_request('{"jsonrpc": "2.0", "method": "add", "params": "bar", "id": 7}')
+        self.assertFalse(hasattr(call, '__dict__'))
+        with self.assertRaises(jsonrpc.JSONCallError) as e:
+            call.args
+        self.assertEqual(e.exception.code, -32602)
+        self.assertEqual(e.exception._id, 7)
+        call.params = {'a': 1}
+        self.assertEqual((call.args, call.kwargs), ([], {'a': 1}))
+        self.assertIs(call.kwargs, call.params)
+
+    def test_error_slots(self):
+        error = jsonrpc.JSONCallError(-32601, _id=1)
+        # the BaseException __dict__ remains, the attributes don't go in it
+        self.assertEqual(error.__dict__, {})
+        self.assertEqual((error.code, error.message, error._id), (-32601, 'Method not found', 1))
+        call = jsonrpc.JSONCall('add')
+        self.assertEqual((call.params, call.args, call.kwargs), (None, [], {}))
+
+    def test_from_url(self):
+        call = jsonrpc.JSONCall.from_url('http://localhost/api?method=subtract&id=7&jsonrpc=2.0&method=add')
+        self.assertEqual((call.method, call._id, call.jsonrpc, call.params), ('add', '7', '2.0', None))
+        call = jsonrpc.JSONCall.from_url('http://localhost/sub%20tract?id=&x=1')
+        self.assertEqual((call.method, call.is_notification), ('/sub%20tract', True))
+        call = jsonrpc.JSONCall.from_url('/?method=say+h%C3%A9llo&id=1')
+        self.assertEqual(call.method, 'say héllo')
+        with self.assertRaises(jsonrpc.JSONCallError) as e:
+            jsonrpc.JSONCall.from_url('/add?id=1.5')
+        self.assertEqual(e.exception.code, -32600)
+
     def compare_example(self, call, expected_response, result=None, error_code=None):
         # create the call
         client_jsoncall = self.create(call)
@@ -265,61 +298,190 @@ class TestJSONRPC(unittest.TestCase):
             '{"jsonrpc": "2.0", "error": {"code": -32600, "message": "Invalid Request"}, "id": null}'.encode('utf8')
         )
     
-# batch not implemented
-"""
-
-rpc call Batch, invalid JSON:
-
---> [
-{"jsonrpc": "2.0", "method": "sum", "params": [1,2,4], "id": "1"},
-{"jsonrpc": "2.0", "method"
-]
-<-- {"jsonrpc": "2.0", "error": {"code": -32700, "message": "Parse error"}, "id": null}
-
-rpc call with an empty Array:
-
---> []
-<-- {"jsonrpc": "2.0", "error": {"code": -32600, "message": "Invalid Request"}, "id": null}
-
-rpc call with an invalid Batch (but not empty):
-
---> [1]
-<-- [
-{"jsonrpc": "2.0", "error": {"code": -32600, "message": "Invalid Request"}, "id": null}
-]
-
-rpc call with invalid Batch:
-
---> [1,2,3]
-<-- [
-{"jsonrpc": "2.0", "error": {"code": -32600, "message": "Invalid Request"}, "id": null},
-{"jsonrpc": "2.0", "error": {"code": -32600, "message": "Invalid Request"}, "id": null},
-{"jsonrpc": "2.0", "error": {"code": -32600, "message": "Invalid Request"}, "id": null}
-]
-
-rpc call Batch:
-
---> [
-        {"jsonrpc": "2.0", "method": "sum", "params": [1,2,4], "id": "1"},
-        {"jsonrpc": "2.0", "method": "notify_hello", "params": [7]},
-        {"jsonrpc": "2.0", "method": "subtract", "params": [42,23], "id": "2"},
-        {"foo": "boo"},
-        {"jsonrpc": "2.0", "method": "foo.get", "params": {"name": "myself"}, "id": "5"},
-        {"jsonrpc": "2.0", "method": "get_data", "id": "9"} 
-    ]
-<-- [
-        {"jsonrpc": "2.0", "result": 7, "id": "1"},
-        {"jsonrpc": "2.0", "result": 19, "id": "2"},
-        {"jsonrpc": "2.0", "error": {"code": -32600, "message": "Invalid Request"}, "id": null},
-        {"jsonrpc": "2.0", "error": {"code": -32601, "message": "Method not found"}, "id": "5"},
-        {"jsonrpc": "2.0", "result": ["hello", 5], "id": "9"}
-    ]
-
-rpc call Batch (all notifications):
-
---> [
-        {"jsonrpc": "2.0", "method": "notify_sum", "params": [1,2,4]},
-        {"jsonrpc": "2.0", "method": "notify_hello", "params": [7]}
-    ]
-<-- //Nothing is returned for all notification batches
-"""
+
+class TestJSONBatch(unittest.TestCase):
+    methods = {
+        'sum': lambda *args: sum(args),
+        'subtract': lambda a, b: a - b,
+        'get_data': lambda: ['hello', 5],
+        'notify_hello': lambda *args: None,
+        'notify_sum': lambda *args: sum(args),
+    }
+
+    def handler(self, call):
+        if call.method not in self.methods:
+            raise jsonrpc.JSONCallError(-32601)
+        return self.methods[call.method](*call.args, **call.kwargs)
+
+    def serve(self, request, executor=None):
+        try:
+            batch = jsonrpc.JSONCall.from_request(request)
+        except jsonrpc.JSONCallError as e:
+            return e.response()
+        self.assertIsInstance(batch, jsonrpc.JSONBatch)
+        return batch.dispatch(self.handler, executor=executor).response()
+
+    # examples from https://www.jsonrpc.org/specification#examples
+    def test_invalid_json(self):
+        self.assertEqual(
+            self.serve('[{"jsonrpc": "2.0", "method": "sum", "params": [1,2,4], "id": "1"},{"jsonrpc": "2.0", "method"]'),
+            b'{"jsonrpc": "2.0", "error": {"code": -32700, "message": "Parse error"}, "id": null}'
+        )
+
+    def test_empty_array(self):
+        self.assertEqual(
+            self.serve('[]'),
+            b'{"jsonrpc": "2.0", "error": {"code": -32600, "message": "Invalid Request"}, "id": null}'
+        )
+
+    def test_invalid_elements(self):
+        error = '{"jsonrpc": "2.0", "error": {"code": -32600, "message": "Invalid Request"}, "id": null}'
+        self.assertEqual(self.serve('[1]'), f'[{error}]'.encode('utf8'))
+        self.assertEqual(self.serve('[1,2,3]'), f'[{error}, {error}, {error}]'.encode('utf8'))
+
+    def test_batch(self):
+        request = """[
+            {"jsonrpc": "2.0", "method": "sum", "params": [1,2,4], "id": "1"},
+            {"jsonrpc": "2.0", "method": "notify_hello", "params": [7]},
+            {"jsonrpc": "2.0", "method": "subtract", "params": [42,23], "id": "2"},
+            {"foo": "boo"},
+            {"jsonrpc": "2.0", "method": "foo.get", "params": {"name": "myself"}, "id": "5"},
+            {"jsonrpc": "2.0", "method": "get_data", "id": "9"}
+        ]"""
+        expected = [
+            {"jsonrpc": "2.0", "result": 7, "id": "1"},
+            {"jsonrpc": "2.0", "result": 19, "id": "2"},
+            {"jsonrpc": "2.0", "error": {"code": -32600, "message": "Invalid Request"}, "id": None},
+            {"jsonrpc": "2.0", "error": {"code": -32601, "message": "Method not found"}, "id": "5"},
+            {"jsonrpc": "2.0", "result": ["hello", 5], "id": "9"}
+        ]
+        self.assertEqual(json.loads(self.serve(request)), expected)
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            self.assertEqual(json.loads(self.serve(request, executor=executor)), expected)
+
+    def test_all_notifications(self):
+        request = """[
+            {"jsonrpc": "2.0", "method": "notify_sum", "params": [1,2,4]},
+            {"jsonrpc": "2.0", "method": "notify_hello", "params": [7]}
+        ]"""
+        self.assertIsNone(self.serve(request))
+
+    def test_client_round_trip(self):
+        calls = [
+            jsonrpc.JSONCall('sum', params=[1, 2, 4]),
+            jsonrpc.JSONCall('notify_hello', params=[7], _id=False),
+            jsonrpc.JSONCall('foo.get', params={'name': 'myself'}),
+        ]
+        client_batch = jsonrpc.JSONBatch(calls)
+        client_batch.assign_response(self.serve(client_batch.request()))
+        self.assertEqual(calls[0].result, 7)
+        self.assertIsNone(calls[1].success)
+        self.assertEqual(calls[2].error['code'], -32601)
+        with self.assertRaises(jsonrpc.JSONCallError):
+            client_batch.assign_response(b'{"jsonrpc": "2.0", "error": {"code": -32600, "message": "Invalid Request"}, "id": null}')
+
+
+class TestEnvelopes(unittest.TestCase):
+    results = [19, -0.5, 1e16, "é \"", None, True, [1, {"a": None}], {"nested": {"list": []}}]
+    ids = [1, "x\"y", None, 12345678901234567890]
+
+    def expected(self, member, value, _id, compact=False):
+        separators = (',', ':') if compact else None
+        return json.dumps({'jsonrpc': '2.0', member: value, 'id': _id}, ensure_ascii=False, separators=separators)
+
+    def codecs(self):
+        yield codec.make_codec('json')
+        for name in codec.available_codecs()[:-1]:
+            yield codec.make_codec(name, fast_dumps=True)
+
+    def test_results(self):
+        for c in self.codecs():
+            for _id in self.ids:
+                for result in self.results:
+                    call = jsonrpc.JSONCall('add', _id=_id, codec=c)
+                    call.set_result(result)
+                    expected = self.expected('result', result, _id, compact=c.compact)
+                    if c.compact:
+                        # fast encoders format some floats differently
+                        self.assertEqual(json.loads(call.response()), json.loads(expected))
+                        continue
+                    self.assertEqual(call.response(), expected.encode('utf8'))
+                    self.assertEqual(call.response(encoding=None), expected)
+                    self.assertEqual(call.response(encoding='utf-16'), expected.encode('utf-16'))
+                    self.assertEqual(call.response(encoding=None, ensure_ascii=False), expected)
+
+    def test_errors(self):
+        self.addCleanup(jsonrpc.set_server_errors, jsonrpc._SERVER_ERRORS)
+        jsonrpc.set_server_errors({-32000: 'Overloaded'})
+        errors = [
+            jsonrpc.JSONCallError(-32700),
+            jsonrpc.JSONCallError(-32602, data={'param': 'a'}),
+            jsonrpc.JSONCallError(-32000),
+            jsonrpc.JSONCallError(5, message="Custom"),
+        ]
+        for c in self.codecs():
+            for _id in self.ids:
+                for error in errors:
+                    expected = self.expected('error', error.values, _id, compact=c.compact).encode('utf8')
+                    error._id = _id
+                    # twice, the second from the cache
+                    self.assertEqual(error.response(codec=c), expected)
+                    self.assertEqual(error.response(codec=c), expected)
+                    call = jsonrpc.JSONCall('add', _id=_id, codec=c)
+                    call.set_error(error.code, message=error.message, data=error.data)
+                    self.assertEqual(call.response(), expected)
+        # cached payloads follow changes to the server errors
+        jsonrpc.set_server_errors({-32000: 'Busy'})
+        self.assertEqual(
+            jsonrpc.JSONCallError(-32000).response(),
+            b'{"jsonrpc": "2.0", "error": {"code": -32000, "message": "Busy"}, "id": null}'
+        )
+        self.assertEqual(
+            jsonrpc.JSONCallError(-32700).response(ensure_ascii=True, indent=None),
+            b'{"jsonrpc": "2.0", "error": {"code": -32700, "message": "Parse error"}, "id": null}'
+        )
+
+
+class TestIterResponse(unittest.TestCase):
+    results = [19, "é", None, [], {}, [1, {"a": [None]}], {"a": 1, "b": [2.5, "x"]}, list(range(1000))]
+
+    def test_same_bytes(self):
+        for result in self.results:
+            call = jsonrpc.JSONCall('m', _id=1)
+            call.set_result(result)
+            for chunk_size in [1, 100, jsonrpc.CHUNK_SIZE]:
+                with self.subTest((result, chunk_size)):
+                    self.assertEqual(b''.join(call.iter_response(chunk_size)), call.response())
+
+    def test_iterators(self):
+        call = jsonrpc.JSONCall('m', _id=1)
+        call.set_result(i * 2 for i in range(3))
+        chunks = list(call.iter_response(chunk_size=1))
+        self.assertEqual(b''.join(chunks), b'{"jsonrpc": "2.0", "result": [0, 2, 4], "id": 1}')
+        self.assertGreater(len(chunks), 3)
+        # without streaming, iterators are encoded as arrays
+        for kwargs in [{}, {'indent': None}]:
+            call.set_result(iter([1, 2]))
+            self.assertEqual(json.loads(call.response(**kwargs))['result'], [1, 2])
+        call.set_result(object())
+        with self.assertRaises(TypeError):
+            call.response()
+
+    def test_errors(self):
+        call = jsonrpc.JSONCall('m', _id=1)
+        call.set_error(-32601)
+        self.assertEqual(list(call.iter_response()), [call.response()])
+        with self.assertRaises(ValueError):
+            list(jsonrpc.JSONCall('m', _id=False).iter_response())
+
+    def test_bounded_memory(self):
+        call = jsonrpc.JSONCall('m', _id=1)
+        call.set_result({'n': i, 'name': 'x' * 100} for i in range(50000))
+        tracemalloc.start()
+        try:
+            size = sum(len(chunk) for chunk in call.iter_response(chunk_size=16384))
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.assertGreater(size, 5000000)
+        self.assertLess(peak, 1000000)
@@ -0,0 +1,76 @@
+import unittest
+import asyncio
+import io
+import json
+import os
+import random
+import tempfile
+from contextlib import redirect_stdout
+from unittest import mock
+
+from jsonrpc import loadgen
+
+
+class TestHistogram(unittest.TestCase):
+    def test_percentiles(self):
+        histogram = loadgen.Histogram()
+        values = list(range(1, 100001))
+        random.Random(1).shuffle(values)
+        for value in values:
+            histogram.record(value * 1e-6)
+        self.assertEqual(histogram.count, 100000)
+        self.assertLess(len(histogram.counts), 2000)
+        for percent in [50, 90, 99, 99.9]:
+            expected = percent * 1000 * 1e-6
+            self.assertAlmostEqual(histogram.percentile(percent), expected, delta=expected / 128)
+        self.assertAlmostEqual(histogram.percentile(100), 0.1)
+        self.assertAlmostEqual(histogram.mean, 0.0500005, places=6)
+
+    def test_exact_small_values_and_merge(self):
+        first, second = loadgen.Histogram(), loadgen.Histogram()
+        for value in [3, 5, 7]:
+            first.record(value * 1e-6)
+        second.record(1e-6)
+        first.merge(second)
+        self.assertEqual(first.count, 4)
+        self.assertAlmostEqual(first.percentile(50), 3e-6)
+        self.assertEqual((first.min, first.max), (1, 7))
+        self.assertEqual(loadgen.Histogram().percentile(99), 0.0)
+
+
+class TestLoadgen(unittest.TestCase):
+    def test_workload(self):
+        workload = loadgen.Workload(mix=loadgen.parse_mix('8:1,64:1'), batch_ratio=0.5, batch_size=3, error_ratio=0.5, seed=1)
+        messages = [workload.message() for _ in range(100)]
+        self.assertTrue(any(hasattr(m, 'items') for m in messages))
+        calls = [c for m in messages for c in getattr(m, 'items', [m])]
+        self.assertEqual({len(c.args[0]) for c in calls}, {8, 64})
+        self.assertEqual({c.method for c in calls}, {'echo', 'fail'})
+
+    def test_closed_loop_pipe(self):
+        workload = loadgen.Workload(batch_ratio=0.2, error_ratio=0.2, seed=1)
+        stats = asyncio.run(loadgen.run('pipe', concurrency=2, duration=0.1, workload=workload))
+        self.assertGreater(stats.requests, 10)
+        self.assertGreater(stats.calls, stats.requests)
+        self.assertGreater(stats.errors, 0)
+        self.assertEqual(stats.latency.count, stats.requests)
+
+    def test_open_loop_tcp(self):
+        stats = asyncio.run(loadgen.run('tcp', mode='open', rate=200, concurrency=2, duration=0.1))
+        self.assertEqual(stats.requests, 20)
+        self.assertEqual(stats.errors, 0)
+
+    def test_main(self):
+        out = io.StringIO()
+        directories = []
+
+        def mkdtemp(mkdtemp=tempfile.mkdtemp):
+            directories.append(mkdtemp())
+            return directories[-1]
+        with redirect_stdout(out), mock.patch('tempfile.mkdtemp', mkdtemp):
+            result = loadgen.main(['--transport', 'unix', '--duration', '0.1', '--concurrency', '1', '--json'])
+        # the socket's directory is removed
+        self.assertEqual(len(directories), 1)
+        self.assertFalse(os.path.exists(directories[0]))
+        self.assertEqual(json.loads(out.getvalue())['requests'], result['requests'])
+        self.assertIn('99.9', result['latency']['percentiles'])
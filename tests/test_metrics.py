@@ -0,0 +1,140 @@
+import unittest
+import json
+import threading
+import asyncio
+
+from jsonrpc import metrics
+from jsonrpc.dispatcher import Dispatcher
+from jsonrpc.aio import AsyncDispatcher
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.metrics = metrics.Metrics(latency_buckets=[0.1, 0.01], size_buckets=[10, 100])
+
+    def test_histogram(self):
+        self.metrics.observe_latency('a', 0.005)
+        self.metrics.observe_latency('a', 0.01)
+        self.metrics.observe_latency('a', 5)
+        self.metrics.observe_request_size(1000)
+        snapshot = self.metrics.snapshot()
+        latency = snapshot['latency']['a']
+        self.assertEqual(latency['buckets'], [0.01, 0.1])
+        # bounds are inclusive
+        self.assertEqual(latency['counts'], [2, 0, 1])
+        self.assertEqual((latency['count'], latency['sum']), (3, 5.015))
+        self.assertEqual(snapshot['request_size']['counts'], [0, 0, 1])
+        self.assertEqual(snapshot['response_size']['count'], 0)
+
+    def test_threads(self):
+        def record():
+            for _ in range(1000):
+                self.metrics.count_error(-32601)
+                self.metrics.observe_latency('a', 0.001)
+        threads = [threading.Thread(target=record) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(self.metrics._accumulators), 4)
+        snapshot = self.metrics.snapshot()
+        self.assertEqual(snapshot['errors'], {-32601: 4000})
+        self.assertEqual(snapshot['latency']['a']['counts'], [4000, 0, 0])
+
+    def test_ended_threads_are_retired(self):
+        # one thread per request
+        for _ in range(200):
+            thread = threading.Thread(target=self.metrics.count_error, args=(-32601,))
+            thread.start()
+            thread.join()
+        self.assertLess(len(self.metrics._accumulators), 64)
+        snapshot = self.metrics.snapshot()
+        self.assertEqual(self.metrics._accumulators, [])
+        self.assertEqual(snapshot['errors'], {-32601: 200})
+        self.metrics.count_error(-32601)
+        self.assertEqual(self.metrics.snapshot()['errors'], {-32601: 201})
+
+    def test_merge_snapshots(self):
+        self.metrics.count_error(1)
+        self.metrics.count_parse_failure()
+        self.metrics.observe_latency('a', 0.05)
+        # e.g. received from other processes as json
+        snapshot = json.loads(json.dumps(self.metrics.snapshot()))
+        merged = metrics.merge_snapshots([snapshot, snapshot])
+        self.assertEqual(merged['errors'], {1: 2})
+        self.assertEqual(merged['parse_failures'], 2)
+        self.assertEqual(merged['latency']['a']['counts'], [0, 2, 0])
+        self.assertEqual(snapshot['latency']['a']['counts'], [0, 1, 0])
+        other = metrics.Metrics(latency_buckets=[1])
+        other.observe_latency('a', 0.05)
+        with self.assertRaises(ValueError):
+            metrics.merge_snapshots([snapshot, other.snapshot()])
+
+    def test_prometheus(self):
+        self.metrics.observe_latency('say "hi"', 0.05)
+        self.metrics.count_error(-32601)
+        text = self.metrics.prometheus(prefix='rpc')
+        self.assertIn('# TYPE rpc_request_duration_seconds histogram\n', text)
+        self.assertIn('rpc_request_duration_seconds_bucket{method="say \\"hi\\"",le="0.1"} 1\n', text)
+        self.assertIn('rpc_request_duration_seconds_bucket{method="say \\"hi\\"",le="+Inf"} 1\n', text)
+        self.assertIn('rpc_request_duration_seconds_count{method="say \\"hi\\""} 1\n', text)
+        self.assertIn('rpc_errors_total{code="-32601"} 1\n', text)
+        self.assertIn('rpc_parse_failures_total 0\n', text)
+        self.assertIn('rpc_response_size_bytes_bucket{le="+Inf"} 0\n', text)
+        self.assertIn('rpc_request_size_bytes_sum 0\n', text)
+
+
+class TestDispatcherMetrics(unittest.TestCase):
+    requests = [
+        b'{"jsonrpc": "2.0", "method": "add", "params": [1, 2], "id": 1}',
+        b'{"jsonrpc": "2.0", "method": "fail", "id": 2}',
+        b'{"jsonrpc": "2.0", "method": "missing", "id": 3}',
+        b'[{"jsonrpc": "2.0", "method": "add", "params": [1], "id": 4}, 1]',
+        b'{"jsonrpc": "2.0", "method"',
+        b'{"jsonrpc": "2.0", "method": "add", "params": [1, 2]}',
+    ]
+
+    def check(self, snapshot):
+        self.assertEqual(snapshot['latency']['add']['count'], 2)
+        self.assertEqual(snapshot['latency']['fail']['count'], 1)
+        # unknown methods aren't labels
+        self.assertNotIn('missing', snapshot['latency'])
+        self.assertEqual(snapshot['errors'], {-32603: 1, -32601: 1, -32602: 1, -32600: 1, -32700: 1})
+        self.assertEqual(snapshot['parse_failures'], 1)
+        self.assertEqual(snapshot['request_size']['count'], 6)
+        self.assertEqual(snapshot['request_size']['sum'], sum(len(r) for r in self.requests))
+        # the notification has no response
+        self.assertEqual(snapshot['response_size']['count'], 5)
+
+    def register(self, dispatcher):
+        def fail():
+            raise RuntimeError("failed")
+        dispatcher.register(lambda a, b: a + b, name='add')
+        dispatcher.register(fail)
+
+    def test_dispatch(self):
+        dispatcher = Dispatcher(metrics=metrics.Metrics())
+        self.register(dispatcher)
+        for request in self.requests:
+            dispatcher.dispatch(request)
+        self.check(dispatcher.metrics.snapshot())
+
+    def test_dispatch_async(self):
+        dispatcher = AsyncDispatcher(metrics=metrics.Metrics())
+        self.register(dispatcher)
+
+        async def main():
+            for request in self.requests:
+                await dispatcher.dispatch(request)
+        asyncio.run(main())
+        self.check(dispatcher.metrics.snapshot())
+
+    def test_disabled(self):
+        dispatcher = Dispatcher()
+        self.register(dispatcher)
+        self.assertIsNone(dispatcher.metrics)
+        self.assertEqual(dispatcher.dispatch(self.requests[0]), b'{"jsonrpc": "2.0", "result": 3, "id": 1}')
+
+
+if __name__ == '__main__':
+    unittest.main()
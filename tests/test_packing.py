@@ -0,0 +1,174 @@
+import unittest
+import asyncio
+
+from jsonrpc import jsonrpc
+from jsonrpc import codec
+from jsonrpc import packing
+from jsonrpc.dispatcher import Dispatcher
+from jsonrpc.aio import AsyncDispatcher
+from jsonrpc.client import ClientSession
+
+
+class TestPacking(unittest.TestCase):
+    def test_spec_bytes(self):
+        # encodings from the msgpack spec
+        cases = [
+            (None, b'\xc0'), (False, b'\xc2'), (True, b'\xc3'),
+            (0, b'\x00'), (127, b'\x7f'), (-1, b'\xff'), (-32, b'\xe0'), (-33, b'\xd0\xdf'),
+            (128, b'\xcc\x80'), (256, b'\xcd\x01\x00'), (2 ** 32, b'\xcf\x00\x00\x00\x01\x00\x00\x00\x00'),
+            (-129, b'\xd1\xff\x7f'), (1.5, b'\xcb\x3f\xf8\x00\x00\x00\x00\x00\x00'),
+            ('a', b'\xa1a'), ('a' * 32, b'\xd9\x20' + b'a' * 32), (b'\x00', b'\xc4\x01\x00'),
+            ([1, 'a'], b'\x92\x01\xa1a'), ({'a': None}, b'\x81\xa1a\xc0'),
+            (list(range(16)), b'\xdc\x00\x10' + bytes(range(16))),
+        ]
+        for obj, packed in cases:
+            with self.subTest(obj):
+                self.assertEqual(packing.packb(obj), packed)
+                self.assertEqual(packing.unpackb(packed), obj)
+
+    def test_round_trip(self):
+        values = [
+            -2 ** 63, 2 ** 64 - 1, -0.0, 'é' * 100, 'x' * 70000, b'\n' * 300, bytearray(b'ab'),
+            [0.5] * 20, [1.0, 2, 'a'], (1, 2), {'nested': {'list': [[], {}]}}, {str(i): i for i in range(20)},
+        ]
+        for value in values:
+            expected = bytes(value) if isinstance(value, bytearray) else list(value) if isinstance(value, tuple) else value
+            self.assertEqual(packing.unpackb(packing.packb(value)), expected)
+
+    def test_errors(self):
+        with self.assertRaises(ValueError):
+            packing.packb(2 ** 64)
+        with self.assertRaises(TypeError):
+            packing.packb(object())
+        for data in [b'', b'\x92\x01', b'\xa3ab', b'\xcb\x00', b'\x01\x02', b'\xc1', b'\xd4\x01\x00']:
+            with self.subTest(data):
+                with self.assertRaises(ValueError):
+                    packing.unpackb(data)
+
+    def test_truncated_lengths(self):
+        # lengths near 2**32 with nothing after them
+        cases = [
+            (b'\xdd\xff\xff\xff\xff', "truncated msgpack array"),
+            (b'\xdd\x00\x00\x00\x02\xcb' + bytes(8), "truncated msgpack data"),
+            (b'\xdf\xff\xff\xff\xff\x01', "truncated msgpack map"),
+            (b'\xdb\xff\xff\xff\xffab', "truncated msgpack str"),
+            (b'\xc6\xff\xff\xff\xff', "truncated msgpack bytes"),
+            (b'\xdd\xff\xff', "truncated msgpack data"),
+        ]
+        for data, message in cases:
+            with self.subTest(data):
+                with self.assertRaises(ValueError) as cm:
+                    packing.unpackb(data)
+                self.assertEqual(str(cm.exception), message)
+
+    def test_codec(self):
+        c = packing.MsgpackCodec(accelerated=False)
+        obj = {'jsonrpc': '2.0', 'params': [b'\xff', 1.5]}
+        self.assertEqual(c.loads(memoryview(c.dumpb(obj))), obj)
+        self.assertEqual(c.dumps(obj), c.dumpb(obj))
+
+
+class TestNegotiation(unittest.TestCase):
+    def test_codec_for(self):
+        self.assertIs(codec.codec_for('application/json; charset=utf-8'), codec.get_codec())
+        msgpack = codec.codec_for('Application/MsgPack')
+        self.assertEqual(msgpack.name, 'msgpack')
+        self.assertIs(codec.codec_for('application/x-msgpack'), msgpack)
+        self.assertIsNone(codec.codec_for('text/html'))
+        self.assertEqual(codec.content_type(msgpack), 'application/msgpack')
+        self.assertEqual(codec.content_type(), 'application/json')
+        self.assertEqual(codec.make_codec('msgpack').name, 'msgpack')
+
+    def test_negotiate(self):
+        self.assertEqual(codec.negotiate('application/msgpack').name, 'msgpack')
+        self.assertIs(codec.negotiate('application/json, application/msgpack'), codec.get_codec())
+        self.assertEqual(codec.negotiate('application/json;q=0.5, application/msgpack').name, 'msgpack')
+        self.assertIs(codec.negotiate('*/*, application/msgpack;q=0.1'), codec.get_codec())
+        self.assertIs(codec.negotiate('text/html, application/msgpack;q=0'), codec.get_codec())
+
+
+class TestBinaryCalls(unittest.TestCase):
+    def setUp(self):
+        self.codec = packing.MsgpackCodec()
+
+    def test_call(self):
+        call = jsonrpc.JSONCall('store', params={'blob': b'\x00\xff', 'values': [0.5] * 4}, _id=1, codec=self.codec)
+        request = call.request()
+        self.assertEqual(request[:1], b'\x84')
+        received = jsonrpc.JSONCall.from_request(request, codec=self.codec)
+        self.assertEqual(received.kwargs['blob'], b'\x00\xff')
+        received.set_result(b'\x01' * 3)
+        response = received.response()
+        self.assertEqual(self.codec.loads(response), {'jsonrpc': '2.0', 'result': b'\x01' * 3, 'id': 1})
+        call.assign_response(response)
+        self.assertEqual(call.result, b'\x01\x01\x01')
+        received.set_error(-32601)
+        with self.assertRaises(jsonrpc.JSONCallError):
+            call.assign_response(received.response())
+        self.assertEqual(call.error['code'], -32601)
+        self.assertEqual(
+            self.codec.loads(jsonrpc.JSONCallError(-32700).response(codec=self.codec))['error']['code'], -32700
+        )
+        self.assertIn("'store'", str(call))
+
+    def test_dispatch(self):
+        dispatcher = Dispatcher(codec=self.codec)
+        dispatcher.register(lambda data: data[::-1], name='reverse')
+        request = jsonrpc.JSONCall('reverse', params=[b'abc'], _id=1, codec=self.codec).request()
+        self.assertEqual(self.codec.loads(dispatcher.dispatch(request))['result'], b'cba')
+        batch = jsonrpc.JSONBatch([
+            jsonrpc.JSONCall('reverse', params=[b'ab'], _id=i, codec=self.codec) for i in range(2)
+        ], codec=self.codec)
+        response = dispatcher.dispatch(batch.request())
+        batch.assign_response(response)
+        self.assertEqual([call.result for call in batch], [b'ba', b'ba'])
+        response = self.codec.loads(dispatcher.dispatch(b'\x92\x01'))
+        self.assertEqual(response['error']['code'], -32700)
+        # json is not accepted
+        response = self.codec.loads(dispatcher.dispatch(b'{"jsonrpc": "2.0", "method": "reverse"}'))
+        self.assertEqual(response['error']['code'], -32700)
+
+    def test_dispatch_stream_limits(self):
+        sync = Dispatcher(codec=self.codec)
+        async_ = AsyncDispatcher(codec=self.codec)
+        for dispatcher in (sync, async_):
+            dispatcher.register(lambda a, b: a + b, name='add')
+        request = jsonrpc.JSONBatch([
+            jsonrpc.JSONCall('add', params=[i, 1], _id=i, codec=self.codec) for i in range(100)
+        ], codec=self.codec).request()
+        chunks = [request[i:i+20] for i in range(0, len(request), 20)]
+
+        async def read(source, **kwargs):
+            return b''.join([chunk async for chunk in async_.dispatch_stream(source, **kwargs)])
+        for stream in (
+            lambda **kwargs: b''.join(sync.dispatch_stream(iter(chunks), **kwargs)),
+            lambda **kwargs: asyncio.run(read(chunks, **kwargs)),
+        ):
+            response = self.codec.loads(stream(max_items=5))
+            self.assertEqual([r.get('result') for r in response], [1, 2, 3, 4, 5, None])
+            self.assertEqual(response[5]['error'], {'code': -32600, 'message': 'Invalid Request', 'data': 'batch exceeds 5 items'})
+            response = self.codec.loads(stream(max_items=5, max_size=50))
+            self.assertEqual(response['error'], {'code': -32600, 'message': 'Invalid Request', 'data': 'request exceeds 50 bytes'})
+            self.assertEqual(len(self.codec.loads(stream(max_items=100))), 100)
+        # reading stops at max_size
+        def source():
+            yield from chunks[:3]
+            raise AssertionError("read ahead")
+        response = self.codec.loads(b''.join(sync.dispatch_stream(source(), max_size=50)))
+        self.assertEqual(response['error']['code'], -32600)
+
+    def test_async_client(self):
+        dispatcher = AsyncDispatcher(codec=self.codec)
+        dispatcher.register(lambda data: data[::-1], name='reverse')
+        sent = []
+        session = ClientSession(send=sent.append, codec=self.codec)
+
+        async def main():
+            futures = session.batch([('reverse', [b'ab']), ('reverse', [b'cd'])])
+            session.feed(await dispatcher.dispatch(sent[0]))
+            return [f.result() for f in futures]
+        self.assertEqual(asyncio.run(main()), [b'ba', b'dc'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+import unittest
+import asyncio
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from jsonrpc import jsonrpc
+from jsonrpc import pool
+from jsonrpc.dispatcher import Dispatcher
+from jsonrpc.aio import AsyncDispatcher
+
+
+class Unavailable(Exception):
+    pass
+
+
+def pid():
+    return os.getpid()
+
+
+def fail():
+    raise Unavailable("down")
+
+
+def crash():
+    raise RuntimeError("crashed")
+
+
+def make_dispatcher(dispatcher_class=Dispatcher, processes=None):
+    # builds the same dispatcher in the parent and in the workers
+    dispatcher = dispatcher_class()
+    dispatcher.errors.register(Unavailable, 1)
+    dispatcher.register(lambda a, b: a + b, name='add', executor=processes)
+    dispatcher.register(pid, executor=processes)
+    dispatcher.register(fail, executor=processes)
+    dispatcher.register(crash, executor=processes)
+    return dispatcher
+
+
+def worker_dispatcher():
+    return make_dispatcher(processes=PROCESSES)
+
+
+PROCESSES = pool.ProcessPool(worker_dispatcher, max_workers=2)
+
+
+def request(method, params=None, _id=1):
+    return jsonrpc.JSONCall(method, params=params, _id=_id).request()
+
+
+class TestThreadPool(unittest.TestCase):
+    def test_dispatch(self):
+        with ThreadPoolExecutor(2) as executor:
+            dispatcher = Dispatcher()
+            dispatcher.register(lambda a, b: a + b, name='add', executor=executor)
+            dispatcher.register(fail, executor=executor)
+            dispatcher.errors.register(Unavailable, 1)
+            self.assertEqual(dispatcher.dispatch(request('add', [1, 2])), b'{"jsonrpc": "2.0", "result": 3, "id": 1}')
+            response = json.loads(dispatcher.dispatch(request('fail')))
+            self.assertEqual(response['error'], {'code': 1, 'message': "down"})
+            response = json.loads(dispatcher.dispatch(request('add', [1])))
+            self.assertEqual(response['error']['code'], -32602)
+
+    def test_coroutines(self):
+        async def handler():
+            pass
+        with self.assertRaises(TypeError):
+            Dispatcher().register(handler, executor=ThreadPoolExecutor(1))
+
+
+class TestProcessPool(unittest.TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        PROCESSES.shutdown()
+
+    def test_dispatch(self):
+        dispatcher = worker_dispatcher()
+        self.assertEqual(dispatcher.dispatch(request('add', [1, 2])), b'{"jsonrpc": "2.0", "result": 3, "id": 1}')
+        response = json.loads(dispatcher.dispatch(request('pid')))
+        self.assertNotEqual(response['result'], os.getpid())
+        self.assertIsNone(dispatcher.dispatch(request('pid', _id=False)))
+
+    def test_errors(self):
+        dispatcher = worker_dispatcher()
+        # mapped by the worker's registry
+        response = json.loads(dispatcher.dispatch(request('fail', _id=2)))
+        self.assertEqual(response, {'jsonrpc': '2.0', 'error': {'code': 1, 'message': "down"}, 'id': 2})
+        response = json.loads(dispatcher.dispatch(request('crash', _id=3)))
+        self.assertEqual(response['error']['code'], -32603)
+        self.assertEqual(response['id'], 3)
+
+    def test_batch(self):
+        dispatcher = worker_dispatcher()
+        batch = b'[' + b', '.join([request('add', [1, 2], 1), request('fail', _id=2), request('add', [3, 4], 3)]) + b']'
+        response = json.loads(dispatcher.dispatch(batch))
+        self.assertEqual([r.get('result') for r in response], [3, None, 7])
+
+    def test_async(self):
+        dispatcher = make_dispatcher(AsyncDispatcher, processes=PROCESSES)
+
+        async def main():
+            return await asyncio.gather(*[dispatcher.dispatch(request('add', [i, 1], i)) for i in range(4)])
+        responses = [json.loads(r) for r in asyncio.run(main())]
+        self.assertEqual([r['result'] for r in responses], [1, 2, 3, 4])
+
+    def test_encoded_result(self):
+        call = jsonrpc.JSONCall('add', params=[1, 2], _id=1)
+        call.set_result(jsonrpc.EncodedResult(b'{"a": [1, 2]}'))
+        self.assertEqual(call.result, {'a': [1, 2]})
+        self.assertEqual(call.response(), b'{"jsonrpc": "2.0", "result": {"a": [1, 2]}, "id": 1}')
+        self.assertEqual(call.response(encoding=None), '{"jsonrpc": "2.0", "result": {"a": [1, 2]}, "id": 1}')
+        self.assertEqual(call.response(indent=None, separators=(',', ':')), b'{"jsonrpc":"2.0","result":{"a":[1,2]},"id":1}')
+
+
+if __name__ == '__main__':
+    unittest.main()
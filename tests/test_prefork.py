@@ -0,0 +1,117 @@
+import unittest
+import asyncio
+import os
+import signal
+import tempfile
+import time
+
+from jsonrpc import transport
+from jsonrpc.aio import AsyncDispatcher
+from jsonrpc.metrics import Metrics
+from jsonrpc.prefork import PreforkServer
+
+
+def factory():
+    dispatcher = AsyncDispatcher(metrics=Metrics())
+    dispatcher.register(os.getpid, name='pid')
+
+    async def sleep(seconds):
+        await asyncio.sleep(seconds)
+        return os.getpid()
+    dispatcher.register(sleep)
+    return dispatcher
+
+
+def call_pids(address=None, path=None, number=100):
+    async def main():
+        client = transport.Client(*(address or ())[:2], path=path, pool_size=16)
+        async with client:
+            return await asyncio.gather(*[client.call('pid') for _ in range(number)])
+    return set(asyncio.run(main()))
+
+
+@unittest.skipUnless(hasattr(os, 'fork'), "needs fork")
+class TestPreforkServer(unittest.TestCase):
+    def setUp(self):
+        self.server = None
+
+    def tearDown(self):
+        if self.server is not None:
+            self.server.stop()
+
+    def wait_for(self, condition, timeout=5):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            self.assertLess(time.monotonic(), deadline)
+            self.server.poll(timeout=0.02)
+
+    def test_workers_and_metrics(self):
+        self.server = PreforkServer(factory, workers=2, metrics_interval=0.02).start()
+        pids = call_pids(self.server.address, number=200)
+        self.assertLessEqual(pids, set(self.server.pids))
+        self.wait_for(lambda: self.server.snapshot()['latency'].get('pid', {}).get('count') == 200)
+        # counts of replaced workers are kept
+        old = set(self.server.pids)
+        self.server.reload()
+        self.wait_for(lambda: len(self.server._workers) == 2)
+        self.assertFalse(old & set(self.server.pids))
+        self.assertLessEqual(call_pids(self.server.address), set(self.server.pids))
+        self.wait_for(lambda: self.server.snapshot()['latency']['pid']['count'] == 300)
+        # the replaced workers are kept as one snapshot
+        self.assertEqual(self.server._retired['latency']['pid']['count'], 200)
+
+    def test_invalid_snapshot(self):
+        self.server = PreforkServer(factory, workers=1, metrics_interval=0.02).start()
+        call_pids(self.server.address, number=10)
+        self.wait_for(lambda: self.server.snapshot()['latency'].get('pid', {}).get('count') == 10)
+        [worker] = self.server._workers.values()
+        # as if a line was torn
+        worker.buffer = b'{"latency": '
+        with self.assertLogs('jsonrpc.prefork', 'WARNING'):
+            self.wait_for(lambda: worker.buffer != b'{"latency": ')
+        self.assertEqual(self.server.snapshot()['latency']['pid']['count'], 10)
+
+    def test_inherited_unix_socket(self):
+        path = os.path.join(tempfile.mkdtemp(), 'rpc.sock')
+        self.server = PreforkServer(factory, workers=2, path=path).start()
+        self.assertLessEqual(call_pids(path=path), set(self.server.pids))
+        self.server.stop()
+        self.server = None
+        self.assertFalse(os.path.exists(path))
+
+    def test_restart_and_drain(self):
+        self.server = PreforkServer(factory, workers=1, metrics_interval=0.02).start()
+        [pid] = self.server.pids
+        os.kill(pid, signal.SIGKILL)
+        self.wait_for(lambda: self.server.pids and self.server.pids != [pid])
+        [pid] = self.server.pids
+
+        async def main():
+            async with transport.Client(*self.server.address[:2]) as client:
+                pending = asyncio.ensure_future(client.call('sleep', params=[0.2]))
+                await asyncio.sleep(0.1)
+                # answered before the replaced worker exits
+                self.server.reload()
+                return await pending
+        self.assertEqual(asyncio.run(main()), pid)
+        self.wait_for(lambda: pid not in self.server._workers)
+        self.assertEqual(len(self.server.pids), 1)
+        self.assertNotEqual(self.server.pids, [pid])
+
+    def test_restart_backoff(self):
+        self.server = PreforkServer(factory, workers=1, restart_delay=0.2, max_restart_delay=10).start()
+        # each exit in a row doubles the delay
+        for delay in [0.2, 0.4]:
+            [pid] = self.server.pids
+            start = time.monotonic()
+            os.kill(pid, signal.SIGKILL)
+            self.wait_for(lambda: self.server.pids and self.server.pids != [pid])
+            self.assertGreaterEqual(time.monotonic() - start, delay)
+
+    def test_metrics_pipe_full(self):
+        # nobody reads the pipe while calls are made
+        self.server = PreforkServer(factory, workers=1, metrics_interval=0.001).start()
+        [pid] = self.server.pids
+        time.sleep(0.5)
+        self.assertEqual(call_pids(self.server.address, number=20), {pid})
+        self.wait_for(lambda: self.server.snapshot()['latency'].get('pid', {}).get('count') == 20)
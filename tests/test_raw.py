@@ -0,0 +1,111 @@
+import unittest
+import json
+
+from jsonrpc import jsonrpc
+from jsonrpc import raw
+
+REQUEST = b'{"jsonrpc": "2.0", "method": "subtract", "params": {"a": [1, "]}\\"", {"b": null}], "c": -1.5e3}, "id": 1}'
+
+
+class TestScanner(unittest.TestCase):
+    def test_scan_object(self):
+        members, end = raw.scan_object(REQUEST)
+        self.assertEqual(end, len(REQUEST))
+        self.assertEqual(
+            {name: json.loads(REQUEST[start:end]) for name, (start, end) in members.items()},
+            json.loads(REQUEST)
+        )
+        members, end = raw.scan_object(b' { } ')
+        self.assertEqual((members, end), ({}, 4))
+
+    def test_scan_array(self):
+        data = b'[1, "x", {"a": [2]}, [], true]'
+        elements, end = raw.scan_array(data)
+        self.assertEqual([json.loads(data[s:e]) for s, e in elements], json.loads(data))
+
+    def test_strings(self):
+        data = b'{"a": "x\\\\", "b": "y\\\\\\"z", "c": "\xc3\xa9"}'
+        members, _ = raw.scan_object(data)
+        self.assertEqual(
+            {name: json.loads(data[start:end]) for name, (start, end) in members.items()},
+            json.loads(data)
+        )
+
+    def test_dense_values(self):
+        # brackets and escaped quotes in strings don't count
+        value = [{"a": i, "b": "é]}\"", "c": [None], "d": "\\"} for i in range(100)]
+        for extra in [{}, {"ü": 1}]:
+            data = json.dumps({"result": value, "id": 1, **extra}, ensure_ascii=False).encode('utf8')
+            members, end = raw.scan_object(data)
+            self.assertEqual(end, len(data))
+            self.assertEqual(json.loads(data[slice(*members['result'])]), value)
+            self.assertEqual(json.loads(data[slice(*members['id'])]), 1)
+        with self.assertRaises(ValueError):
+            raw.scan_object(data[:-5])
+
+    def test_large_batch(self):
+        # each element is skipped without looking at the rest of the batch
+        element = b'{"jsonrpc": "2.0", "method": "m", "params": [{"a": [1, 2]}, "x"], "id": 1}'
+        data = b'[' + b', '.join([element] * 20000) + b']'
+        elements, end = raw.scan_array(data)
+        self.assertEqual((len(elements), end), (20000, len(data)))
+        self.assertEqual({data[s:e] for s, e in elements}, {element})
+        calls = raw.RawCall.from_batch(data)
+        self.assertEqual(bytes(calls[-1].params), b'[{"a": [1, 2]}, "x"]')
+
+    def test_malformed(self):
+        for data in [b'', b'[]', b'{"a" 1}', b'{"a": 1', b'{"a": [1}', b'{"a": "x}', b'{"a": }', b'{"a": 1 "b": 2}']:
+            with self.assertRaises(ValueError, msg=data):
+                raw.scan_object(data)
+
+
+class TestRawCall(unittest.TestCase):
+    def test_request(self):
+        call = raw.RawCall.from_request(REQUEST)
+        self.assertEqual(call.method, 'subtract')
+        self.assertEqual(call._id, 1)
+        self.assertFalse(call.is_notification)
+        self.assertIsInstance(call.params, memoryview)
+        self.assertEqual(json.loads(bytes(call.params)), json.loads(REQUEST)['params'])
+        rewritten = call.with_id("upstream-7")
+        self.assertEqual(json.loads(rewritten), {**json.loads(REQUEST), 'id': "upstream-7"})
+        self.assertEqual(bytes(call), REQUEST)
+        self.assertEqual(call.to_call().method, "subtract")
+
+    def test_invalid(self):
+        with self.assertRaises(jsonrpc.JSONCallError) as e:
+            raw.RawCall.from_request(b'{"jsonrpc": "2.0", "method": "foobar, "params": "bar", "baz]')
+        self.assertEqual(e.exception.code, -32700)
+        with self.assertRaises(jsonrpc.JSONCallError) as e:
+            raw.RawCall.from_request(b'{"jsonrpc": "2.0", "method": 1, "params": "bar", "id": 3}')
+        self.assertEqual((e.exception.code, e.exception._id), (-32600, 3))
+        notification = raw.RawCall.from_request(b'{"jsonrpc": "2.0", "method": "update"}')
+        self.assertTrue(notification.is_notification)
+        self.assertIsNone(notification.params)
+        with self.assertRaises(ValueError):
+            notification.with_id(1)
+
+    def test_batch(self):
+        calls = raw.RawCall.from_batch(b'[' + REQUEST + b', 1, {"jsonrpc": "2.0", "method": "x"}]')
+        self.assertEqual([type(c) for c in calls], [raw.RawCall, jsonrpc.JSONCallError, raw.RawCall])
+        with self.assertRaises(jsonrpc.JSONCallError) as e:
+            raw.RawCall.from_batch(b'[]')
+        self.assertEqual(e.exception.code, -32600)
+
+    def test_response(self):
+        result = list(range(100000))
+        call = jsonrpc.JSONCall('items', _id=5)
+        call.set_result(result)
+        response = raw.RawResponse.from_response(call.response())
+        self.assertTrue(response.success)
+        self.assertEqual(response._id, 5)
+        self.assertEqual(len(response.result), len(json.dumps(result)))
+        client = jsonrpc.JSONCall('items', _id='client-1')
+        client.assign_response(response.with_id('client-1'))
+        self.assertEqual(client.result, result)
+        call.set_error(-32601)
+        response = raw.RawResponse.from_response(call.response())
+        self.assertFalse(response.success)
+        self.assertEqual(response.error, {'code': -32601, 'message': "Method not found"})
+        with self.assertRaises(Exception):
+            raw.RawResponse.from_response(b'{"jsonrpc": "2.0", "id": 1}')
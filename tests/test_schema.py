@@ -0,0 +1,152 @@
+import unittest
+import sys
+import json
+from typing import Dict, List, Optional, Tuple, Union
+
+from jsonrpc import jsonrpc
+from jsonrpc import schema
+from jsonrpc.dispatcher import Dispatcher
+
+ORDER = {
+    'type': 'object',
+    'properties': {
+        'sku': {'type': 'string', 'pattern': '^[A-Z]+-[0-9]+$'},
+        'qty': {'type': 'integer', 'minimum': 1},
+        'tags': {'type': 'array', 'items': {'type': 'string'}, 'maxItems': 2},
+    },
+    'required': ['sku', 'qty'],
+    'additionalProperties': False,
+}
+
+
+def invalid(check, value):
+    try:
+        check(value)
+    except schema._Invalid as e:
+        e.path.append('value')
+        return e.details()
+    return None
+
+
+class TestCompileSchema(unittest.TestCase):
+    def test_types(self):
+        check = schema.compile_schema({'type': 'integer'})
+        self.assertIsNone(invalid(check, 1))
+        self.assertIsNone(invalid(check, 2.0))
+        self.assertEqual(invalid(check, True), "value: expected integer")
+        self.assertEqual(invalid(check, 1.5), "value: expected integer")
+        check = schema.compile_schema({'type': ['number', 'null']})
+        self.assertIsNone(invalid(check, None))
+        self.assertEqual(invalid(check, "1"), "value: expected number or null")
+        self.assertIsNone(schema.compile_schema({'description': "anything"}))
+        with self.assertRaises(ValueError):
+            schema.compile_schema({'type': 'date'})
+        with self.assertRaises(ValueError):
+            schema.compile_schema({'$ref': '#/x'})
+
+    def test_nested(self):
+        check = schema.compile_schema({'type': 'array', 'items': ORDER})
+        self.assertIsNone(invalid(check, [{'sku': 'AB-1', 'qty': 2, 'tags': ['x']}]))
+        cases = [
+            ([{'sku': 'AB-1', 'qty': 0}], "value[0].qty: less than 1"),
+            ([{'sku': 'AB-1', 'qty': 1}, {'sku': 'ab', 'qty': 1}], "value[1].sku: does not match ^[A-Z]+-[0-9]+$"),
+            ([{'sku': 'AB-1'}], "value[0]: missing member qty"),
+            ([{'sku': 'AB-1', 'qty': 1, 'x': 1}], "value[0].x: unexpected member"),
+            ([{'sku': 'AB-1', 'qty': 1, 'tags': ['a', 1]}], "value[0].tags[1]: expected string"),
+            ([{'sku': 'AB-1', 'qty': 1, 'tags': ['a'] * 3}], "value[0].tags: more than 2 items"),
+            ({'sku': 'AB-1'}, "value: expected array"),
+        ]
+        for value, details in cases:
+            with self.subTest(details):
+                self.assertEqual(invalid(check, value), details)
+
+    def test_enum_any_of(self):
+        check = schema.compile_schema({'enum': [1, 'a', [1]]})
+        for value in [1, 1.0, 'a', [1]]:
+            self.assertIsNone(invalid(check, value))
+        for value in [True, 'b', [2], {}]:
+            self.assertIsNotNone(invalid(check, value))
+        check = schema.compile_schema({'anyOf': [{'type': 'string', 'maxLength': 1}, {'type': 'null'}]})
+        self.assertIsNone(invalid(check, None))
+        self.assertEqual(invalid(check, 'ab'), "value: matches none of the allowed schemas")
+        check = schema.compile_schema(schema.annotation_schema(Optional[int]))
+        self.assertEqual(invalid(check, 1.5), "value: expected integer or null")
+
+    def test_annotation_schema(self):
+        cases = [
+            (int, {'type': 'integer'}),
+            (Optional[str], {'anyOf': [{'type': 'string'}, {'type': 'null'}]}),
+            (List[float], {'type': 'array', 'items': {'type': 'number'}}),
+            (Tuple[int, ...], {'type': 'array', 'items': {'type': 'integer'}}),
+            (Tuple[int, str], {'type': 'array'}),
+            (Dict[str, bool], {'type': 'object', 'additionalProperties': {'type': 'boolean'}}),
+            (dict, {'type': 'object'}),
+            (Union[int, object], None),
+            (object, None),
+        ]
+        for hint, expected in cases:
+            with self.subTest(hint):
+                self.assertEqual(schema.annotation_schema(hint), expected)
+
+    @unittest.skipIf(sys.version_info < (3, 10), "needs python 3.10+")
+    def test_union_operator(self):
+        self.assertEqual(schema.annotation_schema(int | None), {'anyOf': [{'type': 'integer'}, {'type': 'null'}]})
+        self.assertIsNone(schema.annotation_schema(int | object))
+
+
+def place(sku: str, qty: int, tags: Optional[List[str]] = None, *more: Dict[str, int], note='', **options: bool):
+    return [sku, qty]
+
+
+class TestParamsSchema(unittest.TestCase):
+    def validate(self, params_schema, args=(), kwargs=None):
+        try:
+            params_schema.validate(list(args), kwargs or {}, _id=4)
+        except jsonrpc.JSONCallError as e:
+            self.assertEqual((e.code, e._id), (-32602, 4))
+            return e.data
+        return None
+
+    def test_from_annotations(self):
+        params = schema.ParamsSchema.from_annotations(place)
+        self.assertEqual(params.names, ('sku', 'qty', 'tags'))
+        self.assertIsNone(self.validate(params, ['a', 1, ['x'], {'n': 1}]))
+        self.assertEqual(self.validate(params, ['a', '1']), "qty: expected integer")
+        self.assertEqual(self.validate(params, ['a', 1, None, {'n': 1}, {'n': 'x'}]), "[4].n: expected integer")
+        self.assertEqual(self.validate(params, kwargs={'tags': ['a', None]}), "tags[1]: expected string")
+        self.assertEqual(self.validate(params, kwargs={'sku': 'a', 'note': 1, 'fast': 'yes'}), "fast: expected boolean")
+
+    def test_from_schema(self):
+        params = schema.compile_params(place, {'properties': {'sku': ORDER['properties']['sku']}})
+        self.assertIsNone(self.validate(params, ['AB-1', 'not checked']))
+        self.assertEqual(self.validate(params, kwargs={'sku': 'x'}), "sku: does not match ^[A-Z]+-[0-9]+$")
+        with self.assertRaises(ValueError):
+            schema.compile_params(place, {'properties': {'missing': {}}})
+        with self.assertRaises(ValueError):
+            schema.compile_params(place, ORDER)
+
+
+class TestDispatcherSchema(unittest.TestCase):
+    def test_dispatch(self):
+        dispatcher = Dispatcher()
+        dispatcher.register(place, schema=True)
+        dispatcher.register(place, name='unchecked')
+        request = '{"jsonrpc": "2.0", "method": "%s", "params": {"sku": "a", "qty": 1, "tags": [1]}, "id": 1}'
+        response = json.loads(dispatcher.dispatch(request % 'place'))
+        self.assertEqual(response['error'], {'code': -32602, 'message': "Invalid params", 'data': "tags[0]: expected string"})
+        self.assertEqual(json.loads(dispatcher.dispatch(request % 'unchecked'))['result'], ['a', 1])
+        # the signature is still checked first
+        response = json.loads(dispatcher.dispatch('{"jsonrpc": "2.0", "method": "place", "params": [1], "id": 1}'))
+        self.assertEqual(response['error']['data'], "expected at least 2 params, got 1")
+
+    def test_nested_params(self):
+        call = jsonrpc.JSONCall.from_request(
+            '{"jsonrpc": "2.0", "method": "m", "params": [[1, 2], {"a": null}, true, null], "id": 1}'
+        )
+        self.assertEqual(call.args, [[1, 2], {'a': None}, True, None])
+        call = jsonrpc.JSONCall('m', params=({'a': 1}, ))
+        self.assertEqual(call.args, [{'a': 1}])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,201 @@
+import unittest
+import asyncio
+import multiprocessing
+import os
+import platform
+import stat
+from unittest import mock
+
+from jsonrpc import codec
+from jsonrpc import jsonrpc
+from jsonrpc import shm
+from jsonrpc.admission import AdmissionController
+from jsonrpc.aio import AsyncDispatcher
+from jsonrpc.dispatcher import Dispatcher
+
+
+def make_dispatcher(cls=AsyncDispatcher, **kwargs):
+    dispatcher = cls(**kwargs)
+    dispatcher.register(lambda a, b: a - b, name='subtract')
+    dispatcher.register(lambda payload: payload, name='echo')
+
+    async def sleep(seconds, value):
+        await asyncio.sleep(seconds)
+        return value
+    if issubclass(cls, AsyncDispatcher):
+        dispatcher.register(sleep)
+    return dispatcher
+
+
+def _call_from_process(address, queue):
+    async def main():
+        async with shm.Client(address) as client:
+            return await asyncio.gather(*[client.call('subtract', params=[i, 1]) for i in range(100)])
+    queue.put(asyncio.run(main()))
+
+
+@unittest.skipIf(shm.shared_memory is None, "needs python 3.8+")
+@unittest.skipUnless(platform.machine().lower() in shm._TSO_MACHINES, "needs x86")
+class TestShm(unittest.TestCase):
+    def run_async(self, coro):
+        return asyncio.run(asyncio.wait_for(coro, 10))
+
+    def test_pipelined(self):
+        async def main():
+            async with await shm.Server(make_dispatcher()).start() as server:
+                async with shm.Client(server.address) as client:
+                    # answered out of order
+                    results = await asyncio.gather(*[
+                        client.call('sleep', params=[0.001 * (i % 5), i]) for i in range(200)
+                    ])
+                    self.assertEqual(results, list(range(200)))
+                    with self.assertRaises(jsonrpc.JSONCallError) as cm:
+                        await client.call('missing')
+                    self.assertEqual(cm.exception.code, -32601)
+                    await client.notify('subtract', params=[1, 1])
+                    futures = await client.batch([('subtract', [3, 1]), ('subtract', [5, 1])])
+                    self.assertEqual(await asyncio.gather(*futures), [2, 4])
+            self.assertFalse(os.path.exists(server.channel.fifos[0]))
+        self.run_async(main())
+
+    def test_wraps_and_waits_for_room(self):
+        # a ring of a few messages, filled past its capacity
+        async def main():
+            async with await shm.Server(make_dispatcher(Dispatcher), ring_size=1024).start() as server:
+                async with shm.Client(server.address) as client:
+                    payloads = ['%d' % i * 50 for i in range(300)]
+                    results = await asyncio.gather(*[client.call('echo', [p]) for p in payloads])
+                    self.assertEqual(results, payloads)
+                    with self.assertRaises(ValueError):
+                        await client.call('echo', ['x' * 1024])
+                    self.assertEqual(await client.call('subtract', params=[42, 23]), 19)
+        self.run_async(main())
+
+    def test_failures_answered(self):
+        class Failing(Dispatcher):
+            def dispatch(self, request):
+                if b'fail' in bytes(request):
+                    raise RuntimeError("broken")
+                return super().dispatch(request)
+
+        class AsyncFailing(AsyncDispatcher):
+            async def dispatch(self, request):
+                if b'fail' in bytes(request):
+                    if b'late' in bytes(request):
+                        # once the ring has moved past the request
+                        await asyncio.sleep(0.01)
+                    raise RuntimeError("broken")
+                return await super().dispatch(request)
+
+        async def main(dispatcher):
+            async with await shm.Server(dispatcher, ring_size=4096).start() as server:
+                async with shm.Client(server.address) as client:
+                    with self.assertLogs('jsonrpc', 'ERROR'):
+                        with self.assertRaises(jsonrpc.JSONCallError) as cm:
+                            await client.call('text', [4096])
+                        self.assertEqual((cm.exception.code, cm.exception.data), (-32603, "response too large"))
+                        # the whole response of a batch is too large
+                        futures = await client.batch([('text', [4096]), ('subtract', [3, 1])])
+                        for future in futures:
+                            with self.assertRaises(jsonrpc.JSONCallError):
+                                await future
+                        with self.assertRaises(jsonrpc.JSONCallError) as cm:
+                            await client.call('fail')
+                        self.assertEqual(cm.exception.code, -32603)
+                        if isinstance(dispatcher, AsyncDispatcher):
+                            # answered with its id, while another call is pending
+                            failed, other = await asyncio.gather(
+                                client.call('fail', params=['late'], timeout=1), client.call('sleep', [0.05, 1]),
+                                return_exceptions=True
+                            )
+                            self.assertEqual((failed.code, other), (-32603, 1))
+                    # still served
+                    self.assertEqual(await client.call('subtract', params=[42, 23]), 19)
+            self.assertFalse(os.path.exists(server.channel.fifos[0]))
+        # the stdlib codec refuses released memoryviews, some others read them
+        json_codec = codec.make_codec('json')
+        for dispatcher in [make_dispatcher(Failing), make_dispatcher(AsyncFailing, codec=json_codec)]:
+            dispatcher.register(lambda n: 'x' * n, name='text')
+            with self.subTest(dispatcher):
+                self.run_async(main(dispatcher))
+
+    def test_other_dispatch_objects(self):
+        async def main():
+            controller = AdmissionController(make_dispatcher(), max_concurrency=2)
+            async with await shm.Server(controller).start() as server:
+                async with shm.Client(server.address) as client:
+                    results = await asyncio.gather(*[client.call('sleep', params=[0.001, i]) for i in range(20)])
+                    self.assertEqual(results, list(range(20)))
+        self.run_async(main())
+
+    def test_ring(self):
+        channel = shm.Channel.create(ring_size=256)
+        try:
+            ring = channel.requests
+            self.assertTrue(ring.write(b'first'))
+            self.assertTrue(ring.write(b'second'))
+            views, tail = ring.read()
+            self.assertEqual([bytes(v) for v in views], [b'first', b'second'])
+            self.assertIs(views[0].obj, channel.shm.buf.obj)
+            for view in views:
+                view.release()
+            ring.advance(tail)
+            # empty, so the reader may sleep
+            self.assertTrue(ring.wait())
+            self.assertTrue(ring.write(b'x' * ring.max_message))
+            self.assertTrue(ring.write(b'y' * ring.max_message))
+            self.assertFalse(ring.write(b'z'))
+            ring.wake()
+            self.assertEqual(os.read(ring.wakeup, 16), b'\0')
+            with self.assertRaises(ValueError):
+                ring.write(b'x' * (ring.max_message + 1))
+        finally:
+            channel.close()
+
+    def test_private_fifos(self):
+        channel = shm.Channel.create(ring_size=256)
+        try:
+            self.assertEqual(stat.S_IMODE(os.stat(channel.directory).st_mode), 0o700)
+            self.assertEqual(os.path.dirname(channel.fifos[0]), channel.directory)
+        finally:
+            channel.close()
+        self.assertFalse(os.path.exists(channel.directory))
+
+    def test_lost_wakeup(self):
+        async def main():
+            channel = shm.Channel.create(ring_size=256)
+            received = []
+
+            async def handle(views):
+                received.extend(bytes(view) for view in views)
+            task = asyncio.ensure_future(shm._receive(channel.requests, handle))
+            try:
+                await asyncio.sleep(0.01)
+                # written without waking the sleeping reader
+                self.assertTrue(channel.requests.write(b'message'))
+                await asyncio.sleep(0.1)
+                self.assertEqual(received, [b'message'])
+            finally:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                channel.close()
+        self.run_async(main())
+
+    def test_client_process(self):
+        async def main():
+            async with await shm.Server(make_dispatcher()).start() as server:
+                queue = multiprocessing.Queue()
+                process = multiprocessing.Process(target=_call_from_process, args=(server.address, queue))
+                process.start()
+                results = await asyncio.get_event_loop().run_in_executor(None, queue.get, True, 10)
+                process.join()
+                return results
+        self.assertEqual(self.run_async(main()), [i - 1 for i in range(100)])
+
+
+class TestShmPlatform(unittest.TestCase):
+    @unittest.skipIf(shm.shared_memory is None, "needs python 3.8+")
+    def test_weakly_ordered_refused(self):
+        with mock.patch('platform.machine', return_value='aarch64'):
+            with self.assertRaises(RuntimeError):
+                shm.Channel.create(ring_size=256)
@@ -0,0 +1,162 @@
+import unittest
+import time
+
+from jsonrpc import jsonrpc
+from jsonrpc import stream
+
+CALL = b'{"jsonrpc": "2.0", "method": "subtract", "params": [42, 23], "id": 1}'
+BATCH = b'[{"jsonrpc": "2.0", "method": "sum", "params": [1, 2], "id": "1"}, {"foo": "boo"}]'
+
+
+class TestStreamDecoder(unittest.TestCase):
+    def feed_bytewise(self, decoder, data):
+        messages = []
+        for i in range(len(data)):
+            messages += decoder.feed(data[i:i+1])
+        return messages
+
+    def check(self, messages):
+        self.assertEqual(len(messages), 3)
+        self.assertIsInstance(messages[0], jsonrpc.JSONCall)
+        self.assertEqual(messages[0].args, [42, 23])
+        self.assertIsInstance(messages[1], jsonrpc.JSONBatch)
+        self.assertEqual(len(messages[1]), 2)
+        self.assertIsInstance(messages[2], jsonrpc.JSONCallError)
+        self.assertEqual(messages[2].code, -32700)
+
+    def test_ndjson(self):
+        data = b''.join(stream.encode_frame(f) for f in [CALL, BATCH]) + b'\r\n\n{"broken\n'
+        self.check(stream.StreamDecoder().feed(data))
+        decoder = stream.StreamDecoder()
+        self.check(self.feed_bytewise(decoder, data))
+        self.assertEqual(decoder.pending, 0)
+        self.assertEqual(decoder.feed(CALL[:10]), [])
+        self.assertEqual(decoder.pending, 10)
+
+    def test_content_length(self):
+        frames = [CALL, BATCH, b'{"broken']
+        data = b''.join(stream.encode_frame(f, framing='content-length') for f in frames)
+        self.check(stream.StreamDecoder(framing='content-length').feed(data))
+        self.check(self.feed_bytewise(stream.StreamDecoder(framing='content-length'), data))
+        data = b'Content-Type: application/vscode-jsonrpc; charset=utf-8\r\ncontent-length: %d\r\n\r\n' % len(CALL) + CALL
+        self.assertEqual(stream.StreamDecoder(framing='content-length').feed_frames(data), [CALL])
+
+    def test_framing_errors(self):
+        with self.assertRaises(ValueError):
+            stream.StreamDecoder(framing='xml')
+        with self.assertRaises(ValueError):
+            stream.encode_frame(CALL, framing='xml')
+        with self.assertRaises(ValueError):
+            stream.StreamDecoder(framing='content-length').feed(b'Content-Type: x\r\n\r\n')
+        with self.assertRaises(ValueError):
+            stream.StreamDecoder(framing='content-length').feed(b'Content-Length: x\r\n\r\n')
+        with self.assertRaises(ValueError):
+            stream.StreamDecoder(framing='content-length').feed(b'X' * (stream.MAX_HEADER_SIZE + 1))
+
+    def test_max_frame_size(self):
+        decoder = stream.StreamDecoder(max_frame_size=len(CALL))
+        self.assertEqual(len(decoder.feed(CALL + b'\n')), 1)
+        with self.assertRaises(ValueError):
+            decoder.feed(CALL + b' ')
+        decoder = stream.StreamDecoder(framing='content-length', max_frame_size=len(CALL) - 1)
+        with self.assertRaises(ValueError):
+            decoder.feed(stream.encode_frame(CALL, framing='content-length'))
+
+    def test_large_frames(self):
+        payload = b'{"jsonrpc": "2.0", "method": "echo", "params": ["' + b'x' * 300000 + b'"], "id": 1}'
+        data = stream.encode_frame(payload) * 3
+        decoder = stream.StreamDecoder()
+        frames = []
+        for i in range(0, len(data), 4096):
+            frames += decoder.feed_frames(data[i:i+4096])
+        self.assertEqual(frames, [payload] * 3)
+        self.assertEqual(len(decoder._buffer), 0)
+
+    def test_compaction_mid_body(self):
+        payload = b'{"jsonrpc": "2.0", "method": "echo", "params": ["' + b'x' * 100000 + b'"], "id": 1}'
+        frame = stream.encode_frame(payload, framing='content-length')
+        decoder = stream.StreamDecoder(framing='content-length')
+        data = frame + frame
+        cut = len(frame) + 200
+        self.assertEqual(decoder.feed_frames(data[:cut]), [payload])
+        self.assertEqual(decoder.feed_frames(data[cut:]), [payload])
+
+
+class TestBatchReader(unittest.TestCase):
+    def read(self, data, size, **kwargs):
+        reader = stream.BatchReader(**kwargs)
+        items = []
+        for i in range(0, len(data), size):
+            items += reader.feed(data[i:i+size])
+        return reader, items + reader.close()
+
+    def test_chunked(self):
+        data = b' [' + CALL + b' , 5,{"jsonrpc": "2.0", "method": "a", "params": ["]}", {"b": [1.5e3]}]}]\n'
+        for size in [1, 2, 7, len(data)]:
+            reader, items = self.read(data, size)
+            self.assertTrue(reader.is_batch)
+            self.assertEqual(len(items), 3)
+            self.assertEqual(items[0].args, [42, 23])
+            self.assertEqual(items[1].code, -32600)
+            self.assertEqual(items[2].args, ["]}", {"b": [1500.0]}])
+
+    def test_elements_returned_when_complete(self):
+        reader = stream.BatchReader()
+        self.assertEqual(reader.feed(b'[' + CALL[:-1]), [])
+        self.assertEqual(len(reader.feed(b'}, 12')), 1)
+        # a number may go on in the next chunk
+        self.assertEqual(reader.feed(b'3'), [])
+        self.assertEqual(reader.feed(b']')[0].code, -32600)
+        self.assertEqual(reader.close(), [])
+
+    def test_single(self):
+        reader, items = self.read(CALL, 5)
+        self.assertFalse(reader.is_batch)
+        self.assertEqual(items[0].method, 'subtract')
+
+    def test_errors(self):
+        for data, code in [(b'[]', -32600), (b' ', -32700), (b'[1, ', -32700), (b'[1 2]', -32700), (b'[1] 2', -32700)]:
+            with self.assertRaises(jsonrpc.JSONCallError) as cm:
+                self.read(data, 1)
+            self.assertEqual(cm.exception.code, code)
+
+    def test_limits(self):
+        reader = stream.BatchReader(max_items=2)
+        self.assertEqual(len(reader.feed(b'[' + CALL + b', ' + CALL + b', ')), 2)
+        with self.assertRaises(jsonrpc.JSONCallError) as cm:
+            reader.feed(CALL)
+        self.assertEqual(cm.exception.code, -32600)
+        # the items before the limit are returned first
+        reader = stream.BatchReader(max_items=1)
+        self.assertEqual(len(reader.feed(b'[' + CALL + b', ' + CALL)), 1)
+        with self.assertRaises(jsonrpc.JSONCallError):
+            reader.close()
+        reader = stream.BatchReader(max_size=100)
+        reader.feed(b'[' + CALL)
+        with self.assertRaises(jsonrpc.JSONCallError) as cm:
+            reader.feed(b', ' + CALL)
+        self.assertEqual(cm.exception.code, -32600)
+
+    def test_buffer_bounded(self):
+        reader = stream.BatchReader(max_size=None)
+        count = 0
+        reader.feed(b'[')
+        for i in range(20000):
+            count += len(reader.feed(CALL + b', '))
+            self.assertLess(len(reader._buffer), 2 * stream._COMPACT_SIZE)
+        count += len(reader.feed(CALL + b']')) + len(reader.close())
+        self.assertEqual(count, 20001)
+
+    def test_large_batch(self):
+        # each byte is scanned about once, however the batch is chunked
+        data = b'[' + b', '.join([CALL] * 40000) + b']'
+        element = b'{"jsonrpc": "2.0", "method": "echo", "params": [' + b', '.join([br'"[\\\"{"'] * 200000) + b'], "id": 1}'
+        start = time.perf_counter()
+        reader, items = self.read(data, len(data), max_size=None)
+        self.assertEqual(len(items), 40000)
+        reader, items = self.read(b'[' + element + b']', 4096, max_size=None)
+        self.assertEqual(items[0].args[-1], '[\\"{')
+        self.assertLess(time.perf_counter() - start, 20)
+        # resumed within strings and escapes
+        reader, items = self.read(br'[{"method": "echo", "params": ["[\\\"{", "\\", "}"]}]', 1)
+        self.assertEqual(items[0].args, ['[\\"{', '\\', '}'])
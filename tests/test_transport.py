@@ -0,0 +1,205 @@
+import unittest
+import asyncio
+import os
+import socket
+import tempfile
+
+from jsonrpc import jsonrpc
+from jsonrpc import transport
+from jsonrpc.aio import AsyncDispatcher
+from jsonrpc.dispatcher import Dispatcher
+from jsonrpc.packing import MsgpackCodec
+
+
+def make_dispatcher(cls=AsyncDispatcher, **kwargs):
+    dispatcher = cls(**kwargs)
+    dispatcher.register(lambda a, b: a - b, name='subtract')
+
+    async def sleep(seconds, value):
+        await asyncio.sleep(seconds)
+        return value
+    if cls is AsyncDispatcher:
+        dispatcher.register(sleep)
+    return dispatcher
+
+
+class TestTransport(unittest.TestCase):
+    def run_async(self, coro):
+        return asyncio.run(asyncio.wait_for(coro, 10))
+
+    def test_tcp_pipelined(self):
+        async def main():
+            async with await transport.Server(make_dispatcher()).start() as server:
+                host, port = server.address[:2]
+                async with transport.Client(host, port, pool_size=2) as client:
+                    # answered out of order on the same connections
+                    results = await asyncio.gather(*[
+                        client.call('sleep', params=[0.001 * (i % 5), i]) for i in range(200)
+                    ])
+                    self.assertEqual(results, list(range(200)))
+                    self.assertEqual(len(client.connections), 2)
+                    with self.assertRaises(jsonrpc.JSONCallError) as cm:
+                        await client.call('missing')
+                    self.assertEqual(cm.exception.code, -32601)
+                    await client.notify('subtract', params=[1, 1])
+                    futures = await client.batch([('subtract', [3, 1]), ('subtract', [5, 1])])
+                    self.assertEqual(await asyncio.gather(*futures), [2, 4])
+        self.run_async(main())
+
+    def test_unix_and_reconnect(self):
+        path = os.path.join(tempfile.mkdtemp(), 'rpc.sock')
+        dispatcher = make_dispatcher(Dispatcher)
+
+        async def main():
+            server = await transport.Server(dispatcher).start(path=path)
+            client = transport.Client(path=path, connect_attempts=2, connect_delay=0.01)
+            self.assertEqual(await client.call('subtract', params=[42, 23]), 19)
+            server.close()
+            await server.wait_closed()
+            await asyncio.sleep(0.01)
+            self.assertTrue(client.connections[0].closed)
+            with self.assertRaises(OSError):
+                await client.call('subtract', params=[42, 23])
+            os.unlink(path)
+            server = await transport.Server(dispatcher).start(path=path)
+            self.assertEqual(await client.call('subtract', params=[42, 23]), 19)
+            await client.close()
+            server.close()
+            await server.wait_closed()
+        self.run_async(main())
+
+    def test_inherited_socket_and_content_length(self):
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        codec = MsgpackCodec()
+
+        async def main():
+            dispatcher = make_dispatcher(codec=codec)
+            with self.assertRaises(ValueError):
+                transport.Server(dispatcher)
+            server = await transport.Server(dispatcher, framing='content-length').start(sock=sock)
+            async with server:
+                client = transport.Client(*server.address, framing='content-length', codec=codec)
+                async with client:
+                    self.assertEqual(await client.call('sleep', params=[0, b'\n\x00']), b'\n\x00')
+        self.run_async(main())
+
+    def test_failing_dispatch(self):
+        class Failing(Dispatcher):
+            def dispatch(self, request):
+                if b'fail' in request:
+                    raise RuntimeError("broken")
+                return super().dispatch(request)
+
+        class AsyncFailing(AsyncDispatcher):
+            async def dispatch(self, request):
+                if b'fail' in request:
+                    raise RuntimeError("broken")
+                return await super().dispatch(request)
+
+        async def main(dispatcher):
+            async with await transport.Server(dispatcher).start() as server:
+                async with transport.Client(*server.address[:2]) as client:
+                    with self.assertLogs('jsonrpc.transport', 'ERROR'):
+                        with self.assertRaises(jsonrpc.JSONCallError) as cm:
+                            await client.call('fail')
+                        await client.notify('fail')
+                    self.assertEqual(cm.exception.code, -32603)
+                    # the connection is kept
+                    self.assertEqual(await client.call('subtract', params=[42, 23]), 19)
+                    self.assertEqual(len(client.connections), 1)
+        for dispatcher in [make_dispatcher(Failing), make_dispatcher(AsyncFailing)]:
+            with self.subTest(dispatcher):
+                self.run_async(main(dispatcher))
+
+    def test_pending_limit(self):
+        running = []
+        peak = []
+        dispatcher = make_dispatcher()
+
+        @dispatcher.register
+        async def track(value):
+            running.append(value)
+            peak.append(len(running))
+            await asyncio.sleep(0.001)
+            running.remove(value)
+            return value
+
+        async def main():
+            async with await transport.Server(dispatcher, max_pending=3).start() as server:
+                async with transport.Client(*server.address[:2], pool_size=1) as client:
+                    results = await asyncio.gather(*[client.call('track', params=[i]) for i in range(50)])
+                    self.assertEqual(results, list(range(50)))
+        self.run_async(main())
+        self.assertEqual(max(peak), 3)
+
+    def test_write_buffer_limit(self):
+        async def main():
+            ours, theirs = socket.socketpair()
+            reader, writer = await asyncio.open_connection(sock=ours)
+            writer.transport.set_write_buffer_limits(high=1024)
+            connection = transport.Connection(reader, writer)
+            # the peer reads nothing, so the first call fills the buffers
+            first = asyncio.ensure_future(connection.call('echo', params=['x' * 4 * 1024 * 1024]))
+            await asyncio.sleep(0.05)
+            second = asyncio.ensure_future(connection.call('echo', params=[1]))
+            await asyncio.sleep(0.05)
+            self.assertFalse(second.done())
+            # waiting to be sent
+            self.assertEqual(len(connection), 1)
+            theirs.setblocking(False)
+            loop = asyncio.get_running_loop()
+            while len(connection) < 2:
+                try:
+                    await loop.sock_recv(theirs, 1024 * 1024)
+                except BlockingIOError:
+                    pass
+            await connection.close()
+            for call in (first, second):
+                with self.assertRaises(ConnectionError):
+                    await call
+            theirs.close()
+        self.run_async(main())
+
+    def test_ping_cancelled(self):
+        async def silent(reader, writer):
+            while await reader.read(1024):
+                pass
+            writer.close()
+
+        async def main():
+            server = await asyncio.start_server(silent, '127.0.0.1', 0)
+            connection = await transport.Connection.open(*server.sockets[0].getsockname()[:2])
+            ping = asyncio.ensure_future(connection.ping())
+            await asyncio.sleep(0.01)
+            ping.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await ping
+            await connection.close()
+            server.close()
+            await server.wait_closed()
+        self.run_async(main())
+
+    def test_lost_connection_and_health_check(self):
+        async def silent(reader, writer):
+            # accepts requests and never answers
+            while await reader.read(1024):
+                pass
+            writer.close()
+
+        async def main():
+            server = await asyncio.start_server(silent, '127.0.0.1', 0)
+            client = transport.Client(*server.sockets[0].getsockname()[:2], health_interval=0.01, health_timeout=0.02)
+            connection = await client.connection()
+            self.assertFalse(await connection.ping(timeout=0.01))
+            await asyncio.sleep(0.1)
+            self.assertTrue(connection.closed)
+            pending = asyncio.ensure_future(client.call('subtract', params=[1, 1]))
+            await asyncio.sleep(0.01)
+            await client.connections[0].close()
+            with self.assertRaises(ConnectionError):
+                await pending
+            await client.close()
+            server.close()
+            await server.wait_closed()
+        self.run_async(main())
@@ -0,0 +1,111 @@
+import unittest
+import asyncio
+import json
+import sys
+from typing import Optional
+
+from jsonrpc import jsonrpc
+from jsonrpc import urls
+from jsonrpc.dispatcher import Dispatcher
+from jsonrpc.aio import AsyncDispatcher
+
+
+def subtract(minuend: int, subtrahend: int = 0):
+    return minuend - subtrahend
+
+
+def search(term, limit=10, exact: Optional[bool] = None, scale: float = 1):
+    return [term, limit, exact, scale]
+
+
+class TestUrlRouter(unittest.TestCase):
+    def setUp(self):
+        self.dispatcher = Dispatcher()
+        self.dispatcher.register(subtract)
+        self.dispatcher.register(search)
+        self.router = urls.UrlRouter(self.dispatcher)
+        self.router.add('/subtract').add('/api/search/{term}', 'search')
+
+    def test_compile_converters(self):
+        self.assertEqual(urls.compile_converters(subtract), {'minuend': int, 'subtrahend': int})
+        converters = urls.compile_converters(search)
+        self.assertEqual(sorted(converters), ['exact', 'limit', 'scale'])
+        self.assertIs(converters['exact']('Yes'), True)
+        with self.assertRaises(ValueError):
+            converters['exact']('maybe')
+
+    @unittest.skipIf(sys.version_info < (3, 10), "needs python 3.10+")
+    def test_union_operator(self):
+        def count(limit: int | None = None):
+            return limit
+        self.assertEqual(urls.compile_converters(count), {'limit': int})
+
+    def test_match(self):
+        self.assertEqual(self.router.match('/subtract'), ('subtract', {}))
+        self.assertEqual(self.router.match('/api/search/a%20b'), ('search', {'term': 'a b'}))
+        self.assertEqual(self.router.match('/api/search/a%2Fb'), ('search', {'term': 'a/b'}))
+        self.assertIsNone(self.router.match('/api/search/a/b'))
+        self.assertIsNone(self.router.match('/other'))
+
+    def test_call_from_url(self):
+        call = self.router.call_from_url('http://localhost/subtract?minuend=42&subtrahend=23&id=7')
+        self.assertEqual((call.method, call.kwargs, call._id), ('subtract', {'minuend': 42, 'subtrahend': 23}, '7'))
+        call = self.router.call_from_url('/api/search/books?limit=5&exact=0&scale=2.5&term=ignored')
+        self.assertEqual(call.kwargs, {'term': 'books', 'limit': 5, 'exact': False, 'scale': 2.5})
+        self.assertTrue(call.is_notification)
+        with self.assertRaises(jsonrpc.JSONCallError) as e:
+            self.router.call_from_url('/subtract?minuend=x&id=1')
+        self.assertEqual((e.exception.code, e.exception.data, e.exception._id), (-32602, "minuend: expected int", '1'))
+        with self.assertRaises(jsonrpc.JSONCallError) as e:
+            self.router.call_from_url('/missing?id=1')
+        self.assertEqual(e.exception.code, -32601)
+
+    def test_reregistered(self):
+        self.router.call_from_url('/subtract?minuend=1')
+        self.dispatcher.register(lambda minuend: minuend, name='subtract')
+        self.assertEqual(self.router.call_from_url('/subtract?minuend=1').kwargs, {'minuend': '1'})
+
+    def test_dispatch(self):
+        self.assertEqual(self.router.dispatch('/subtract?minuend=42&subtrahend=23&id=7'), b'{"jsonrpc": "2.0", "result": 19, "id": "7"}')
+        self.assertIsNone(self.router.dispatch('/subtract?minuend=42'))
+        response = json.loads(self.router.dispatch('/subtract?subtrahend=1&id=2'))
+        self.assertEqual(response['error']['code'], -32602)
+        response = json.loads(self.router.dispatch('/subtract?minuend=1.5&id=2'))
+        self.assertEqual(response['error'], {'code': -32602, 'message': "Invalid params", 'data': "minuend: expected int"})
+        for value in ['nan', 'inf', '-Infinity']:
+            with self.subTest(value=value):
+                response = json.loads(self.router.dispatch(f'/api/search/a?scale={value}&id=3'))
+                self.assertEqual(response['error']['data'], "scale: expected float")
+        # results that can't be encoded are answered with an error
+        self.dispatcher.register(lambda: {1, 2}, name='numbers')
+        self.router.add('/numbers')
+        self.assertEqual(json.loads(self.router.dispatch('/numbers?id=4'))['error']['code'], -32603)
+
+    def test_dispatch_async(self):
+        dispatcher = AsyncDispatcher()
+
+        @dispatcher.register
+        async def subtract(minuend: int, subtrahend: int = 0):
+            await asyncio.sleep(0)
+            return minuend - subtrahend
+        router = urls.UrlRouter(dispatcher).add('/subtract')
+        with self.assertRaises(TypeError):
+            router.dispatch('/subtract?minuend=42&id=7')
+
+        async def main():
+            return [
+                await router.dispatch_async('/subtract?minuend=42&subtrahend=23&id=7'),
+                await router.dispatch_async('/subtract?minuend=42'),
+                await router.dispatch_async('/subtract?minuend=x&id=8'),
+                # a sync dispatcher works too
+                await self.router.dispatch_async('/subtract?minuend=42&id=9'),
+            ]
+        ok, notification, error, sync = asyncio.run(main())
+        self.assertEqual(ok, b'{"jsonrpc": "2.0", "result": 19, "id": "7"}')
+        self.assertIsNone(notification)
+        self.assertEqual(json.loads(error)['error']['code'], -32602)
+        self.assertEqual(sync, b'{"jsonrpc": "2.0", "result": 42, "id": "9"}')
+
+
+if __name__ == '__main__':
+    unittest.main()